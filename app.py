@@ -45,18 +45,25 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# surveillance des fichiers de data/ : une seule par processus Streamlit
+@st.cache_resource
+def surveillance_sources():
+    return sr.surveiller_sources()
+
+surveillance_sources()
+
 # ========== SIDEBAR (sans logo) ==========
 st.sidebar.title("🏦 Modèle de notation souveraine")
 
 page = st.sidebar.radio(
     "📌 Navigation",
-    ["Accueil","Agences", "Analyse par pays", "Données", "Indicateurs dans le temps", "Tous les pays"]
+    ["Accueil","Agences", "Analyse par pays", "Données", "Indicateurs dans le temps", "Tous les pays", "Screener", "Quoi de neuf"]
 )
 
 # ========== CONTENU ==========
 with st.spinner("Chargement des données…"):
 
-    df = sr.countries10_Zscore()
+    df = sr.historique_Zscore()
     latest = df[df["Annee"] == df["Annee"].max()]
 
     # ========== PAGE ACCUEIL ==========
@@ -94,7 +101,10 @@ with st.spinner("Chargement des données…"):
     elif page == "Agences":
         st.header("📊 Comparaison avec les agences de notation")
         st.caption("Écart entre la notation du modèle et celles des principales agences.")
-        st.pyplot(sr.compare_agencies_ratings(), use_container_width=True)
+        st.image(sr.rendre(sr.compare_agencies_ratings).result(), use_container_width=True)
+        couverts = sr.notes_agences()["Moyenne_agences_num"].notna().sum()
+        st.caption(f"Seuls les {couverts} pays notés par au moins une agence dans "
+                   f"{sr.data_agences_path} sont comparés ; les autres n'ont pas de note d'agence.")
         st.caption("*Echelle de notation transposée allant de 1(meilleur) à 22(moins bon)"
                    "  \n Correspond à la note de notre modèle moins la moyenne des de notes de S&P, Moody's et Fitch")
 
@@ -106,52 +116,105 @@ with st.spinner("Chargement des données…"):
         with col_select:
             pays = st.selectbox("Choisir un pays :", latest["Pays"].unique())
 
+        # graphiques de la page lancés tout de suite dans le pool de rendu,
+        # dessinés en parallèle pendant le calcul du reste de la page
+        rendu_attribution = sr.rendre(sr.plot_attribution, pays)
+        rendu_radar = sr.rendre(sr.radar_country, pays, df)
+        rendu_imf = sr.rendre(sr.outlook_imf, pays)
+
         df_country = latest[latest["Pays"] == pays].iloc[0]
+        notes = sr.notes_pays(pays)
+        dates = sr.dates_notes_pays(pays)
+
+        def aide_note(agence):
+            if notes[agence] == "N/A":
+                return f"Pas de note {agence} pour ce pays dans {sr.data_agences_path}"
+            if dates[agence] is None:
+                return "Date de l'action de notation non renseignée"
+            return f"Action de notation du {dates[agence]}"
 
         col1, col2, col3 = st.columns(3)
         with col1:
             st.metric("Notation modèle", df_country["Rating_modele"])
-            st.metric("Note Moody", sr.data_agences["Moody"][sr.data_agences["Pays"].index(pays)])
+            st.metric("Note Moody", notes["Moody"], help=aide_note("Moody"))
         with col2:
             st.metric("Score de solvabilité", round(df_country["Score_solvabilite"], 2))
-            st.metric("Note Fitch", sr.data_agences["Fitch"][sr.data_agences["Pays"].index(pays)])
+            st.metric("Note Fitch", notes["Fitch"], help=aide_note("Fitch"))
 
         with col3:
             st.metric("Année", int(df_country["Annee"]))
-            st.metric("Note S&P", sr.data_agences["S&P"][sr.data_agences["Pays"].index(pays)])
-
+            st.metric("Note S&P", notes["S&P"], help=aide_note("S&P"))
+        if all(n == "N/A" for n in notes.values()):
+            st.info(f"Notes des agences non disponibles pour {pays} : "
+                    f"le pays n'est pas couvert par {sr.data_agences_path}.")
 
-        # Slopes + outlook + commentaire
-        slopes = sr.compute_slopes()
-        country_slopes = slopes[slopes["Pays"] == pays].iloc[0]
 
-        inputs = {**df_country.to_dict(), **country_slopes.to_dict()}
-        outlook = sr.compute_outlook(inputs)
-        comment = sr.make_comment(inputs)
+        # Outlook + commentaire
+        outlooks = sr.outlooks_pays()
+        outlook = outlooks[outlooks["Pays"] == pays]
+        comment = sr.make_comment(df_country)
 
         st.subheader("🧭 Outlook du modèle")
+        if not outlook.empty:
+            st.write(f"**{outlook['Outlook'].iloc[0]}** — {outlook['Regle_outlook'].iloc[0]}")
         st.write(comment)
         st.markdown('</div>', unsafe_allow_html=True)
 
+        with st.expander(f"🔮 Notation projetée ({sr.end_year + 1}–{sr.end_year + sr.horizon_prevision})"):
+            prev = sr.notes_prevues()
+            prev = prev[prev["Pays"] == pays][["Annee", "Score_solvabilite", "Rating_modele"]]
+            st.dataframe(prev, use_container_width=True, hide_index=True)
+            st.caption("Indicateurs projetés série par série (AR(1)), puis notés comme les années observées.")
+
+        with st.expander("🧮 Décomposition du score"):
+            st.image(rendu_attribution.result(), use_container_width=True)
+
+        st.subheader("👥 Pays comparables (Z-scores)")
+        pairs_col, analogues_col = st.columns(2)
+        try:
+            with pairs_col:
+                st.caption(f"Pays les plus proches en {sr.end_year}")
+                st.dataframe(sr.pays_comparables(pays), use_container_width=True, hide_index=True)
+            with analogues_col:
+                st.caption("Analogues historiques (autres pays, toutes années)")
+                st.dataframe(sr.analogues_historiques(pays), use_container_width=True, hide_index=True)
+        except ValueError as e:
+            st.info(str(e))
+
+        try:
+            cluster, membres = sr.pays_du_cluster(pays)
+            st.markdown(
+                f"**Groupe de risque {cluster}/{sr.n_clusters}** "
+                f"(1 = profil le plus solide) — autres membres : "
+                + (", ".join(membres["Pays"]) if not membres.empty else "aucun")
+            )
+            migrations = sr.migrations_clusters()
+            migrations = migrations[migrations["Pays"] == pays]
+            if not migrations.empty:
+                with st.expander("Changements de groupe"):
+                    st.dataframe(migrations, use_container_width=True, hide_index=True)
+        except ValueError as e:
+            st.info(str(e))
+
         radar_col, imf_col = st.columns([1.3, 1.7])
 
         with radar_col:
             st.subheader("Radar des facteurs")
-            st.pyplot(sr.radar_country(pays), use_container_width=True)
+            st.image(rendu_radar.result(), use_container_width=True)
 
         with imf_col:
             st.subheader("📈 Outlook IMF — séries historiques")
             try:
-                fig_dette, fig_epargne, fig_autres, score_imf, class_imf = sr.outlook_imf(pays)
+                fig_dette, fig_epargne, fig_autres, score_imf, class_imf = rendu_imf.result()
 
                 st.info(f"**Score Outlook IMF :** {score_imf:.3f} ({class_imf})")
 
                 if fig_dette is not None:
-                    st.pyplot(fig_dette, use_container_width=True)
+                    st.image(fig_dette, use_container_width=True)
                 if fig_epargne is not None:
-                    st.pyplot(fig_epargne, use_container_width=True)
+                    st.image(fig_epargne, use_container_width=True)
                 if fig_autres is not None:
-                    st.pyplot(fig_autres, use_container_width=True)
+                    st.image(fig_autres, use_container_width=True)
 
             except FileNotFoundError:
                 st.info("Fichier Outlook IMF introuvable (vérifie le chemin dans outlook_imf).")
@@ -166,8 +229,17 @@ with st.spinner("Chargement des données…"):
             sr.valid_indicators,
             key="selectbox_time_series",
         )
-        st.caption("Série historique pour l’ensemble des pays (ou selon le paramétrage de la fonction).")
-        st.pyplot(sr.time_series(ind), use_container_width=True)
+        col_pays, col_bandes = st.columns([3, 1])
+        with col_pays:
+            pays_ts = st.multiselect(
+                "Pays (vide = tous)",
+                sorted(df["Pays"].unique()),
+                key="multiselect_time_series",
+            )
+        with col_bandes:
+            bandes = st.checkbox("Médiane et quartiles", key="checkbox_time_series")
+        st.caption("Série historique pour l’ensemble des pays sélectionnés.")
+        st.image(sr.rendre(sr.time_series, ind, pays_ts or None, bandes=bandes).result(), use_container_width=True)
 
     # ========== PAGE DONNÉES ==========
     elif page == "Données":
@@ -189,7 +261,7 @@ with st.spinner("Chargement des données…"):
 
         with tab2:
             st.subheader("Historique complet 1984–2024")
-            df_all = sr.df_10countries()
+            df_all = sr.df_historique()
             st.dataframe(df_all, use_container_width=True, height=400)
             csv_all = df_all.to_csv(index=False).encode("utf-8")
             st.download_button(
@@ -232,11 +304,102 @@ with st.spinner("Chargement des données…"):
 
         #plot de la distribution des Z score
         st.subheader("📈 Distribution des scores de solvabilité")
-        st.pyplot(sr.plot_score_distribution(), use_container_width=True)
+        st.image(sr.rendre(sr.plot_score_distribution).result(), use_container_width=True)
 
         st.caption("Triés par score de solvabilité décroissant.")
         st.dataframe(df_all_model_sorted, use_container_width=True, height=500)
 
+        st.subheader("🧮 Attribution des scores")
+        st.caption("Contribution de chaque facteur (poids × Z-score) et des bonus structurels au score.")
+        st.dataframe(
+            sr.attribution_scores().sort_values("Score_solvabilite", ascending=False),
+            use_container_width=True,
+            height=500,
+            hide_index=True,
+        )
+
+        with st.expander("🧪 Notation factorielle (ACP)"):
+            st.caption(
+                f"Score alternatif : {sr.n_facteurs} facteurs latents extraits des Z-scores "
+                "(SVD randomisée), pondérés par leur part de variance, puis même échelle "
+                "de notation que le modèle. Écart > 0 : note factorielle plus basse."
+            )
+            facteurs = sr.notes_facteurs()
+            facteurs = facteurs[facteurs["Annee"] == sr.end_year]
+            st.dataframe(
+                facteurs[["Pays", "Rating_modele", "Rating_facteurs", "Ecart_crans", "Score_facteurs"]]
+                .sort_values("Score_facteurs", ascending=False),
+                use_container_width=True,
+                hide_index=True,
+            )
+            charges, variance = sr.charges_facteurs()
+            st.caption("Charges des indicateurs (part de variance : "
+                       + ", ".join(f"{f} {v:.0%}" for f, v in variance.items()) + ")")
+            st.dataframe(charges.round(2), use_container_width=True)
+
+    # ========== PAGE SCREENER ==========
+    elif page == "Screener":
+        st.header("🔎 Screener de pays")
+        st.caption(
+            "Conditions séparées par & (colonne, opérateur, seuil). "
+            "Rating_modele >= BBB- garde les notes BBB- ou meilleures ; Outlook accepte == et !=."
+        )
+
+        requete = st.text_input(
+            "Conditions",
+            "Dette_publique_PIB > 90 & Pente_Dette_publique_PIB_10a > 0 & Rating_modele >= BBB-",
+        )
+        col_periode, col_mode = st.columns([2, 1])
+        with col_periode:
+            debut, fin = st.slider(
+                "Période", sr.annee_debut_historique, sr.end_year, (2010, sr.end_year)
+            )
+        with col_mode:
+            mode = st.radio(
+                "Années vérifiant les conditions",
+                ["any", "all", "dernier"],
+                format_func={"any": "Au moins une", "all": "Toutes", "dernier": "Dernière"}.get,
+                horizontal=True,
+            )
+
+        try:
+            resultat = sr.screener(requete, debut, fin, mode)
+            st.write(f"**{len(resultat)} pays**")
+            st.dataframe(resultat, use_container_width=True, hide_index=True)
+        except ValueError as e:
+            st.info(str(e))
+
+        with st.expander("Colonnes disponibles"):
+            st.write(", ".join(sr.index_screener().colonnes()))
+
+    # ========== PAGE QUOI DE NEUF ==========
+    elif page == "Quoi de neuf":
+        st.header("🆕 Quoi de neuf depuis le dernier rafraîchissement")
+
+        # lecture seule : les vintages sont enregistrés par publier_cache
+        # (python script_rating.py) et par la surveillance des sources
+        vintages = sr.lister_vintages()["id"].tolist()
+        if vintages:
+            st.caption(f"Dernier vintage : {vintages[-1]} ({len(vintages)} enregistrés)")
+        if len(vintages) < 2:
+            st.info("Moins de deux vintages de données enregistrés : rien à comparer pour l’instant.")
+        else:
+            col_avant, col_apres = st.columns(2)
+            with col_avant:
+                avant = st.selectbox("Vintage de référence", vintages[:-1], index=len(vintages) - 2)
+            with col_apres:
+                apres = st.selectbox("Vintage comparé", vintages, index=len(vintages) - 1)
+
+            if avant >= apres:
+                st.info("Choisir un vintage de référence antérieur au vintage comparé.")
+            else:
+                st.subheader(f"📋 Notations {sr.end_year} modifiées")
+                st.dataframe(sr.changements_notes(avant, apres), use_container_width=True, hide_index=True)
+                st.caption("Facteur principal : terme du score dont la contribution (poids × Z-score) a le plus varié.")
+
+                st.subheader("🔍 Valeurs révisées")
+                st.dataframe(sr.diff_vintages(avant, apres), use_container_width=True, height=400, hide_index=True)
+
 # ========== PETIT FOOTER ==========
 st.markdown("---")
 st.caption("📌 Tout investissement présente un risque de perte partielle ou totale en capital. Sauf le monéro, le monéro c'est génial.")
\ No newline at end of file
@@ -0,0 +1,362 @@
+"""
+Benchmark de latence des pages de app.py, hors ligne.
+
+Chaque page (Accueil, Agences, Analyse par pays pour chaque pays, Données,
+Indicateurs dans le temps pour chaque indicateur, Tous les pays) est rendue
+sans navigateur avec streamlit.testing (AppTest). L'API Banque mondiale est
+remplacée par un serveur local qui rejoue des fixtures enregistrées, avec une
+latence et un taux d'erreur configurables.
+
+    python bench_pages.py --enregistrer              # fixtures depuis la vraie API
+    python bench_pages.py --ecrire-reference         # mesure + référence
+    python bench_pages.py --latence-ms 50 --taux-erreur 0.05
+
+Temps "froid" : processus neuf (caches mémoire et disque vidés), rendu de la
+page depuis le premier run. Temps "chaud" : médiane de rendus répétés de la
+même page. Code de sortie 1 si une page régresse par rapport à la référence.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import requests
+import streamlit.config
+import streamlit.logger
+from streamlit.testing.v1 import AppTest
+
+import script_rating as sr
+
+fixtures_dir = r"data/fixtures_wb"
+reference_path = r"data/bench_reference.json"
+pages = ["Accueil", "Agences", "Analyse par pays", "Données", "Indicateurs dans le temps", "Tous les pays",
+         "Screener", "Quoi de neuf"]
+
+
+# ===================== FIXTURES =====================
+
+def _chemin_fixture(dossier, indicateur):
+    return os.path.join(dossier, indicateur + ".json")
+
+def enregistrer_fixtures(dossier=fixtures_dir, url="https://api.worldbank.org/v2"):
+    """
+    Enregistre, pour chaque indicateur WDI/WGI, toutes les observations
+    nécessaires à l'application (historique long de tout l'univers, dont le
+    modèle réutilise start_year..end_year) : une liste [ISO3, année, valeur]
+    par indicateur.
+    """
+    os.makedirs(dossier, exist_ok=True)
+    session = requests.Session()
+    requetes = [(sr.pays_historique, sr.annee_debut_historique, sr.end_year)]
+    ancien_url, sr.wb_api_url = sr.wb_api_url, url
+    try:
+        for indicateur in list(sr.wdi_indicators) + list(sr.wgi_indicators):
+            vues = {}
+            for pays, debut, fin in requetes:
+                for entrees in sr._pages_wb(session, ";".join(pays), indicateur, debut, fin):
+                    for e in entrees:
+                        vues[(e.get("countryiso3code"), e.get("date"))] = e.get("value")
+            with open(_chemin_fixture(dossier, indicateur), "w", encoding="utf-8") as f:
+                json.dump({"indicateur": indicateur,
+                           "entrees": [[p, a, v] for (p, a), v in sorted(vues.items())]}, f)
+            print(f"{indicateur} : {len(vues)} observations")
+    finally:
+        sr.wb_api_url = ancien_url
+
+def fixtures_synthetiques(dossier=fixtures_dir, graine=0):
+    """
+    Fixtures déterministes (valeurs aléatoires) pour faire tourner le
+    benchmark sans enregistrement préalable. Les temps restent comparables
+    d'une exécution à l'autre, pas avec des données réelles.
+    """
+    os.makedirs(dossier, exist_ok=True)
+    pays = sr.pays_historique
+    for k, indicateur in enumerate(list(sr.wdi_indicators) + list(sr.wgi_indicators)):
+        rng = np.random.default_rng(graine + k)
+        niveaux = rng.normal(10, 5, len(pays))
+        entrees = [
+            [p, str(a), None if rng.random() < 0.08 else float(niveaux[i] + rng.normal(0, 2))]
+            for i, p in enumerate(pays) for a in range(sr.annee_debut_historique, sr.end_year + 1)
+        ]
+        with open(_chemin_fixture(dossier, indicateur), "w", encoding="utf-8") as f:
+            json.dump({"indicateur": indicateur, "entrees": entrees}, f)
+
+
+# ===================== SERVEUR DE REJEU =====================
+
+class ServeurRejeu:
+    """
+    Imite /v2/country/{pays;...}/indicator/{code}?date=a:b&per_page=n&page=k
+    à partir des fixtures. latence_ms est ajoutée à chaque requête ; une
+    fraction taux_erreur des requêtes reçoit une erreur 500.
+    """
+
+    def __init__(self, dossier=fixtures_dir, latence_ms=0, taux_erreur=0.0, graine=0):
+        self.dossier = dossier
+        self.latence = latence_ms / 1000
+        self.taux_erreur = taux_erreur
+        self.alea = random.Random(graine)
+        self.verrou = threading.Lock()
+        self.fixtures = {}
+        self.requetes = 0
+        self.erreurs = 0
+
+        serveur = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                statut, corps = serveur.repondre(self.path)
+                self.send_response(statut)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(corps)))
+                self.end_headers()
+                self.wfile.write(corps)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v2"
+
+    def _fixture(self, indicateur):
+        if indicateur not in self.fixtures:
+            chemin = _chemin_fixture(self.dossier, indicateur)
+            with open(chemin, encoding="utf-8") as f:
+                self.fixtures[indicateur] = json.load(f)["entrees"]
+        return self.fixtures[indicateur]
+
+    def repondre(self, chemin):
+        with self.verrou:
+            self.requetes += 1
+            erreur = self.alea.random() < self.taux_erreur
+            self.erreurs += erreur
+        if self.latence:
+            time.sleep(self.latence)
+        if erreur:
+            return 500, b'[{"message":[{"id":"500","key":"Erreur injectee"}]}]'
+
+        url = urlparse(chemin)
+        m = re.match(r"^/v2/country/([^/]+)/indicator/([^/]+)$", url.path)
+        if m is None:
+            return 404, b"[]"
+        pays = set(m.group(1).upper().split(";"))
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        debut, fin = (int(a) for a in q.get("date", "1960:2100").split(":"))
+        par_page, page = int(q.get("per_page", 50)), int(q.get("page", 1))
+
+        try:
+            entrees = self._fixture(m.group(2))
+        except FileNotFoundError:
+            return 200, json.dumps([{"message": [{"id": "120", "key": "Invalid value"}]}]).encode()
+
+        # ordre de l'API : pays, puis années décroissantes
+        choix = sorted(
+            (e for e in entrees if e[0] in pays and debut <= int(e[1]) <= fin),
+            key=lambda e: (e[0], -int(e[1])),
+        )
+        total = len(choix)
+        n_pages = max(1, -(-total // par_page))
+        morceau = choix[(page - 1) * par_page: page * par_page]
+        corps = [
+            {"page": page, "pages": n_pages, "per_page": par_page, "total": total},
+            [{"countryiso3code": p, "date": a, "value": v,
+              "indicator": {"id": m.group(2)}} for p, a, v in morceau],
+        ]
+        return 200, json.dumps(corps).encode()
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# ===================== MESURES =====================
+
+def _vider_caches():
+    """
+    État d'un processus neuf : caches mémoire des étapes, panel incrémental,
+    index (pairs, screener), mémos (empreintes, code source, vintages) et
+    snapshots disque. Les copies figées des sources (cache_dir/sources) sont
+    gardées : la surveillance démarrée par app.py (st.cache_resource) vit
+    autant que le processus et continue de servir ces versions.
+    """
+    with sr._cache_verrou:
+        sr._cache_memoire.clear()
+        sr._cache_verrous_cles.clear()
+    with sr._incremental_verrou:
+        sr._incremental.update(features=None, impact=None, zscore=None)
+    sr._index_pairs = sr.IndexPairs()
+    sr._index_screener = sr.IndexScreener()
+    sr._empreintes_fichiers.clear()
+    sr._source.cache_clear()
+    sr.charger_vintage.cache_clear()
+    if os.path.isdir(sr.cache_dir):
+        for nom in os.listdir(sr.cache_dir):
+            chemin = os.path.join(sr.cache_dir, nom)
+            if nom == "sources":
+                continue
+            if os.path.isdir(chemin):
+                shutil.rmtree(chemin, ignore_errors=True)
+            else:
+                os.remove(chemin)
+
+def _rendu(at, page, pays=None, indicateur=None):
+    """
+    Sélectionne la page (et le pays / l'indicateur) ; renvoie les exceptions levées.
+    """
+    at.sidebar.radio[0].set_value(page).run()
+    if pays is not None:
+        at.selectbox[0].set_value(pays).run()
+    if indicateur is not None:
+        at.selectbox(key="selectbox_time_series").set_value(indicateur).run()
+    return [str(e.value) for e in at.exception]
+
+def mesurer(cible, repetitions, timeout):
+    """
+    cible : (libellé, page, pays, indicateur). Renvoie froid, chaud, erreurs.
+    """
+    libelle, page, pays, indicateur = cible
+    _vider_caches()
+
+    t0 = time.perf_counter()
+    at = AppTest.from_file("app.py", default_timeout=timeout)
+    at.run()
+    erreurs = [str(e.value) for e in at.exception]
+    if page != "Accueil" and not erreurs:
+        erreurs = _rendu(at, page, pays, indicateur)
+    froid = time.perf_counter() - t0
+
+    chauds = []
+    for _ in range(repetitions):
+        t0 = time.perf_counter()
+        at.run()
+        chauds.append(time.perf_counter() - t0)
+        erreurs += [str(e.value) for e in at.exception]
+    return froid, statistics.median(chauds), sorted(set(erreurs))
+
+def cibles(pays=None, indicateurs=None, timeout=120):
+    """
+    Toutes les pages, avec un rendu par pays et par indicateur.
+    """
+    if pays is None:
+        at = AppTest.from_file("app.py", default_timeout=timeout)
+        at.run()
+        at.sidebar.radio[0].set_value("Analyse par pays").run()
+        pays = list(at.selectbox[0].options) if at.selectbox else []
+    if indicateurs is None:
+        indicateurs = list(sr.valid_indicators)
+
+    res = []
+    for page in pages:
+        if page == "Analyse par pays":
+            res += [(f"{page} [{p}]", page, p, None) for p in pays]
+        elif page == "Indicateurs dans le temps":
+            res += [(f"{page} [{i}]", page, None, i) for i in indicateurs]
+        else:
+            res.append((page, page, None, None))
+    return res
+
+
+# ===================== RÉFÉRENCE & RAPPORT =====================
+
+def comparer(resultats, reference, tolerance, marge):
+    """
+    Pages dont le temps froid ou chaud dépasse reference × (1 + tolerance) + marge.
+    """
+    regressions = []
+    for libelle, mesure in resultats.items():
+        ref = reference.get(libelle)
+        if ref is None:
+            continue
+        for cle in ("froid", "chaud"):
+            if mesure[cle] > ref[cle] * (1 + tolerance) + marge:
+                regressions.append((libelle, cle, ref[cle], mesure[cle]))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de latence des pages Streamlit (hors ligne)")
+    parser.add_argument("--fixtures", default=fixtures_dir)
+    parser.add_argument("--enregistrer", action="store_true",
+                        help="enregistre les fixtures depuis l'API Banque mondiale puis quitte")
+    parser.add_argument("--synthetique", action="store_true",
+                        help="génère des fixtures synthétiques si aucune n'est enregistrée")
+    parser.add_argument("--latence-ms", type=float, default=0)
+    parser.add_argument("--taux-erreur", type=float, default=0.0)
+    parser.add_argument("--graine", type=int, default=0)
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--pays", nargs="*", help="pays de la page Analyse par pays (défaut : tous)")
+    parser.add_argument("--indicateurs", nargs="*", help="indicateurs (défaut : valid_indicators)")
+    parser.add_argument("--reference", default=reference_path)
+    parser.add_argument("--ecrire-reference", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="dégradation relative tolérée avant échec (0.25 = +25 %%)")
+    parser.add_argument("--marge", type=float, default=0.05,
+                        help="dégradation absolue toujours tolérée, en secondes")
+    args = parser.parse_args()
+    streamlit.config.set_option("logger.level", "error")
+    streamlit.logger.set_log_level("error")
+
+    if args.enregistrer:
+        enregistrer_fixtures(args.fixtures)
+        return 0
+    if not os.path.isdir(args.fixtures):
+        if not args.synthetique:
+            sys.exit(f"Pas de fixtures dans {args.fixtures} : --enregistrer ou --synthetique")
+        fixtures_synthetiques(args.fixtures, args.graine)
+
+    cache_tmp = tempfile.mkdtemp(prefix="bench_cache_")
+    ancien_cache, ancien_url, ancienne_attente = sr.cache_dir, sr.wb_api_url, sr.wb_attente
+    resultats = {}
+    try:
+        with ServeurRejeu(args.fixtures, args.latence_ms, args.taux_erreur, args.graine) as serveur:
+            # erreurs injectées : les nouveaux essais sont mesurés, pas les
+            # pauses entre essais (wb_attente), qui masqueraient le calcul
+            sr.cache_dir, sr.wb_api_url, sr.wb_attente = cache_tmp, serveur.url, 0.0
+            for cible in cibles(args.pays, args.indicateurs, args.timeout):
+                froid, chaud, erreurs = mesurer(cible, args.repetitions, args.timeout)
+                resultats[cible[0]] = {"froid": froid, "chaud": chaud, "erreurs": erreurs}
+                print(f"{cible[0]:<55} froid {froid:7.3f} s   chaud {chaud:7.3f} s"
+                      + (f"   ERREUR {erreurs[0][:60]}" if erreurs else ""), flush=True)
+            print(f"\nServeur de rejeu : {serveur.requetes} requêtes, {serveur.erreurs} erreurs injectées")
+    finally:
+        sr.cache_dir, sr.wb_api_url, sr.wb_attente = ancien_cache, ancien_url, ancienne_attente
+        shutil.rmtree(cache_tmp, ignore_errors=True)
+
+    code = 0
+    if any(r["erreurs"] for r in resultats.values()) and not args.taux_erreur:
+        print("Des pages ont levé une exception.")
+        code = 1
+
+    if args.ecrire_reference:
+        with open(args.reference, "w", encoding="utf-8") as f:
+            json.dump({k: {"froid": v["froid"], "chaud": v["chaud"]} for k, v in resultats.items()},
+                      f, indent=2, ensure_ascii=False)
+        print(f"Référence écrite : {args.reference}")
+    elif os.path.exists(args.reference):
+        with open(args.reference, encoding="utf-8") as f:
+            reference = json.load(f)
+        regressions = comparer(resultats, reference, args.tolerance, args.marge)
+        for libelle, cle, ref, mesure in regressions:
+            print(f"RÉGRESSION {libelle} ({cle}) : {ref:.3f} s → {mesure:.3f} s")
+        if regressions:
+            code = 1
+        else:
+            print(f"Aucune régression (tolérance {args.tolerance:.0%} + {args.marge:.2f} s)")
+    return code
+
+if __name__ == "__main__":
+    sys.exit(main())
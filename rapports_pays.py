@@ -0,0 +1,225 @@
+"""
+Génération en lot des fiches pays (HTML autonome, PDF en option).
+
+Chaque fiche reprend le contenu de la page "Analyse par pays" : métriques,
+notes des agences, outlook et commentaire du modèle, radar des facteurs,
+décomposition du score, graphiques Outlook IMF et séries historiques.
+
+Les fiches sont rendues par un pool de processus. Les données sont calculées
+une seule fois par le processus principal (cache disque de script_rating),
+puis chaque processus les recharge au démarrage depuis les snapshots Arrow
+mappés en mémoire : aucun calcul n'est refait par fiche.
+
+    python rapports_pays.py                     # tout l'univers, HTML
+    python rapports_pays.py --pdf --processus 8
+    python rapports_pays.py --pays FRA,DEU,MAR
+"""
+import argparse
+import base64
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+import script_rating as sr
+
+rapports_dir = r"data/rapports"
+indicateurs_rapport = ["Dette_publique_PIB", "Croissance_PIB", "Inflation", "PIB_par_habitant"]
+dpi_rapport = 100
+
+
+# ===================== DONNÉES PARTAGÉES =====================
+
+_donnees = {}
+
+def _precharger():
+    """
+    Calcule (ou recharge depuis le cache disque) tout ce dont une fiche a besoin.
+    """
+    df_model = sr.compute_Zscore()
+    _donnees["df_model"] = df_model
+    _donnees["latest"] = df_model.set_index("Pays", drop=False)
+    _donnees["outlooks"] = sr.outlooks_pays().set_index("Pays")
+    sr.attribution_scores()
+    sr.notes_agences()
+    for ind in indicateurs_rapport:
+        sr.panel_indicateur(ind)
+    try:
+        sr.outlook_imf_scores()
+        _donnees["imf"] = True
+    except FileNotFoundError:
+        _donnees["imf"] = False
+
+
+# ===================== RENDU D'UNE FICHE =====================
+
+def _png(fig):
+    return base64.b64encode(sr.figure_png(fig, dpi_rapport)).decode("ascii")
+
+def _figures_pays(pays):
+    """
+    Figures de la fiche : liste de (titre, figure). Les graphiques sans
+    données pour ce pays sont omis.
+    """
+    figures = [
+        ("Radar des facteurs", sr.radar_country(pays, _donnees["df_model"])),
+        ("Décomposition du score", sr.plot_attribution(pays)),
+    ]
+    if _donnees["imf"]:
+        try:
+            fig_dette, fig_epargne, fig_autres, _, _ = sr.outlook_imf(pays)
+            figures += [(t, f) for t, f in [
+                ("Outlook IMF — dette publique", fig_dette),
+                ("Outlook IMF — épargne nationale", fig_epargne),
+                ("Outlook IMF — autres indicateurs", fig_autres),
+            ] if f is not None]
+        except ValueError:
+            pass
+    for ind in indicateurs_rapport:
+        try:
+            figures.append((f"Série historique — {ind}", sr.time_series(ind, [pays])))
+        except ValueError:
+            pass
+    return figures
+
+def _metriques_pays(pays):
+    row = _donnees["latest"].loc[pays]
+    metriques = {
+        "Pays": sr.iso3_to_name.get(pays, pays),
+        "Année": int(row["Annee"]),
+        "Notation modèle": row["Rating_modele"],
+        "Score de solvabilité": round(float(row["Score_solvabilite"]), 2),
+    }
+    metriques.update({f"Note {a}": n for a, n in sr.notes_pays(pays).items()})
+    if pays in _donnees["outlooks"].index:
+        o = _donnees["outlooks"].loc[pays]
+        metriques["Outlook modèle"] = f"{o['Outlook']} — {o['Regle_outlook']}"
+    if _donnees["imf"]:
+        scores = sr.outlook_imf_scores().set_index("CountryCode")
+        if pays in scores.index:
+            metriques["Outlook IMF"] = (f"{scores.at[pays, 'Score_outlook_imf']:.3f} "
+                                        f"({scores.at[pays, 'Outlook_imf']})")
+    return metriques, sr.make_comment(row)
+
+def _html_pays(pays, metriques, commentaire, images):
+    lignes = "".join(
+        f"<tr><th>{html.escape(str(k))}</th><td>{html.escape(str(v))}</td></tr>"
+        for k, v in metriques.items()
+    )
+    figures = "".join(
+        f'<h2>{html.escape(t)}</h2><img src="data:image/png;base64,{img}" alt="{html.escape(t)}">'
+        for t, img in images
+    )
+    return f"""<!DOCTYPE html>
+<html lang="fr"><head><meta charset="utf-8">
+<title>Fiche pays — {html.escape(pays)}</title>
+<style>
+body {{ font-family: sans-serif; max-width: 1100px; margin: 2rem auto; color: #0f172a; }}
+table {{ border-collapse: collapse; margin-bottom: 1rem; }}
+th, td {{ text-align: left; padding: 0.3rem 0.8rem; border-bottom: 1px solid #e5e7eb; }}
+img {{ max-width: 100%; }}
+.commentaire {{ background: #f1f5f9; padding: 0.8rem 1rem; border-radius: 0.5rem; }}
+</style></head><body>
+<h1>🏦 {html.escape(str(metriques["Pays"]))} ({html.escape(pays)})</h1>
+<table>{lignes}</table>
+<p class="commentaire">{html.escape(commentaire)}</p>
+{figures}
+<p><small>Généré le {time.strftime("%Y-%m-%d %H:%M")} par le modèle de notation souveraine.</small></p>
+</body></html>
+"""
+
+def _page_texte(pays, metriques, commentaire):
+    fig = Figure(figsize=(8.27, 11.69))
+    texte = "\n".join(f"{k} : {v}" for k, v in metriques.items())
+    fig.text(0.08, 0.95, f"Fiche pays — {pays}", fontsize=16, weight="bold", va="top")
+    fig.text(0.08, 0.90, texte, fontsize=10, va="top", linespacing=1.6)
+    fig.text(0.08, 0.45, commentaire, fontsize=10, va="top", wrap=True)
+    return fig
+
+def rapport_pays(pays, dossier=rapports_dir, pdf=False):
+    """
+    Écrit la fiche de `pays` (<dossier>/<ISO3>.html, et .pdf si demandé)
+    et renvoie le chemin du HTML. Les données doivent être préchargées.
+    """
+    if not _donnees:
+        _precharger()
+    if pays not in _donnees["latest"].index:
+        raise ValueError(f"Aucune notation pour {pays}")
+
+    metriques, commentaire = _metriques_pays(pays)
+    figures = _figures_pays(pays)
+    images = [(t, _png(f)) for t, f in figures]
+    if pdf:
+        with PdfPages(os.path.join(dossier, f"{pays}.pdf")) as doc:
+            doc.savefig(_page_texte(pays, metriques, commentaire))
+            for _, f in figures:
+                doc.savefig(f)
+
+    chemin = os.path.join(dossier, f"{pays}.html")
+    with open(chemin, "w", encoding="utf-8") as f:
+        f.write(_html_pays(pays, metriques, commentaire, images))
+    return chemin
+
+
+# ===================== LOT =====================
+
+def _index_html(chemins):
+    lignes = "".join(
+        f'<li><a href="{html.escape(os.path.basename(c))}">'
+        f'{html.escape(sr.iso3_to_name.get(p, p))} ({p})</a></li>'
+        for p, c in sorted(chemins.items())
+    )
+    return (f'<!DOCTYPE html><html lang="fr"><head><meta charset="utf-8">'
+            f'<title>Fiches pays</title></head><body><h1>Fiches pays ({len(chemins)})</h1>'
+            f'<ul>{lignes}</ul></body></html>\n')
+
+def generer_rapports(pays=None, dossier=rapports_dir, pdf=False, processus=None):
+    """
+    Génère les fiches de `pays` (tout l'univers noté par défaut) sur un pool de
+    `processus` processus (nombre de cœurs par défaut), plus un index.html.
+    Renvoie ({pays: chemin}, {pays: erreur}). Une fiche en échec (y compris un
+    processus du pool mort, BrokenProcessPool) est notée dans les erreurs sans
+    arrêter le lot ; l'index des fiches écrites est toujours produit.
+    """
+    os.makedirs(dossier, exist_ok=True)
+    _precharger()
+    if pays is None:
+        pays = sorted(_donnees["latest"].index)
+
+    chemins, erreurs = {}, {}
+    try:
+        with ProcessPoolExecutor(max_workers=processus, initializer=_precharger) as pool:
+            taches = {pool.submit(rapport_pays, p, dossier, pdf): p for p in pays}
+            for tache in as_completed(taches):
+                p = taches[tache]
+                try:
+                    chemins[p] = tache.result()
+                except ValueError as e:
+                    erreurs[p] = str(e)
+                except Exception as e:
+                    erreurs[p] = f"{type(e).__name__} : {e}"
+    finally:
+        with open(os.path.join(dossier, "index.html"), "w", encoding="utf-8") as f:
+            f.write(_index_html(chemins))
+    return chemins, erreurs
+
+def main():
+    parser = argparse.ArgumentParser(description="Génération en lot des fiches pays")
+    parser.add_argument("--pays", default=None, help="codes ISO3 séparés par des virgules (défaut : tout l'univers)")
+    parser.add_argument("--dossier", default=rapports_dir)
+    parser.add_argument("--pdf", action="store_true", help="écrit aussi une fiche PDF par pays")
+    parser.add_argument("--processus", type=int, default=None, help="taille du pool (défaut : nombre de cœurs)")
+    args = parser.parse_args()
+
+    pays = [p.strip().upper() for p in args.pays.split(",") if p.strip()] if args.pays else None
+    debut = time.time()
+    chemins, erreurs = generer_rapports(pays, args.dossier, args.pdf, args.processus)
+    print(f"{len(chemins)} fiches écrites dans {args.dossier} en {time.time() - debut:.1f} s")
+    for p, e in sorted(erreurs.items()):
+        print(f"  {p} : {e}")
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,40 @@
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.compute as pc
+import re
 import requests
 import unicodedata
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import os
+import io
+import csv
+import json
+import zipfile
+import time
+import hashlib
+import shutil
+import inspect
+import threading
+import warnings
+from collections import OrderedDict
 from sklearn.preprocessing import StandardScaler
+from sklearn.neighbors import BallTree
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.utils.extmath import randomized_svd
 from tqdm import tqdm
-from functools import reduce
-import streamlit as st
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from functools import reduce, lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
 # ===================== PARAMÈTRES =====================
 
 data_path = r"data/data.csv"
 data_imf_path = r"data/outlook_datas.xlsx"
+cache_dir = os.environ.get("RATING_CACHE_DIR", r"data/cache")
 start_year = 2019
 end_year   = 2024
 years = [str(y) for y in range(start_year, end_year+1)]
@@ -45,13 +67,70 @@ mapping_imf_to_iso = {
     "cuba": "CUB","haiti": "HTI","jamaica": "JAM","papua new guinea": "PNG"
 }
 
-#Notes agences
-data_agences = {
-        "Pays":      ["USA","DEU","FRA","JPN","CAN","IND","BRA","ZAF","IDN","MAR"],
-        "Moody":     ["Aa1","Aaa","Aa3","A1","Aaa","Baa3","Ba1","Ba2","Baa2","Ba1"],
-        "Fitch":     ["AA+","AAA","A+","A","AA+","BBB-","BB","BB-","BBB","BB+"],
-        "S&P":       ["AA+","AAA","A+","A+","AAA","BBB","BB","BB","BBB","BBB-"]
-    }
+#Notes agences : une ligne par action de notation (Pays, Agence, Note, Date).
+# Date peut rester vide quand la date de l'action n'est pas connue (notes 2024
+# reprises de l'ancienne liste en dur) ; un pays absent du fichier n'est pas noté.
+data_agences_path = r"data/notes_agences.csv"
+agences = ["Moody", "Fitch", "S&P"]
+
+# ===================== ÉCHELLE DE NOTATION =====================
+
+# 22 crans, du meilleur (1) au pire (22). Moody's n'a pas de cran "D".
+echelle_notes = [
+    "AAA", "AA+", "AA", "AA-", "A+", "A", "A-",
+    "BBB+", "BBB", "BBB-", "BB+", "BB", "BB-", "B+", "B", "B-",
+    "CCC+", "CCC", "CCC-", "CC", "C", "D"
+]
+echelle_moody = [
+    "Aaa", "Aa1", "Aa2", "Aa3", "A1", "A2", "A3",
+    "Baa1", "Baa2", "Baa3", "Ba1", "Ba2", "Ba3", "B1", "B2", "B3",
+    "Caa1", "Caa2", "Caa3", "Ca", "C"
+]
+
+# Catégorie ordonnée du pire au meilleur : note >= "BBB-" ⇔ investment grade
+notes_dtype = pd.CategoricalDtype(echelle_notes[::-1], ordered=True)
+
+# conversion de notation texte en score numérique
+rating_to_num = {
+    **{m: i + 1 for i, m in enumerate(echelle_moody)},
+    **{n: i + 1 for i, n in enumerate(echelle_notes)},
+}
+
+# Table de codage vectorisé : libellés connus → cran numérique
+_libelles_notes = pd.Index(list(rating_to_num))
+_crans_notes = np.array(list(rating_to_num.values()), dtype=float)
+
+def notes_en_num(notes):
+    """
+    Notes S&P/Fitch ou Moody's (Series, Categorical, liste) → crans 1 (AAA) à 22 (D).
+    Libellé inconnu ou manquant → NaN.
+    """
+    codes = _libelles_notes.get_indexer(pd.Index(np.asarray(notes, dtype=object)))
+    crans = np.where(codes >= 0, _crans_notes[codes], np.nan)
+    if isinstance(notes, pd.Series):
+        return pd.Series(crans, index=notes.index, name=notes.name)
+    return crans
+
+def num_en_notes(crans):
+    """
+    Crans numériques → notes S&P/Fitch (Categorical ordonné), arrondi au cran le plus proche.
+    """
+    crans = np.asarray(crans, dtype=float)
+    valides = ~np.isnan(crans)
+    idx = np.clip(np.rint(np.where(valides, crans, 1)).astype(int), 1, len(echelle_notes)) - 1
+    libelles = np.where(valides, np.array(echelle_notes, dtype=object)[idx], None)
+    return pd.Categorical(libelles, dtype=notes_dtype)
+
+def pct_en_notes(pct, echelle):
+    """
+    Binning vectorisé percentile → note selon `echelle` [(seuil, note), ...] triée
+    par seuil décroissant : note du premier seuil <= percentile, "CCC-" sinon.
+    """
+    pct = np.asarray(pct, dtype=float)
+    seuils = np.array([s for s, _ in echelle][::-1])
+    libelles = np.array(["CCC-"] + [n for _, n in echelle][::-1], dtype=object)
+    idx = np.searchsorted(seuils, np.nan_to_num(pct, nan=-np.inf), side="right")
+    return pd.Categorical(libelles[idx], dtype=notes_dtype)
 
 # Fonction nettoyage noms IMF
 def clean_imf_country(x):
@@ -61,24 +140,370 @@ def clean_imf_country(x):
     x = unicodedata.normalize("NFKD", x).encode("ascii", "ignore").decode("ascii")
     return mapping_imf_to_iso.get(x)
 
+# ===================== CACHE DES ÉTAPES =====================
+
+# Chaque étape du pipeline (ingestion → features → zscore → notation) est mise
+# en cache sous une clé calculée à partir de ses entrées réelles : empreinte du
+# contenu des fichiers sources, paramètres, code des fonctions de l'étape et clé
+# de l'étape précédente. Modifier les poids ne relance donc pas l'ingestion,
+# et modifier data.csv n'invalide que ce qui en dépend.
+#
+# Les DataFrames sont publiés dans cache_dir en Arrow IPC et relus par mmap :
+# plusieurs processus Streamlit pointant sur le même répertoire
+# (RATING_CACHE_DIR) partagent les mêmes pages en RAM, et une étape n'est
+# construite qu'une fois pour tous. `python script_rating.py` pré-publie tout.
+#
+# Chaque publication (publier_cache) retire ensuite de cache_dir les snapshots
+# plus vieux que cache_duree_max, puis les plus anciens tant que le répertoire
+# dépasse cache_taille_max ; les clés qu'elle vient de publier sont conservées.
+
+_cache_memoire = OrderedDict()
+_cache_memoire_max = 32
+cache_verrou_expiration = 600
+cache_taille_max = 2 * 1024 ** 3      # octets
+cache_duree_max = 7 * 24 * 3600       # secondes
+_cache_verrou = threading.RLock()
+_cache_verrous_cles = {}              # clé → [verrou, nombre d'appels en cours]
+_cache_collecte = threading.local()   # clés servies pendant publier_cache
+_empreintes_fichiers = {}
+# Sources surveillées (surveiller_sources) : empreinte servie aux lecteurs
+# tant que la reconstruction de la nouvelle version n'est pas terminée. Chaque
+# version publiée est figée dans cache_dir/sources/<empreinte>/ : une étape
+# construite sous cette empreinte lit cette copie, jamais le fichier en cours
+# de remplacement.
+_empreintes_publiees = {}
+_empreintes_reconstruction = threading.local()
+
+def source_figee(path):
+    """
+    (empreinte, chemin à lire) d'un fichier source, l'empreinte entrant dans les
+    clés d'étapes : celle de la version publiée si le fichier est surveillé,
+    sinon celle du contenu actuel. Pour un fichier surveillé,
+    le chemin est la copie figée de la version publiée (ou en reconstruction) :
+    l'étape lit exactement les octets dont l'empreinte entre dans sa clé.
+    """
+    chemin = os.path.abspath(path)
+    forcees = getattr(_empreintes_reconstruction, "forcees", {})
+    empreinte = forcees.get(chemin) or _empreintes_publiees.get(chemin)
+    if empreinte is None:
+        return _hash_fichier(path), path
+    return empreinte, _chemin_fige(chemin, empreinte)
+
+def _chemin_fige(chemin, empreinte):
+    return os.path.join(cache_dir, "sources", empreinte, os.path.basename(chemin))
+
+def _figer_source(chemin):
+    """
+    Copie figée du contenu actuel de `chemin` ; renvoie son empreinte. La copie
+    est hachée après écriture : un fichier modifié pendant la copie donne
+    l'empreinte de ce qui a effectivement été copié.
+    """
+    empreinte = _hash_fichier(chemin)
+    if os.path.exists(_chemin_fige(chemin, empreinte)):
+        return empreinte
+    os.makedirs(os.path.join(cache_dir, "sources"), exist_ok=True)
+    tmp = os.path.join(cache_dir, "sources", f"{os.path.basename(chemin)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    shutil.copyfile(chemin, tmp)
+    empreinte = _hash_fichier(tmp)
+    cible = _chemin_fige(chemin, empreinte)
+    os.makedirs(os.path.dirname(cible), exist_ok=True)
+    os.replace(tmp, cible)
+    return empreinte
+
+def _retirer_sources_figees(chemin, garder):
+    """
+    Supprime les copies figées de `chemin` dont l'empreinte n'est pas dans `garder`.
+    """
+    dossier = os.path.join(cache_dir, "sources")
+    if not os.path.isdir(dossier):
+        return
+    for empreinte in os.listdir(dossier):
+        copie = _chemin_fige(chemin, empreinte)
+        if empreinte not in garder and os.path.exists(copie):
+            _supprimer(copie)
+            try:
+                os.rmdir(os.path.dirname(copie))
+            except OSError:
+                pass
+
+def _hash_fichier(path):
+    """
+    sha256 du contenu d'un fichier, mémorisé tant que (taille, mtime) ne change pas.
+    """
+    stat = os.stat(path)
+    cle = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if cle not in _empreintes_fichiers:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for bloc in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloc)
+        _empreintes_fichiers[cle] = h.hexdigest()
+    return _empreintes_fichiers[cle]
+
+def _empreinte(*parts):
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(repr(p).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:24]
+
+@lru_cache(maxsize=None)
+def _source(fonction):
+    return inspect.getsource(fonction)
+
+def version_code(*fonctions):
+    """
+    Empreinte du code source des fonctions d'une étape.
+    """
+    return _empreinte(*[_source(f) for f in fonctions])
+
+def _ecrire_arrow(df, chemin):
+    """
+    DataFrame → fichier Arrow IPC non compressé. Les colonnes float sont
+    écrites sans bitmap de nulls (NaN conservés) pour être relues sans copie.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    for i, nom in enumerate(table.column_names):
+        if nom in df.columns and df[nom].dtype.kind == "f":
+            table = table.set_column(i, table.field(i), pa.array(df[nom].to_numpy()))
+    with pa.OSFile(chemin, "wb") as f, pa.ipc.new_file(f, table.schema) as w:
+        w.write_table(table)
+
+def _lire_arrow(chemin):
+    """
+    Fichier Arrow IPC → DataFrame adossé au fichier mappé en mémoire : les
+    colonnes numériques sont des vues en lecture seule, partagées via le cache
+    de pages entre tous les processus qui lisent le même snapshot.
+    """
+    table = pa.ipc.open_file(pa.memory_map(chemin, "r")).read_all()
+    return table.to_pandas(split_blocks=True)
+
+class _VerrouConstruction:
+    """
+    Verrou inter-processus (fichier créé en O_EXCL) : un seul processus
+    construit une étape donnée, les autres attendent puis lisent son snapshot.
+    Un verrou plus vieux que `cache_verrou_expiration` est considéré abandonné.
+    """
+
+    def __init__(self, chemin):
+        self.chemin = chemin + ".lock"
+
+    def __enter__(self):
+        while True:
+            try:
+                fd = os.open(self.chemin, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.chemin) > cache_verrou_expiration:
+                        os.remove(self.chemin)
+                except FileNotFoundError:
+                    pass
+                time.sleep(0.1)
+                continue
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            return self
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.chemin)
+        except FileNotFoundError:
+            pass
+
+def _chercher_snapshot(base):
+    for ext, lire in ((".arrow", _lire_arrow), (".pkl", pd.read_pickle)):
+        if os.path.exists(base + ext):
+            return True, lire(base + ext)
+    return False, None
+
+def _publier_snapshot(base, resultat):
+    """
+    Écrit le résultat sous un nom temporaire puis le publie par os.replace :
+    un lecteur voit soit l'ancien état (fichier absent), soit le fichier complet.
+    Un DataFrame est relu depuis le snapshot, comme dans les autres processus.
+    """
+    if isinstance(resultat, pd.DataFrame):
+        chemin, ecrire = base + ".arrow", _ecrire_arrow
+    else:
+        chemin, ecrire = base + ".pkl", pd.to_pickle
+    tmp = f"{chemin}.{os.getpid()}.tmp"
+    ecrire(resultat, tmp)
+    os.replace(tmp, chemin)
+    return _lire_arrow(chemin) if isinstance(resultat, pd.DataFrame) else resultat
+
+def stage(nom, entrees, construire):
+    """
+    Renvoie (cle, resultat) pour l'étape `nom`.
+
+    `entrees` est la liste des éléments qui déterminent le résultat (clés des
+    étapes amont, empreintes de fichiers, paramètres, version du code).
+    Le résultat est cherché en mémoire, puis dans cache_dir (snapshot Arrow
+    mappé en mémoire, partagé entre processus) ; sinon `construire()` est
+    appelé par un seul processus et le résultat est publié.
+
+    Le résultat renvoyé est l'objet partagé du cache, sans copie : il est en
+    lecture seule (les colonnes numériques d'un DataFrame le sont physiquement).
+    Un appelant qui veut le modifier travaille sur une sélection, un `assign`
+    ou une copie explicite.
+    """
+    cle = f"{nom}-{_empreinte(nom, *entrees)}"
+    collecte = getattr(_cache_collecte, "cles", None)
+    if collecte is not None:
+        collecte.add(cle)
+
+    with _cache_verrou:
+        entree = _cache_verrous_cles.setdefault(cle, [threading.Lock(), 0])
+        entree[1] += 1
+
+    try:
+        with entree[0]:
+            with _cache_verrou:
+                if cle in _cache_memoire:
+                    _cache_memoire.move_to_end(cle)
+                    return cle, _cache_memoire[cle]
+
+            base = os.path.join(cache_dir, cle)
+            trouve, resultat = _chercher_snapshot(base)
+            if not trouve:
+                os.makedirs(cache_dir, exist_ok=True)
+                with _VerrouConstruction(base):
+                    # un autre processus a pu publier pendant l'attente du verrou
+                    trouve, resultat = _chercher_snapshot(base)
+                    if not trouve:
+                        resultat = _publier_snapshot(base, construire())
+
+            with _cache_verrou:
+                _cache_memoire[cle] = resultat
+                while len(_cache_memoire) > _cache_memoire_max:
+                    _cache_memoire.popitem(last=False)
+    finally:
+        # le verrou d'une clé ne vit que le temps des appels en cours
+        with _cache_verrou:
+            entree[1] -= 1
+            if not entree[1] and _cache_verrous_cles.get(cle) is entree:
+                del _cache_verrous_cles[cle]
+
+    return cle, resultat
+
+def nettoyer_cache(garder=(), taille_max=None, duree_max=None):
+    """
+    Retire de cache_dir les snapshots plus vieux que `duree_max` secondes, puis
+    les plus anciens tant que le total dépasse `taille_max` octets. Les clés de
+    `garder` et celles du cache mémoire ne sont jamais retirées, ni les verrous
+    de construction ; un fichier temporaire abandonné (plus vieux que
+    cache_verrou_expiration) est supprimé. Renvoie les clés retirées.
+    """
+    taille_max = cache_taille_max if taille_max is None else taille_max
+    duree_max = cache_duree_max if duree_max is None else duree_max
+    if not os.path.isdir(cache_dir):
+        return []
+    with _cache_verrou:
+        gardees = set(garder) | set(_cache_memoire)
+
+    maintenant = time.time()
+    snapshots, total = [], 0
+    for entree in os.scandir(cache_dir):
+        try:
+            stat = entree.stat()
+        except FileNotFoundError:
+            continue
+        if entree.name.endswith(".tmp"):
+            if maintenant - stat.st_mtime > cache_verrou_expiration:
+                _supprimer(entree.path)
+            continue
+        cle, ext = os.path.splitext(entree.name)
+        if ext not in (".arrow", ".pkl"):
+            continue
+        total += stat.st_size
+        if cle not in gardees:
+            snapshots.append((stat.st_mtime, stat.st_size, cle, entree.path))
+
+    retirees = []
+    for mtime, taille, cle, chemin in sorted(snapshots):
+        if maintenant - mtime <= duree_max and total <= taille_max:
+            break
+        if _supprimer(chemin):
+            total -= taille
+            retirees.append(cle)
+    return retirees
+
+def _supprimer(chemin):
+    try:
+        os.remove(chemin)
+        return True
+    except FileNotFoundError:
+        return False
+
+def _jour_api():
+    """
+    Les données de l'API Banque mondiale n'ont pas de fichier à empreinter :
+    on les considère valides pour la journée.
+    """
+    return time.strftime("%Y-%m-%d")
+
 # ===================== 1) EXTRACTION IMF =====================
-@st.cache_data(show_spinner=True)
-def process_dataframe ():
-    df_imf = pd.read_csv(
-        data_path,
-        low_memory=False
-    )
 
-    codes_imf = {
-        "Solde_budgetaire_PIB": "GGXCNL_NGDP",
-        "Dette_publique_PIB":   "GGXWDG_NGDP",
-        "Recettes_publiques":   "GGR_NGDP",
-        "Depenses_publiques":   "GGXONLB_NGDP",
-        "Balance_courante_PIB": "BCA_NGDPD",
-        "Taux_change":          "PPPEX",
-        "Reserves_change":      "TMG_RPCH",
-        "Balance_commerciale":  "BCA"
-    }
+codes_imf = {
+    "Solde_budgetaire_PIB": "GGXCNL_NGDP",
+    "Dette_publique_PIB":   "GGXWDG_NGDP",
+    "Recettes_publiques":   "GGR_NGDP",
+    "Depenses_publiques":   "GGXONLB_NGDP",
+    "Balance_courante_PIB": "BCA_NGDPD",
+    "Taux_change":          "PPPEX",
+    "Reserves_change":      "TMG_RPCH",
+    "Balance_commerciale":  "BCA"
+}
+
+csv_bloc_octets = 1 << 20
+csv_lignes_par_morceau = 200_000
+
+def _lire_imf_filtre(path):
+    """
+    Lecture en flux de data.csv : seules les colonnes COUNTRY, SERIES_CODE et les
+    années utiles sont lues, et seules les lignes dont SERIES_CODE contient un des
+    codes_imf et dont le pays est dans l'univers sont matérialisées.
+    La mémoire dépend de la taille du résultat, pas de celle du fichier.
+    """
+    colonnes = ["COUNTRY", "SERIES_CODE"] + years
+    motif = "|".join(codes_imf.values())
+
+    try:
+        types = {"COUNTRY": pa.string(), "SERIES_CODE": pa.string()}
+        types.update({y: pa.float64() for y in years})
+        lecteur = pv.open_csv(
+            path,
+            read_options=pv.ReadOptions(block_size=csv_bloc_octets),
+            convert_options=pv.ConvertOptions(
+                include_columns=colonnes,
+                column_types=types,
+                null_values=pv.ConvertOptions().null_values + ["--"],
+                strings_can_be_null=True,
+            ),
+        )
+        morceaux = []
+        for batch in lecteur:
+            garde = pc.match_substring_regex(batch.column("SERIES_CODE"), motif, ignore_case=True)
+            batch = batch.filter(pc.fill_null(garde, False))
+            if batch.num_rows == 0:
+                continue
+            pays = batch.column("COUNTRY")
+            noms = [n for n in pc.unique(pays).to_pylist() if n is not None and clean_imf_country(n)]
+            batch = batch.filter(pc.fill_null(pc.is_in(pays, value_set=pa.array(noms, pa.string())), False))
+            morceaux.append(batch)
+        return pa.Table.from_batches(morceaux, schema=lecteur.schema).to_pandas()
+
+    except pa.ArrowInvalid:
+        # valeurs non numériques imprévues : lecture par morceaux avec pandas
+        morceaux = []
+        for chunk in pd.read_csv(path, usecols=colonnes, chunksize=csv_lignes_par_morceau,
+                                 low_memory=False):
+            chunk = chunk[chunk["SERIES_CODE"].str.contains(motif, case=False, na=False)]
+            chunk = chunk[chunk["COUNTRY"].map(clean_imf_country).notna()]
+            morceaux.append(chunk)
+        return pd.concat(morceaux, ignore_index=True) if morceaux else pd.DataFrame(columns=colonnes)
+
+def _ingest_imf(path=data_path):
+    df_imf = _lire_imf_filtre(path)
 
     rows_imf = []
 
@@ -117,62 +542,156 @@ def process_dataframe ():
 
     df_imf_final["Annee"] = df_imf_final["Annee"].astype(int)
 
+    return df_imf_final
 
-    # ===================== 2) EXTRACTION WDI + WGI =====================
+def stage_imf():
+    empreinte, chemin = source_figee(data_path)
+    return stage(
+        "imf",
+        [empreinte, years, codes_imf, mapping_imf_to_iso,
+         version_code(_ingest_imf, _lire_imf_filtre, clean_imf_country)],
+        lambda: _ingest_imf(chemin),
+    )
 
-    session = requests.Session()
-    rows_wdi = []
-
-    # Codes WDI/WGI (comme avant)
-    wdi_indicators = {
-        "NY.GDP.MKTP.CD":      "PIB_total_$",
-        "NY.GDP.MKTP.KD.ZG":   "Croissance_PIB",
-        "NY.GDP.PCAP.CD":      "PIB_par_habitant",
-        "FP.CPI.TOTL.ZG":      "Inflation",
-        "GC.BAL.CASH.GD.ZS":   "Deficit_budgetaire_PIB",
-        "GC.REV.XGRT.GD.ZS":   "Recettes_publiques_PIB",
-        "GC.XPN.TOTL.GD.ZS":   "Depenses_publiques_PIB",
-        "BN.CAB.XOKA.GD.ZS":   "BalanceCourante_PIB",
-        "FI.RES.TOTL.CD":      "Reserves_change_$",
-        "NE.IMP.GNFS.CD":      "Importations_$",
-        "GC.DOD.TOTL.GD.ZS":   "Dette_publique_PIB",
-    }
+# ===================== 2) EXTRACTION WDI + WGI =====================
+
+wdi_indicators = {
+    "NY.GDP.MKTP.CD":      "PIB_total_$",
+    "NY.GDP.MKTP.KD.ZG":   "Croissance_PIB",
+    "NY.GDP.PCAP.CD":      "PIB_par_habitant",
+    "FP.CPI.TOTL.ZG":      "Inflation",
+    "GC.BAL.CASH.GD.ZS":   "Deficit_budgetaire_PIB",
+    "GC.REV.XGRT.GD.ZS":   "Recettes_publiques_PIB",
+    "GC.XPN.TOTL.GD.ZS":   "Depenses_publiques_PIB",
+    "BN.CAB.XOKA.GD.ZS":   "BalanceCourante_PIB",
+    "FI.RES.TOTL.CD":      "Reserves_change_$",
+    "NE.IMP.GNFS.CD":      "Importations_$",
+    "GC.DOD.TOTL.GD.ZS":   "Dette_publique_PIB",
+}
 
-    wgi_indicators = {
-        "PV.EST": "Stabilite_Politique",
-        "GE.EST": "Efficacite_Gouvernement",
-        "CC.EST": "Corruption",
-        "RL.EST": "Etat_de_droit",
-        "VA.EST": "Voix_responsabilisation"
-    }
+wgi_indicators = {
+    "PV.EST": "Stabilite_Politique",
+    "GE.EST": "Efficacite_Gouvernement",
+    "CC.EST": "Corruption",
+    "RL.EST": "Etat_de_droit",
+    "VA.EST": "Voix_responsabilisation"
+}
 
-    countries_iso = list(mapping_imf_to_iso.values())
-    countries_str = ";".join(countries_iso)
+wb_api_url = os.environ.get("WB_API_URL", "https://api.worldbank.org/v2")
+wb_per_page = 10000   # un indicateur × tout l'univers × l'historique long tient sur une page
+wb_tentatives = 4     # essais par page avant d'abandonner le téléchargement
+wb_attente = 1.0      # secondes avant le 2e essai, doublées ensuite
 
-    #API de la banque mondiale
-    def fetch_indicator(indicator, name):
-        url = (
-            f"https://api.worldbank.org/v2/country/{countries_str}/indicator/{indicator}"
-            f"?format=json&per_page=20000&date={start_year}:{end_year}"
-        )
+# Exports bulk (ZIP CSV) WDI et WGI mirorés en local : utilisés à la place de l'API quand ils sont présents
+wb_archives = [r"data/WDI_CSV.zip", r"data/WGI_CSV.zip"]
+
+class _TamponWB:
+    """
+    Tampons colonnes typés (pays, année, indicateur, valeur) à croissance amortie.
+    Pays et indicateurs sont stockés sous forme d'indices (int16).
+    """
 
-        r = session.get(url)
+    def __init__(self, capacite=4096):
+        self.n = 0
+        self.pays = np.empty(capacite, dtype=np.int16)
+        self.annee = np.empty(capacite, dtype=np.int16)
+        self.indicateur = np.empty(capacite, dtype=np.int16)
+        self.valeur = np.empty(capacite, dtype=np.float64)
+
+    def ajouter(self, pays, annee, indicateur, valeur):
+        k = len(valeur)
+        if self.n + k > len(self.valeur):
+            capacite = max(2 * len(self.valeur), self.n + k)
+            for col in ("pays", "annee", "indicateur", "valeur"):
+                ancien = getattr(self, col)
+                nouveau = np.empty(capacite, dtype=ancien.dtype)
+                nouveau[:self.n] = ancien[:self.n]
+                setattr(self, col, nouveau)
+        fin = self.n + k
+        self.pays[self.n:fin] = pays
+        self.annee[self.n:fin] = annee
+        self.indicateur[self.n:fin] = indicateur
+        self.valeur[self.n:fin] = valeur
+        self.n = fin
+
+def _page_wb(session, url, indicator, page):
+    """
+    Une page de l'API, avec wb_tentatives essais espacés (attente doublée à
+    chaque échec). Renvoie (entête, entrées). Seules les erreurs HTTP, réseau
+    ou de réponse illisible sont réessayées ; lève RuntimeError si la page
+    reste inaccessible. Un message d'erreur de l'API (indicateur ou paramètre
+    rejeté) ne changera pas à l'essai suivant : ValueError immédiate.
+    """
+    for essai in range(wb_tentatives):
         try:
-            data = r.json()
-        except:
-            return
+            reponse = session.get(url, timeout=60)
+            reponse.raise_for_status()
+            data = reponse.json()
+            if not isinstance(data, list) or not data or not isinstance(data[0], dict):
+                raise ValueError("réponse inattendue")
+        except (requests.RequestException, ValueError) as e:
+            erreur = e
+        else:
+            if "message" in data[0]:
+                messages = data[0]["message"]
+                if not isinstance(messages, list):
+                    messages = [messages]
+                detail = "; ".join(
+                    str(m.get("value") or m.get("key")) if isinstance(m, dict) else str(m) for m in messages
+                )
+                raise ValueError(f"API Banque mondiale : indicateur {indicator} rejeté ({detail})")
+            entrees = data[1] if len(data) > 1 else None
+            if not (entrees is None and data[0].get("total")):
+                return data[0], entrees or []
+            erreur = "page sans entrées"
+        if essai + 1 < wb_tentatives:
+            time.sleep(wb_attente * 2 ** essai)
+    raise RuntimeError(
+        f"API Banque mondiale : {indicator} page {page} inaccessible "
+        f"après {wb_tentatives} essais ({erreur})"
+    )
 
-        if not data or len(data) < 2 or not isinstance(data[1], list):
-            return
+def _pages_wb(session, countries_str, indicator, debut, fin):
+    """
+    Itère sur toutes les pages de l'API pour un indicateur ; chaque page
+    (au plus wb_per_page entrées) est lue puis libérée avant la suivante.
+    Une page en échec lève RuntimeError (ValueError si l'API rejette
+    l'indicateur) : un indicateur n'est jamais tronqué, et l'étape qui
+    télécharge n'est alors pas publiée dans le cache.
+    """
+    page, pages = 1, 1
+    while page <= pages:
+        url = (
+            f"{wb_api_url}/country/{countries_str}/indicator/{indicator}"
+            f"?format=json&per_page={wb_per_page}&page={page}&date={debut}:{fin}"
+        )
+        entete, entrees = _page_wb(session, url, indicator, page)
+        pages = int(entete.get("pages") or 1)
+        yield entrees
+        page += 1
 
-        for e in data[1]:
-            country = e.get("countryiso3code")
-            year    = e.get("date")
-            value   = e.get("value")
+def _ingest_wb(countries_iso, debut, fin):
+    """
+    Télécharge WDI + WGI pour `countries_iso` sur debut:fin et renvoie le panel Pays/Annee.
+    Toutes les pages sont parcourues ; les entrées sont converties page par page
+    dans des tampons typés puis posées directement dans un cube pays × année × indicateur.
+    """
+    session = requests.Session()
+    countries_str = ";".join(countries_iso)
+    index_pays = pd.Index(countries_iso)
+    noms = list(wdi_indicators.values()) + list(wgi_indicators.values())
+    tampon = _TamponWB()
 
-            if country in countries_iso and value is not None:
-                rows_wdi.append([country, int(year), name, value])
+    #API de la banque mondiale
+    def fetch_indicator(indicator, name):
+        i_ind = noms.index(name)
+        for entries in _pages_wb(session, countries_str, indicator, debut, fin):
+            pays = index_pays.get_indexer([e.get("countryiso3code") for e in entries])
+            annee = pd.to_numeric(pd.Series([e.get("date") for e in entries]), errors="coerce").to_numpy()
+            valeur = np.array([e.get("value") for e in entries], dtype=float)
 
+            garde = (pays >= 0) & ~np.isnan(valeur) & ~np.isnan(annee)
+            tampon.ajouter(pays[garde], annee[garde], i_ind, valeur[garde])
 
     for ind, name in tqdm(wdi_indicators.items(), desc="WDI"):
         fetch_indicator(ind, name)
@@ -180,15 +699,135 @@ def process_dataframe ():
     for ind, name in tqdm(wgi_indicators.items(), desc="WGI"):
         fetch_indicator(ind, name)
 
-    df_wdi = pd.DataFrame(rows_wdi, columns=["Pays","Annee","Indicateur","Valeur"])
-    df_wdi_pivot = df_wdi.pivot_table(
-        index=["Pays","Annee"],
-        columns="Indicateur",
-        values="Valeur"
-    ).reset_index()
+    return _panel_wb(tampon, index_pays, noms, debut, fin)
+
+def _panel_wb(tampon, index_pays, noms, debut, fin):
+    """
+    Tampon (pays, année, indicateur, valeur) → panel Pays/Annee avec une colonne
+    par indicateur, posé directement dans un cube pays × année × indicateur.
+    """
+    n = tampon.n
+    annees = np.arange(debut, fin + 1)
+    cube = np.full((len(index_pays), len(annees), len(noms)), np.nan)
+    a = tampon.annee[:n].astype(int) - debut
+    dans_periode = (a >= 0) & (a < len(annees))
+    cube[tampon.pays[:n][dans_periode], a[dans_periode], tampon.indicateur[:n][dans_periode]] = tampon.valeur[:n][dans_periode]
+
+    ordre_pays = np.argsort(index_pays.to_numpy())
+    cube = cube[ordre_pays]
+    ordre_cols = np.argsort(noms)
+    cube = cube[:, :, ordre_cols]
+
+    plat = cube.reshape(-1, len(noms))
+    lignes = ~np.isnan(plat).all(axis=1)
+    colonnes = ~np.isnan(plat).all(axis=0)
+
+    df_wdi_pivot = pd.DataFrame(
+        plat[np.ix_(lignes, colonnes)],
+        columns=pd.Index(np.array(noms)[ordre_cols][colonnes], name="Indicateur"),
+    )
+    df_wdi_pivot.insert(0, "Pays", np.repeat(index_pays.to_numpy()[ordre_pays], len(annees))[lignes])
+    df_wdi_pivot.insert(1, "Annee", np.tile(annees, len(index_pays))[lignes])
+    return df_wdi_pivot
+
+def _membre_donnees(zf):
+    """
+    Fichier de données d'une archive bulk Banque mondiale (WDICSV.csv, WDIData.csv,
+    WGICSV.csv...) : le plus gros CSV, les autres étant des métadonnées.
+    """
+    csvs = [i for i in zf.infolist() if i.filename.lower().endswith(".csv")]
+    if not csvs:
+        raise ValueError(f"Aucun CSV dans l'archive {zf.filename}")
+    return max(csvs, key=lambda i: i.file_size).filename
+
+def _lire_archive_wb(path, codes, index_pays, noms, debut, fin, tampon):
+    """
+    Lit en flux le CSV large d'une archive bulk (une ligne par pays × indicateur,
+    une colonne par année) sans l'extraire : seules les colonnes Country Code,
+    Indicator Code et debut..fin sont décodées, et seules les lignes des
+    indicateurs `codes` et des pays de `index_pays` sont gardées.
+    """
+    with zipfile.ZipFile(path) as zf:
+        membre = _membre_donnees(zf)
+        with zf.open(membre) as f:
+            entete = next(csv.reader(io.TextIOWrapper(f, encoding="utf-8-sig")))
+        annees = [c for c in entete if c.strip().isdigit() and debut <= int(c) <= fin]
+        colonnes = ["Country Code", "Indicator Code"] + annees
+
+        with zf.open(membre) as f:
+            lecteur = pv.open_csv(
+                f,
+                read_options=pv.ReadOptions(block_size=csv_bloc_octets, encoding="utf-8"),
+                convert_options=pv.ConvertOptions(
+                    include_columns=colonnes,
+                    column_types={a: pa.float64() for a in annees},
+                ),
+            )
+            codes_pa = pa.array(list(codes))
+            pays_pa = pa.array(list(index_pays))
+            for lot in lecteur:
+                garde = pc.and_(pc.is_in(lot.column("Indicator Code"), value_set=codes_pa),
+                                pc.is_in(lot.column("Country Code"), value_set=pays_pa))
+                lot = lot.filter(garde)
+                if not lot.num_rows:
+                    continue
+                pays = index_pays.get_indexer(lot.column("Country Code").to_numpy(zero_copy_only=False))
+                ind = np.array([noms.index(codes[c]) for c in lot.column("Indicator Code").to_pylist()])
+                valeurs = np.column_stack([lot.column(a).to_numpy(zero_copy_only=False) for a in annees]) \
+                    if annees else np.empty((lot.num_rows, 0))
+                i, j = np.nonzero(~np.isnan(valeurs))
+                tampon.ajouter(pays[i], np.array(annees, dtype=int)[j], ind[i], valeurs[i, j])
+
+def _ingest_wb_archives(countries_iso, debut, fin, archives):
+    """
+    Même panel que _ingest_wb, à partir des archives bulk WDI / WGI locales
+    (une lecture locale par archive au lieu d'un appel API par indicateur).
+    """
+    index_pays = pd.Index(countries_iso)
+    noms = list(wdi_indicators.values()) + list(wgi_indicators.values())
+    codes = {**wdi_indicators, **wgi_indicators}
+    tampon = _TamponWB()
+    for path in archives:
+        _lire_archive_wb(path, codes, index_pays, noms, debut, fin, tampon)
+    return _panel_wb(tampon, index_pays, noms, debut, fin)
+
+def stage_wb(countries_iso, debut, fin):
+    """
+    Panel WDI + WGI : archives bulk locales si elles existent toutes
+    (wb_archives), sinon API Banque mondiale. Un téléchargement incomplet
+    lève une erreur et n'est pas publié : l'étape sera reconstruite au prochain appel.
+    """
+    if wb_archives and all(os.path.exists(p) for p in wb_archives):
+        sources = [source_figee(p) for p in wb_archives]
+        return stage(
+            "wb",
+            [list(countries_iso), debut, fin, wdi_indicators, wgi_indicators,
+             [empreinte for empreinte, _ in sources],
+             version_code(_ingest_wb_archives, _lire_archive_wb, _membre_donnees, _panel_wb, _TamponWB)],
+            lambda: _ingest_wb_archives(list(countries_iso), debut, fin, [c for _, c in sources]),
+        )
+    return stage(
+        "wb",
+        [list(countries_iso), debut, fin, wdi_indicators, wgi_indicators, wb_api_url,
+         _jour_api(), version_code(_ingest_wb, _pages_wb, _page_wb, _panel_wb, _TamponWB)],
+        lambda: _ingest_wb(list(countries_iso), debut, fin),
+    )
+
+# Univers de l'historique long : tous les pays notés par le modèle
+pays_historique = sorted(set(mapping_imf_to_iso.values()))
+annee_debut_historique = 1984
 
-    # ===================== 3) FUSION IMF + WDI/WGI =====================
+def stage_wb_historique():
+    """
+    Panel WDI + WGI de tout l'univers sur annee_debut_historique..end_year :
+    un seul téléchargement (ou une seule lecture des archives), partagé par
+    l'historique long et par le modèle (qui n'en garde que start_year..end_year).
+    """
+    return stage_wb(pays_historique, annee_debut_historique, end_year)
 
+# ===================== 3) FUSION IMF + WDI/WGI =====================
+
+def _fusion_imf_wb(df_imf_final, df_wdi_pivot):
     df_final = pd.merge(
         df_imf_final, df_wdi_pivot,
         on=["Pays", "Annee"], how="outer"
@@ -216,48 +855,440 @@ def process_dataframe ():
 
     return df_final
 
-#Calcul des scores normalisés (Z score)
-@st.cache_data(show_spinner=True)
-def compute_Zscore():
-    df_clean = process_dataframe()
+def _periode_wb(df_wdi_pivot, debut, fin):
+    """
+    Restriction du panel WDI + WGI aux années debut..fin (indicateurs sans
+    aucune donnée sur la période retirés, comme pour un téléchargement direct).
+    """
+    df = df_wdi_pivot[(df_wdi_pivot["Annee"] >= debut) & (df_wdi_pivot["Annee"] <= fin)]
+    return df.dropna(axis=1, how="all").reset_index(drop=True)
+
+def stage_ingestion():
+    cle_imf, df_imf_final = stage_imf()
+    cle_wb, df_wdi_pivot = stage_wb_historique()
+    return stage(
+        "ingestion",
+        [cle_imf, cle_wb, start_year, end_year, version_code(_fusion_imf_wb, _periode_wb)],
+        lambda: _fusion_imf_wb(df_imf_final, _periode_wb(df_wdi_pivot, start_year, end_year)),
+    )
+
+def process_dataframe ():
+    return stage_ingestion()[1]
+
+# ===================== GRAPHE DES VARIABLES DÉRIVÉES =====================
+
+# Chaque variable dérivée déclare ses dépendances (indicateurs bruts ou autres
+# variables dérivées). Une mise à jour d'un indicateur brut ne recalcule que
+# les variables situées en aval dans ce graphe.
+#
+# calcul : "ratio" (deps[0] / deps[1]) ou une statistique glissante sur deps[0],
+# par pays : "std", "mean", "zchange", "drawdown", "ewma", "slope".
+# fenetre : nombre d'années, ou None pour une fenêtre expansive (depuis le début).
+derived_features = {
+    "Reserves_sur_Importations": {
+        "deps": ["Reserves_change_$", "Importations_$"],
+        "calcul": "ratio",
+    },
+    "Volatilite_Croissance": {
+        "deps": ["Croissance_PIB"],
+        "calcul": "std", "fenetre": 5, "min_periods": 2,
+    },
+    "Volatilite_Inflation": {
+        "deps": ["Inflation"],
+        "calcul": "std", "fenetre": 5, "min_periods": 2,
+    },
+    "Pente_Dette_publique_PIB_10a": {
+        "deps": ["Dette_publique_PIB"],
+        "calcul": "slope", "fenetre": 10, "min_periods": 3,
+    },
+    "Zchange_Croissance_PIB": {
+        "deps": ["Croissance_PIB"],
+        "calcul": "zchange", "fenetre": 5, "min_periods": 3,
+    },
+    "Ecart_plus_haut_PIB_par_habitant": {
+        "deps": ["PIB_par_habitant"],
+        "calcul": "drawdown", "fenetre": None, "min_periods": 1,
+    },
+    "Inflation_EWMA": {
+        "deps": ["Inflation"],
+        "calcul": "ewma", "alpha": 0.5, "min_periods": 1,
+    },
+}
 
-    df_clean = df_clean.sort_values(["Pays", "Annee"]).reset_index(drop=True)
+all_features = [
+    "PIB_par_habitant","Croissance_PIB","Inflation","Deficit_budgetaire_PIB",
+    "Recettes_publiques_PIB","Depenses_publiques_PIB","BalanceCourante_PIB",
+    "Reserves_sur_Importations","Stabilite_Politique","Efficacite_Gouvernement",
+    "Corruption","Etat_de_droit","Voix_responsabilisation","Volatilite_Croissance",
+    "Volatilite_Inflation","Dette_publique_PIB", "Solde_budgetaire_PIB", "Balance_commerciale", "PIB_total_$"
+]
 
-    # ===================== 2) Interpolation =====================
+def _ordre_derivees():
+    """
+    Ordre topologique des variables dérivées (une dérivée peut dépendre d'une autre).
+    """
+    ordre, vus = [], set()
 
-    df_clean = df_clean.groupby("Pays", group_keys=False).apply(lambda x: x.interpolate()).reset_index()
+    def visiter(nom):
+        if nom in vus:
+            return
+        vus.add(nom)
+        for dep in derived_features[nom]["deps"]:
+            if dep in derived_features:
+                visiter(dep)
+        ordre.append(nom)
 
-    # ===================== 3) Ratios & volatilités =====================
+    for nom in derived_features:
+        visiter(nom)
+    return ordre
 
-    # Ratio réserves / importations
-    if "Reserves_change_$" in df_clean.columns and "Importations_$" in df_clean.columns:
-        df_clean["Reserves_sur_Importations"] = df_clean["Reserves_change_$"] / df_clean["Importations_$"]
-    else:
-        df_clean["Reserves_sur_Importations"] = np.nan
+def features_impactees(colonnes):
+    """
+    Renvoie les variables dérivées à recalculer quand `colonnes` changent,
+    dans l'ordre où elles doivent être recalculées.
+    """
+    sales = set(colonnes)
+    impactees = []
+    for nom in _ordre_derivees():
+        if sales.intersection(derived_features[nom]["deps"]):
+            sales.add(nom)
+            impactees.append(nom)
+    return impactees
+
+def _interpoler_par_pays(df, cols):
+    """
+    Interpolation linéaire des colonnes `cols`, pays par pays (df trié par Pays/Annee).
+    """
+    return df.groupby("Pays", group_keys=False)[cols].apply(lambda x: x.interpolate())
 
-    # Volatilité croissance 5 ans
-    df_clean["Volatilite_Croissance"] = df_clean.groupby("Pays")["Croissance_PIB"].transform(
-        lambda x: x.rolling(5, min_periods=2).std()
-    )
+# ===================== MOTEUR DE FENÊTRES GLISSANTES =====================
+
+class _Groupes:
+    """
+    Structure des pays d'un panel trié par Pays/Annee, calculée une seule fois :
+    indice de la première ligne du pays pour chaque ligne, rang dans le pays.
+    Toutes les statistiques glissantes sont ensuite des opérations sur tableaux.
+    """
+
+    def __init__(self, df):
+        pays = df["Pays"].to_numpy()
+        self.n = len(pays)
+        idx = np.arange(self.n)
+        nouveau = np.ones(self.n, dtype=bool)
+        nouveau[1:] = pays[1:] != pays[:-1]
+        self.debut = np.maximum.accumulate(np.where(nouveau, idx, 0)) if self.n else idx
+        self.rang = idx - self.debut
+        self.id = np.cumsum(nouveau) - 1
+        self.annee = df["Annee"].to_numpy(dtype=float)
+
+    def bornes(self, fenetre):
+        """
+        Première ligne de la fenêtre se terminant en chaque ligne.
+        """
+        if fenetre is None:
+            return self.debut
+        return np.maximum(np.arange(self.n) - fenetre + 1, self.debut)
+
+    def somme_fenetre(self, v, fenetre):
+        """
+        Somme de v sur la fenêtre se terminant en chaque ligne. Les sommes
+        cumulées repartent de zéro à chaque pays : le résultat d'un pays ne
+        dépend que de ses propres lignes (pas d'arrondi hérité des pays précédents).
+        """
+        cumul = pd.Series(v).groupby(self.id).cumsum().to_numpy()
+        lo = self.bornes(fenetre)
+        avant = np.where(lo > self.debut, cumul[np.maximum(lo - 1, 0)], 0.0)
+        return cumul - avant
+
+    def sommes(self, x, fenetre):
+        """
+        Sommes glissantes par pays : (nombre de valeurs, somme, somme des carrés),
+        NaN ignorés. Les valeurs sont centrées par pays pour limiter les erreurs d'arrondi.
+        """
+        valide = ~np.isnan(x)
+        nb_pays = self.id[-1] + 1 if self.n else 0
+        moy = np.bincount(self.id, np.where(valide, x, 0), nb_pays) / np.maximum(
+            np.bincount(self.id, valide, nb_pays), 1)
+        xc = np.where(valide, x - moy[self.id], 0.0)
+
+        c = self.somme_fenetre(valide.astype(float), fenetre)
+        return c, self.somme_fenetre(xc, fenetre), self.somme_fenetre(xc * xc, fenetre), moy[self.id]
+
+    def decaler(self, x, k=1):
+        """
+        Valeur de la ligne t-k du même pays (NaN si hors pays).
+        """
+        y = np.full(self.n, np.nan)
+        y[k:] = x[:-k] if k else x
+        y[self.rang < k] = np.nan
+        return y
+
+    def maximum(self, x, fenetre):
+        """
+        Maximum glissant (ou expansif) par pays, NaN ignorés.
+        """
+        if fenetre is None:
+            return pd.Series(x).groupby(self.id).cummax().to_numpy()
+        pad = np.concatenate([np.full(fenetre - 1, np.nan), x])
+        vues = np.lib.stride_tricks.sliding_window_view(pad, fenetre).copy()
+        # on masque les positions antérieures au début du pays
+        decalage = np.arange(fenetre)[None, :] - (fenetre - 1)
+        hors_pays = (np.arange(self.n)[:, None] + decalage) < self.debut[:, None]
+        vues[hors_pays] = np.nan
+        vide = np.isnan(vues).all(axis=1)
+        vues[vide] = -np.inf
+        return np.where(vide, np.nan, np.nanmax(vues, axis=1))
+
+def _stat_glissante(g, x, spec):
+    """
+    Statistique glissante `spec` de x (tableau aligné sur le panel trié).
+    """
+    calcul = spec["calcul"]
+    fenetre = spec.get("fenetre")
+    min_periods = spec.get("min_periods", 1)
+
+    if calcul in ("std", "mean"):
+        c, s, ss, moy = g.sommes(x, fenetre)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if calcul == "mean":
+                res = moy + s / c
+            else:
+                res = np.sqrt(np.maximum(ss - s * s / c, 0) / (c - 1))
+        return np.where(c >= max(min_periods, 1 if calcul == "mean" else 2), res, np.nan)
+
+    if calcul == "zchange":
+        # variation annuelle standardisée par la moyenne / l'écart-type glissants des variations
+        d = x - g.decaler(x)
+        c, s, ss, moy = g.sommes(d, fenetre)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            m = moy + s / c
+            sd = np.sqrt(np.maximum(ss - s * s / c, 0) / (c - 1))
+            res = (d - m) / np.where(sd > 0, sd, np.nan)
+        return np.where(c >= max(min_periods, 2), res, np.nan)
+
+    if calcul == "drawdown":
+        # écart au plus haut de la fenêtre, dans l'unité de l'indicateur (<= 0)
+        c = g.sommes(x, fenetre)[0]
+        return np.where(c >= min_periods, x - g.maximum(x, fenetre), np.nan)
+
+    if calcul == "ewma":
+        # moyenne exponentielle e_t = a x_t + (1 - a) e_{t-1}, une valeur manquante conserve e_{t-1} ;
+        # récurrence sur le rang dans le pays, vectorisée sur tous les pays à la fois
+        alpha = spec["alpha"]
+        res = np.full(g.n, np.nan)
+        if g.n:
+            for r in range(g.rang.max() + 1):
+                lignes = np.flatnonzero(g.rang == r)
+                xr = x[lignes]
+                prec = res[lignes - 1] if r else np.full(len(lignes), np.nan)
+                res[lignes] = np.where(
+                    np.isnan(prec), xr,
+                    np.where(np.isnan(xr), prec, alpha * xr + (1 - alpha) * prec),
+                )
+        c = g.sommes(x, None)[0]
+        return np.where(c >= min_periods, res, np.nan)
+
+    if calcul == "slope":
+        # pente MCO de x sur l'année dans la fenêtre (unités par an)
+        valide = ~np.isnan(x)
+        t = np.where(valide, g.annee - g.annee[g.debut], np.nan)
+
+        def cum(v):
+            return g.somme_fenetre(np.where(valide, v, 0.0), fenetre)
+
+        c, _, _, moy = g.sommes(x, fenetre)
+        xc = x - moy
+        st, sx, stx, stt = cum(t), cum(xc), cum(t * xc), cum(t * t)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            res = (c * stx - st * sx) / (c * stt - st * st)
+        return np.where(c >= max(min_periods, 2), res, np.nan)
+
+    raise ValueError(f"Calcul inconnu : {calcul}")
+
+def _calcul_derivee(df, nom, groupes=None):
+    """
+    Calcule la variable dérivée `nom` sur df (trié par Pays/Annee).
+    `groupes` permet de réutiliser la structure des pays entre plusieurs variables.
+    """
+    spec = derived_features[nom]
+    deps = spec["deps"]
+    if any(d not in df.columns for d in deps):
+        return pd.Series(np.nan, index=df.index)
+
+    if spec["calcul"] == "ratio":
+        return df[deps[0]] / df[deps[1]]
+
+    g = groupes if groupes is not None else _Groupes(df)
+    x = pd.to_numeric(df[deps[0]], errors="coerce").to_numpy(dtype=float)
+    return pd.Series(_stat_glissante(g, x, spec), index=df.index)
+
+def _lignes_aval(df, touche, spec):
+    """
+    Lignes dont la fenêtre contient une ligne touchée (même pays, années suivantes).
+    """
+    if spec["calcul"] == "ratio":
+        return touche
+    g = _Groupes(df)
+    fenetre = spec.get("fenetre")
+    if spec["calcul"] == "ewma":
+        fenetre = None
+    elif spec["calcul"] == "zchange" and fenetre is not None:
+        fenetre += 1  # la variation en t utilise aussi t-1
+    return g.maximum(touche.astype(float), fenetre) > 0
+
+def build_features(df_brut):
+    """
+    Panel pays/année brut → interpolation par pays + variables dérivées.
+    """
+    df_clean = df_brut.sort_values(["Pays", "Annee"]).reset_index(drop=True)
 
-    # Volatilité inflation 5 ans
-    df_clean["Volatilite_Inflation"] = df_clean.groupby("Pays")["Inflation"].transform(
-        lambda x: x.rolling(5, min_periods=2).std()
+    # ===================== Interpolation =====================
+    num_cols = [c for c in df_clean.select_dtypes("number").columns if c != "Annee"]
+    df_clean[num_cols] = _interpoler_par_pays(df_clean, num_cols)
+
+    # ===================== Ratios & statistiques glissantes =====================
+    groupes = _Groupes(df_clean)
+    for nom in _ordre_derivees():
+        df_clean[nom] = _calcul_derivee(df_clean, nom, groupes)
+
+    return df_clean
+
+def update_features(df_brut, df_feat, updates):
+    """
+    Mise à jour incrémentale du panel de features.
+
+    updates : DataFrame long (Pays, Annee, Indicateur, Valeur), même format que
+    les lignes WDI. Seules les colonnes touchées et leurs dérivées sont
+    recalculées, et uniquement pour les pays concernés ; pour les fenêtres
+    glissantes seules les années dont la fenêtre contient une valeur modifiée
+    sont réécrites.
+
+    Retourne (df_brut, df_feat, impact) où impact associe à chaque colonne
+    recalculée le masque booléen des lignes (de df_feat) qui ont changé.
+    Le résultat est identique à build_features sur le nouveau panel brut.
+    """
+    # ---------- 1. Application des nouvelles valeurs brutes ----------
+    upd = updates.pivot_table(
+        index=["Pays", "Annee"], columns="Indicateur", values="Valeur", aggfunc="last"
     )
+    df_brut = df_brut.set_index(["Pays", "Annee"])
+    nouvelles_lignes = upd.index.difference(df_brut.index)
+    if len(nouvelles_lignes):
+        # nouvelle année / nouveau pays : la structure du panel change
+        df_brut = df_brut.reindex(df_brut.index.union(upd.index))
+    for col in upd.columns:
+        vals = upd[col].dropna()
+        if col not in df_brut.columns:
+            df_brut[col] = np.nan
+        df_brut.loc[vals.index, col] = vals.values
+    df_brut = df_brut.reset_index()
+
+    if len(nouvelles_lignes):
+        df_feat = build_features(df_brut)
+        impact = {c: np.ones(len(df_feat), dtype=bool) for c in df_feat.columns}
+        return df_brut, df_feat, impact
+
+    # ---------- 2. Ré-interpolation des colonnes brutes touchées ----------
+    df_feat = df_feat.copy()
+    brut = df_brut.sort_values(["Pays", "Annee"]).reset_index(drop=True)
+    pays = upd.index.get_level_values("Pays").unique()
+    lignes_pays = df_feat["Pays"].isin(pays).to_numpy()
+
+    impact = {}
+    for col in upd.columns:
+        if col not in df_feat.columns:
+            df_feat[col] = np.nan
+        nouveau = _interpoler_par_pays(brut[lignes_pays], [col])[col].to_numpy()
+        ancien = df_feat.loc[lignes_pays, col].to_numpy()
+        change = np.zeros(len(df_feat), dtype=bool)
+        change[lignes_pays] = ~((ancien == nouveau) | (np.isnan(ancien) & np.isnan(nouveau)))
+        df_feat.loc[lignes_pays, col] = nouveau
+        impact[col] = change
+
+    # ---------- 3. Variables dérivées en aval ----------
+    for nom in features_impactees(impact):
+        spec = derived_features[nom]
+        touche = np.zeros(len(df_feat), dtype=bool)
+        for dep in spec["deps"]:
+            if dep in impact:
+                touche |= impact[dep]
+
+        if spec["calcul"] != "ratio":
+            # une valeur modifiée en t touche les fenêtres t .. t+fenetre-1 du même
+            # pays, mais le centrage par pays des sommes glissantes peut déplacer
+            # les autres lignes à l'arrondi près : le pays est réécrit en entier
+            # pour rester identique à build_features
+            touche = _lignes_aval(df_feat, touche, spec)
+            touche = df_feat["Pays"].isin(df_feat.loc[touche, "Pays"].unique()).to_numpy()
+
+        valeurs = _calcul_derivee(df_feat[touche], nom).to_numpy(dtype=float)
+        ancien = df_feat.loc[touche, nom].to_numpy(dtype=float)
+        change = np.zeros(len(df_feat), dtype=bool)
+        change[touche] = ~((ancien == valeurs) | (np.isnan(ancien) & np.isnan(valeurs)))
+        df_feat.loc[touche, nom] = valeurs
+        impact[nom] = change
+
+    return df_brut, df_feat, impact
+
+# ===================== POIDS DU SCORE & ÉCHELLE DE NOTATION =====================
+
+poids_score = {
+    "PIB_par_habitant_z":          +0.80,
+    "Croissance_PIB_z":            +0.40,
+    "Volatilite_Croissance_z":     -0.20,
+    "Inflation_z":                 -0.20,
+    "Volatilite_Inflation_z":      -0.25,
+    "Deficit_budgetaire_PIB_z":    -0.25,
+    "Recettes_publiques_PIB_z":    +0.25,
+    "Dette_publique_PIB_z":        -0.55,
+    "BalanceCourante_PIB_z":       +0.25,
+    "Reserves_sur_Importations_z": +0.30,
+    "Stabilite_Politique_z":       +1.2,
+    "Efficacite_Gouvernement_z":   +1.0,
+    "Etat_de_droit_z":             +1.1,
+    "Voix_responsabilisation_z":   +0.8,
+    "Corruption_z":                -0.6,
+    "Developpe":                   +0.5,
+    "PIB_total_$_z":               +0.6,
+    "Balance_commerciale_z":       +0.3,
+}
 
-    # ===================== 4) Dataset final pour l’année la plus récente =====================
+bonus_structurels = {
+    "Monnaie_reserve":       0.4,
+    "Safe_haven":            0.2,
+    "Euro_core":             0.5,
+    "Ressources_naturelles": 0.7,   #  BONUS indep energetique top 10 monde
+}
 
-    df_last = df_clean[df_clean["Annee"] == end_year].copy()
+# Échelle calibrée sur 146 pays (distribution réelle)
+rating_scale = [
+    (0.98, "AAA"),
+    (0.89, "AA+"),
+    (0.84, "AA"),
+    (0.82, "AA-"),
+    (0.73, "A+"),
+    (0.70, "A"),
+    (0.67, "A-"),
+    (0.62, "BBB+"),
+    (0.58, "BBB"),
+    (0.51, "BBB-"),
+    (0.39, "BB+"),
+    (0.30, "BB"),
+    (0.21, "BB-"),
+    (0.17, "B+"),
+    (0.09, "B"),
+    (0.03, "B-"),
+    (0.01, "CCC+"),
+    (0.00, "CCC")
+]
 
-    # ===================== 5) Normalisation des variables =====================
+def zscore_model(df_feat, annee=end_year):
+    """
+    Z-scores et variables structurelles pour l'année `annee` du panel de features.
+    """
+    df_last = df_feat[df_feat["Annee"] == annee].copy()
 
-    all_features = [
-        "PIB_par_habitant","Croissance_PIB","Inflation","Deficit_budgetaire_PIB",
-        "Recettes_publiques_PIB","Depenses_publiques_PIB","BalanceCourante_PIB",
-        "Reserves_sur_Importations","Stabilite_Politique","Efficacite_Gouvernement",
-        "Corruption","Etat_de_droit","Voix_responsabilisation","Volatilite_Croissance",
-        "Volatilite_Inflation","Dette_publique_PIB", "Solde_budgetaire_PIB", "Balance_commerciale", "PIB_total_$"
-    ]
+    # ===================== Normalisation des variables =====================
 
     # Ajouter colonnes manquantes
     for f in all_features:
@@ -268,9 +1299,9 @@ def compute_Zscore():
     features_effective = [f for f in all_features if not df_last[f].isna().all()]
 
     # Normalisation
-    df_feat = df_last[features_effective].copy()
-    df_feat = df_feat.fillna(df_feat.mean())
-    Z = StandardScaler().fit_transform(df_feat)
+    df_norm = df_last[features_effective].copy()
+    df_norm = df_norm.fillna(df_norm.mean())
+    Z = StandardScaler().fit_transform(df_norm) if features_effective else np.empty((len(df_norm), 0))
 
     # Ajouter les Z-scores au dataset
     df_model = df_last.copy()
@@ -280,7 +1311,7 @@ def compute_Zscore():
         if f + "_z" not in df_model.columns:
             df_model[f + "_z"] = 0
 
-    # ===================== 6) Variables structurelles =====================
+    # ===================== Variables structurelles =====================
 
     df_model["Monnaie_reserve"] = (df_model["Pays"] == "USA").astype(int)
     df_model["Safe_haven"] = df_model["Pays"].isin(["CHE","NOR","DNK","SGP","DEU"]).astype(int)
@@ -302,200 +1333,482 @@ def compute_Zscore():
         "VEN"   # Venezuela
     ]).astype(int)
 
-        # ===================== 7) Score de solvabilité =====================
-
-    df_model["Score_solvabilite"] = (
-    + 0.80 * df_model["PIB_par_habitant_z"]
-    + 0.40 * df_model["Croissance_PIB_z"]
-    - 0.20 * df_model["Volatilite_Croissance_z"]
-    - 0.20 * df_model["Inflation_z"]
-    - 0.25 * df_model["Volatilite_Inflation_z"]
-    - 0.25 * df_model["Deficit_budgetaire_PIB_z"]
-    + 0.25 * df_model["Recettes_publiques_PIB_z"]
-    - 0.55 * df_model["Dette_publique_PIB_z"]
-    + 0.25 * df_model["BalanceCourante_PIB_z"]
-    + 0.30 * df_model["Reserves_sur_Importations_z"]
-    + 1.2 * df_model["Stabilite_Politique_z"]
-    + 1.0 * df_model["Efficacite_Gouvernement_z"]
-    + 1.1 * df_model["Etat_de_droit_z"]
-    + 0.8 * df_model["Voix_responsabilisation_z"]
-    - 0.6 * df_model["Corruption_z"]
-    + 0.5 * df_model["Developpe"]
-    + 0.6 * df_model["PIB_total_$_z"]
-    + 0.3 * df_model["Balance_commerciale_z"]
-    )
+    return df_model
 
-    df_model["Score_solvabilite"] += (
-        0.4 * df_model["Monnaie_reserve"]
-        + 0.2 * df_model["Safe_haven"]
-        + 0.5 * df_model["Euro_core"]
-        + 0.7 * df_model["Ressources_naturelles"]   #  BONUS indep energetique top 10 monde
-    )
+def rate_model(df_model):
+    """
+    Score de solvabilité (poids_score + bonus_structurels) et notation.
+    """
+    df_model = df_model.copy()
 
+    # ===================== Score de solvabilité =====================
+
+    score = 0
+    for col, poids in poids_score.items():
+        score = score + poids * df_model[col]
+    df_model["Score_solvabilite"] = score
+
+    bonus = 0
+    for col, poids in bonus_structurels.items():
+        bonus = bonus + poids * df_model[col]
+    df_model["Score_solvabilite"] += bonus
+
+    # ===================== Notation =====================
 
-    # ===================== 8) Notation =====================
-
-    # Échelle calibrée sur 146 pays (distribution réelle)
-    rating_scale = [
-        (0.98, "AAA"),
-        (0.89, "AA+"),
-        (0.84, "AA"),
-        (0.82, "AA-"),
-        (0.73, "A+"),
-        (0.70, "A"),
-        (0.67, "A-"),
-        (0.62, "BBB+"),
-        (0.58, "BBB"),
-        (0.51, "BBB-"),
-        (0.39, "BB+"),
-        (0.30, "BB"),
-        (0.21, "BB-"),
-        (0.17, "B+"),
-        (0.09, "B"),
-        (0.03, "B-"),
-        (0.01, "CCC+"),
-        (0.00, "CCC")
-    ]
     # Percentile de chaque pays
     df_model["Score_percentile"] = df_model["Score_solvabilite"].rank(pct=True)
 
     # Mapping percentile → rating
-    def pct_to_rating(pct):
-        for threshold, rating in rating_scale:
-            if pct >= threshold:
-                return rating
-        return "CCC-"
-
-    df_model["Rating_modele"] = df_model["Score_percentile"].apply(pct_to_rating)
+    df_model["Rating_modele"] = pct_en_notes(df_model["Score_percentile"], rating_scale)
 
     return df_model
 
-@st.cache_data(show_spinner=True)
-def df_10countries():
-
-    countries = ["USA", "DEU", "FRA", "JPN", "CAN", "IND", "BRA", "ZAF", "IDN", "MAR"]
-
-    countries_str = ";".join(countries)
-
-    # WDI : fondamentaux macro + budget + externe + dette
-    wdi_indicators = {
-        "NY.GDP.MKTP.CD":      "PIB_total_$",
-        "NY.GDP.MKTP.KD.ZG":   "Croissance_PIB",
-        "NY.GDP.PCAP.CD":      "PIB_par_habitant",
-        "FP.CPI.TOTL.ZG":      "Inflation",
-        "GC.BAL.CASH.GD.ZS":   "Deficit_budgetaire_PIB",
-        "GC.REV.XGRT.GD.ZS":   "Recettes_publiques_PIB",
-        "GC.XPN.TOTL.GD.ZS":   "Depenses_publiques_PIB",
-        "BN.CAB.XOKA.GD.ZS":   "BalanceCourante_PIB",
-        "FI.RES.TOTL.CD":      "Reserves_change_$",
-        "NE.IMP.GNFS.CD":      "Importations_$",
-        # variables de dette :
-        "GC.DOD.TOTL.GD.ZS":   "Dette_publique_PIB",       # dette publique (% PIB)
-    }
+def score_model(df_feat, annee=end_year):
+    """
+    Z-scores, variables structurelles, score de solvabilité et notation
+    pour l'année `annee` du panel de features.
+    """
+    return rate_model(zscore_model(df_feat, annee))
 
-    # WGI : gouvernance
-    wgi_indicators = {
-        "PV.EST": "Stabilite_Politique",
-        "GE.EST": "Efficacite_Gouvernement",
-        "CC.EST": "Corruption",
-        "RL.EST": "Etat_de_droit",
-        "VA.EST": "Voix_responsabilisation"
-    }
+def refresh_Zscore(df_feat, impact, df_z=None, annee=end_year):
+    """
+    Z-scores après update_features : ils ne sont recalculés que si une ligne
+    de l'année notée a effectivement changé (sinon df_z est renvoyé tel quel).
+    """
+    annee_touchee = (df_feat["Annee"] == annee).to_numpy()
+    if df_z is not None and not any((m & annee_touchee).any() for m in impact.values()):
+        return df_z
+    return zscore_model(df_feat, annee)
 
-    start_year = 1984
-    end_year   = 2024
+# ===================== CHAÎNE INCRÉMENTALE =====================
 
-    session = requests.Session()
+# Dernier panel servi par stage_features (et Z-scores servis par stage_zscore) :
+# point de départ de la reconstruction suivante. Quand une source change, seules
+# les cellules brutes modifiées sont repassées dans update_features, et les
+# Z-scores ne sont recalculés que si l'année notée est touchée.
+_incremental = {"features": None, "impact": None, "zscore": None}
+_incremental_verrou = threading.Lock()
 
-    # ===================== Téléchargement groupé WDI + WGI =====================
+def _mises_a_jour_brutes(ancien, nouveau):
+    """
+    Cellules du panel brut qui diffèrent entre deux versions, au format long
+    (Pays, Annee, Indicateur, Valeur) d'update_features. None si la structure
+    a changé (colonnes, lignes) ou si une valeur a disparu : il faut alors
+    tout reconstruire.
+    """
+    if list(ancien.columns) != list(nouveau.columns) or not ancien.dtypes.equals(nouveau.dtypes):
+        return None
+    a = ancien.set_index(["Pays", "Annee"]).sort_index()
+    n = nouveau.set_index(["Pays", "Annee"]).sort_index()
+    if not (n.index.is_unique and a.index.equals(n.index)):
+        return None
+    cols = list(n.select_dtypes("number").columns)
+    if not a.drop(columns=cols).equals(n.drop(columns=cols)):
+        return None
 
-    rows = []
+    A, N = a[cols].to_numpy(dtype=float), n[cols].to_numpy(dtype=float)
+    change = ~((A == N) | (np.isnan(A) & np.isnan(N)))
+    if (change & np.isnan(N)).any():
+        return None
+    i, j = np.nonzero(change)
+    return pd.DataFrame({
+        "Pays": n.index.get_level_values("Pays")[i],
+        "Annee": n.index.get_level_values("Annee")[i],
+        "Indicateur": np.array(cols, dtype=object)[j],
+        "Valeur": N[i, j],
+    })
 
-    def fetch_indicator(indicator, name):
-        url = (
-            f"https://api.worldbank.org/v2/country/{countries_str}"
-            f"/indicator/{indicator}?format=json&per_page=20000&date={start_year}:{end_year}"
-        )
-        r = session.get(url)
-        try:
-            data = r.json()
-        except Exception:
-            return
+def _construire_features(df_brut, parametres, calcul):
+    """
+    build_features(df_brut), obtenu si possible par mise à jour du dernier panel
+    servi, à condition qu'il ait été construit avec les mêmes `parametres`
+    (empreinte de derived_features et du code). Le masque d'impact est laissé
+    dans `calcul` pour stage_zscore.
+    """
+    with _incremental_verrou:
+        precedent = _incremental["features"]
+    if precedent is None or precedent[1] != parametres:
+        return build_features(df_brut)
+    cle_prec, _, brut_prec, feat_prec = precedent
+    maj = _mises_a_jour_brutes(brut_prec, df_brut)
+    if maj is None:
+        return build_features(df_brut)
+
+    if len(maj):
+        _, df_feat, impact = update_features(brut_prec, feat_prec, maj)
+    else:
+        df_feat, impact = feat_prec, {}
+    calcul.update(origine=cle_prec, impact=impact)
+    return df_feat
+
+def stage_features():
+    cle_ing, df_brut = stage_ingestion()
+    # derived_features est figé par son empreinte : le dictionnaire peut être modifié ensuite
+    parametres = _empreinte(
+        derived_features,
+        version_code(build_features, _interpoler_par_pays, _calcul_derivee, _stat_glissante, _Groupes,
+                     update_features, _lignes_aval, _mises_a_jour_brutes, _construire_features),
+    )
+    calcul = {}
+    cle, df_feat = stage(
+        "features",
+        [cle_ing, parametres],
+        lambda: _construire_features(df_brut, parametres, calcul),
+    )
+    with _incremental_verrou:
+        _incremental["features"] = (cle, parametres, df_brut, df_feat)
+        if calcul:
+            _incremental["impact"] = (cle, calcul["origine"], calcul["impact"])
+    return cle, df_feat
+
+def stage_zscore():
+    cle_feat, df_feat = stage_features()
+    parametres = [all_features, end_year, version_code(zscore_model)]
+
+    def construire():
+        with _incremental_verrou:
+            impact, precedent = _incremental["impact"], _incremental["zscore"]
+        if impact and precedent and impact[0] == cle_feat \
+                and precedent[:2] == (impact[1], parametres):
+            return refresh_Zscore(df_feat, impact[2], precedent[2], end_year)
+        return zscore_model(df_feat, end_year)
+
+    cle, df_z = stage("zscore", [cle_feat] + parametres, construire)
+    with _incremental_verrou:
+        _incremental["zscore"] = (cle_feat, parametres, df_z)
+    return cle, df_z
+
+def stage_rating():
+    cle_z, df_z = stage_zscore()
+    return stage(
+        "rating",
+        [cle_z, poids_score, bonus_structurels, rating_scale, version_code(rate_model)],
+        lambda: rate_model(df_z),
+    )
 
-        if not data or len(data) < 2 or not isinstance(data[1], list):
-            return
+#Calcul des scores normalisés (Z score)
+def compute_Zscore():
+    return stage_rating()[1]
 
-        for entry in data[1]:
-            country = entry.get("countryiso3code")
-            year    = entry.get("date")
-            value   = entry.get("value")
-            if country in countries and value is not None:
-                try:
-                    year = int(year)
-                except Exception:
-                    continue
-                rows.append([country, year, name, value])
+# ===================== ATTRIBUTION DU SCORE =====================
 
-    # WDI
-    for ind, name in tqdm(wdi_indicators.items(), desc="WDI groupés"):
-        fetch_indicator(ind, name)
+def _attribution(df_model):
+    """
+    Contribution de chaque terme du score (poids × Z-score, bonus structurels)
+    pour toutes les lignes de df_model, en un seul produit matriciel.
+    La somme des contributions d'une ligne est son Score_solvabilite.
+    """
+    poids = {**poids_score, **bonus_structurels}
+    termes = list(poids)
+    C = df_model[termes].to_numpy(dtype=float) * np.array([poids[t] for t in termes])
+
+    df_attr = pd.DataFrame(C, columns=[t[:-2] if t.endswith("_z") else t for t in termes])
+    df_attr.insert(0, "Pays", df_model["Pays"].to_numpy())
+    df_attr.insert(1, "Annee", df_model["Annee"].to_numpy())
+    df_attr.insert(2, "Score_solvabilite", df_model["Score_solvabilite"].to_numpy())
+    df_attr.insert(3, "Rating_modele", df_model["Rating_modele"].to_numpy())
+    return df_attr
+
+def attribution_scores():
+    """
+    Table d'attribution du score (end_year) : une ligne par pays, une colonne
+    par terme du score, en points de Score_solvabilite.
+    """
+    cle_rating, df_model = stage_rating()
+    return stage(
+        "attribution",
+        [cle_rating, poids_score, bonus_structurels, version_code(_attribution)],
+        lambda: _attribution(df_model),
+    )[1]
+
+def contributions_pays(pays):
+    """
+    Contributions au score de `pays`, triées de la plus favorable à la plus défavorable.
+    """
+    df_attr = attribution_scores()
+    ligne = df_attr[df_attr["Pays"] == pays]
+    if ligne.empty:
+        raise ValueError(f"Aucune attribution pour {pays}")
+    termes = df_attr.columns[4:]
+    return ligne[termes].iloc[0].astype(float).sort_values(ascending=False)
+
+# ===================== HISTORIQUE DES NOTES & TRANSITIONS =====================
+
+def _noter_annees(df_feat):
+    annees = sorted(int(a) for a in df_feat["Annee"].dropna().unique())
+    return pd.concat([score_model(df_feat, a) for a in annees], ignore_index=True)
+
+def stage_rating_annees():
+    cle_feat, df_feat = stage_features()
+    return stage(
+        "rating_annees",
+        [cle_feat, all_features, poids_score, bonus_structurels, rating_scale,
+         version_code(_noter_annees, zscore_model, rate_model)],
+        lambda: _noter_annees(df_feat),
+    )
 
-    # WGI
-    for ind, name in tqdm(wgi_indicators.items(), desc="WGI groupés"):
-        fetch_indicator(ind, name)
+def historique_notes_modele():
+    """
+    Notation du modèle pour chaque année du panel (classement au sein de chaque année).
+    """
+    return stage_rating_annees()[1]
 
-    df = pd.DataFrame(rows, columns=["Pays","Annee","Indicateur","Valeur"])
+def _paires_transition(df, col_note, horizon):
+    """
+    Couples (cran en t, cran en t+horizon) pour chaque pays noté les deux années.
+    """
+    d = df[["Pays", "Annee"]].copy()
+    d["Cran"] = notes_en_num(df[col_note]).to_numpy()
+    d = d.dropna(subset=["Cran"])
+    suivant = d.assign(Annee=d["Annee"] - horizon)
+    return d.merge(suivant, on=["Pays", "Annee"], suffixes=("", "_suivant"))
 
-    df_pivot = df.pivot_table(
-        index=["Pays","Annee"],
-        columns="Indicateur",
-        values="Valeur"
-    ).reset_index()
+def matrice_transition(df, col_note="Rating_modele", horizon=1, normaliser=True):
+    """
+    Matrice de transition des notes entre t et t+horizon sur les lignes
+    Pays/Annee/col_note de df (notes S&P/Fitch ou Moody's).
+    Lignes : note en t ; colonnes : note en t+horizon. Seuls les crans observés sont gardés.
+    """
+    paires = _paires_transition(df, col_note, horizon)
+    k = len(echelle_notes)
+    i = paires["Cran"].to_numpy(dtype=int) - 1
+    j = paires["Cran_suivant"].to_numpy(dtype=int) - 1
+    comptes = np.bincount(i * k + j, minlength=k * k).reshape(k, k)
+
+    observes = (comptes.sum(axis=1) > 0) | (comptes.sum(axis=0) > 0)
+    libelles = np.array(echelle_notes)[observes]
+    mat = pd.DataFrame(comptes[np.ix_(observes, observes)], index=libelles, columns=libelles)
+    mat.index.name = "Note_t"
+    mat.columns.name = f"Note_t+{horizon}"
+
+    if normaliser:
+        mat = mat.div(mat.sum(axis=1).replace(0, np.nan), axis=0)
+    return mat
+
+def stats_changements_crans(df, col_note="Rating_modele", horizon=1, par="Annee"):
+    """
+    Statistiques de variation de crans entre t et t+horizon (variation > 0 = dégradation),
+    agrégées par `par` ("Annee", "Pays" ou None pour l'ensemble).
+    """
+    paires = _paires_transition(df, col_note, horizon)
+    paires["Variation_crans"] = paires["Cran_suivant"] - paires["Cran"]
+    paires["Stable"] = paires["Variation_crans"] == 0
+    paires["Relevement"] = paires["Variation_crans"] < 0
+    paires["Degradation"] = paires["Variation_crans"] > 0
+    paires["Variation_abs"] = paires["Variation_crans"].abs()
+
+    groupes = paires.groupby(par) if par else paires.groupby(np.zeros(len(paires), dtype=int))
+    stats = groupes.agg(
+        Transitions=("Variation_crans", "size"),
+        Part_stables=("Stable", "mean"),
+        Part_relevements=("Relevement", "mean"),
+        Part_degradations=("Degradation", "mean"),
+        Variation_moyenne=("Variation_crans", "mean"),
+        Variation_abs_moyenne=("Variation_abs", "mean"),
+    )
+    return stats if par else stats.reset_index(drop=True)
+
+# ===================== PRÉVISIONS DES INDICATEURS =====================
+
+# Projection de chaque série pays × indicateur du panel de features sur
+# 1..horizon_prevision années après end_year. Tous les modèles sont ajustés
+# d'un coup sur la matrice (séries × années) : moindres carrés fermés calculés
+# par sommes masquées, sans boucle par série. Les variables dérivées sont
+# ensuite recalculées sur le panel prolongé et les années futures sont notées
+# par zscore_model / rate_model comme les années observées.
+#
+# "ar1"              : y_t = a + b·y_(t-1), b borné à ±ar1_borne (stationnarité)
+# "tendance_amortie" : dernier niveau + pente·(φ + φ² + ... + φ^h)
+# Une série avec moins de 3 points utilisables est prolongée à plat.
+
+horizon_prevision = 5
+prevision_methode = "ar1"
+ar1_borne = 0.95
+amortissement = 0.8
+
+def _matrice_series(df_feat, cols):
+    """
+    Panel trié Pays/Annee → (pays, annees, Y) avec Y[pays × cols, annees].
+    """
+    cube = df_feat.set_index(["Pays", "Annee"])[cols].unstack("Annee")
+    pays = cube.index.to_numpy()
+    annees = cube.columns.get_level_values("Annee").unique().to_numpy()
+    Y = cube.to_numpy(dtype=float).reshape(len(pays), len(cols), len(annees))
+    return pays, annees, Y.reshape(len(pays) * len(cols), len(annees))
 
-    df_clean = df_pivot.sort_values(["Pays","Annee"]).copy()
+def _moindres_carres(x, y, m):
+    """
+    Régressions y = a + b·x indépendantes pour chaque ligne, sur les points m.
+    Renvoie (a, b, n) ; b = NaN si la ligne a moins de 3 points ou x constant.
+    """
+    n = m.sum(axis=1)
+    x = np.where(m, x, 0.0)
+    y = np.where(m, y, 0.0)
+    sx, sy = x.sum(axis=1), y.sum(axis=1)
+    sxx, sxy = (x * x).sum(axis=1), (x * y).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        den = n * sxx - sx * sx
+        b = np.where((n >= 3) & (np.abs(den) > 1e-12), (n * sxy - sx * sy) / den, np.nan)
+        a = (sy - np.nan_to_num(b) * sx) / n
+    return a, b, n
+
+def _derniere_valeur(Y):
+    """
+    Dernière valeur observée de chaque ligne (NaN si la ligne est vide).
+    """
+    valides = ~np.isnan(Y)
+    pos = Y.shape[1] - 1 - np.argmax(valides[:, ::-1], axis=1)
+    return np.where(valides.any(axis=1), Y[np.arange(len(Y)), pos], np.nan)
 
-    # Interpolation des séries par pays (on force les colonnes en numériques pour éviter le warning)
-    def interpolate_group(x):
-        x = x.infer_objects(copy=False)
-        return x.interpolate()
+def _prevoir_series(Y, horizon, methode):
+    """
+    Y[séries, années] → prévisions P[séries, horizon].
+    """
+    dernier = _derniere_valeur(Y)
+    P = np.empty((len(Y), horizon))
+
+    if methode == "ar1":
+        x, y = Y[:, :-1], Y[:, 1:]
+        m = ~np.isnan(x) & ~np.isnan(y)
+        _, b, n = _moindres_carres(x, y, m)
+        b = np.clip(b, -ar1_borne, ar1_borne)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            a = (np.where(m, y, 0).sum(axis=1) - b * np.where(m, x, 0).sum(axis=1)) / n
+        plat = np.isnan(b)
+        a, b = np.where(plat, 0.0, a), np.where(plat, 1.0, b)
+        courant = dernier
+        for h in range(horizon):
+            courant = a + b * courant
+            P[:, h] = courant
+
+    elif methode == "tendance_amortie":
+        t = np.broadcast_to(np.arange(Y.shape[1], dtype=float), Y.shape)
+        _, pente, _ = _moindres_carres(t, Y, ~np.isnan(Y))
+        pente = np.nan_to_num(pente)
+        cumul = np.cumsum(amortissement ** np.arange(1, horizon + 1))
+        P[:] = dernier[:, None] + pente[:, None] * cumul[None, :]
 
-    df_clean = df_clean.groupby("Pays", group_keys=False).apply(interpolate_group)
-    for col in ["Reserves_change_$", "Importations_$", "Croissance_PIB", "Inflation"]:
-        if col not in df_clean.columns:
-            df_clean[col] = np.nan
+    else:
+        raise ValueError(f"Méthode de prévision inconnue : {methode}")
 
-    df_clean["Reserves_sur_Importations"] = df_clean["Reserves_change_$"] / df_clean["Importations_$"]
+    return P
 
-    df_clean["Volatilite_Croissance"] = (
-        df_clean.groupby("Pays")["Croissance_PIB"]
-        .transform(lambda x: x.rolling(5, min_periods=2).std())
+def _prevoir_panel(df_feat, horizon, methode):
+    """
+    Lignes Pays/Annee des années end_year+1 .. end_year+horizon : indicateurs
+    bruts prévus, variables dérivées recalculées sur le panel prolongé.
+    """
+    hist = df_feat[df_feat["Annee"] <= end_year]
+    cols = [c for c in hist.select_dtypes("number").columns
+            if c != "Annee" and c not in derived_features]
+    pays, annees, Y = _matrice_series(hist, cols)
+    P = _prevoir_series(Y, horizon, methode)
+
+    futur = np.arange(end_year + 1, end_year + horizon + 1)
+    P = P.reshape(len(pays), len(cols), horizon).transpose(0, 2, 1).reshape(-1, len(cols))
+    df_prev = pd.DataFrame(P, columns=cols)
+    df_prev.insert(0, "Pays", np.repeat(pays, horizon))
+    df_prev.insert(1, "Annee", np.tile(futur, len(pays)).astype(hist["Annee"].dtype))
+
+    panel = pd.concat([hist[["Pays", "Annee"] + cols], df_prev], ignore_index=True)
+    panel = panel.sort_values(["Pays", "Annee"]).reset_index(drop=True)
+    groupes = _Groupes(panel)
+    for nom in _ordre_derivees():
+        panel[nom] = _calcul_derivee(panel, nom, groupes)
+
+    return panel[panel["Annee"] > end_year].reset_index(drop=True)
+
+def stage_previsions(horizon=horizon_prevision, methode=prevision_methode):
+    cle_feat, df_feat = stage_features()
+    return stage(
+        "previsions",
+        [cle_feat, end_year, horizon, methode, ar1_borne, amortissement, derived_features,
+         version_code(_prevoir_panel, _prevoir_series, _moindres_carres, _derniere_valeur,
+                      _matrice_series, _calcul_derivee, _stat_glissante, _Groupes)],
+        lambda: _prevoir_panel(df_feat, horizon, methode),
     )
 
-    df_clean["Volatilite_Inflation"] = (
-        df_clean.groupby("Pays")["Inflation"]
-        .transform(lambda x: x.rolling(5, min_periods=2).std()))
-    df_clean
-    
-    return df_clean
+def previsions_indicateurs(horizon=horizon_prevision, methode=prevision_methode):
+    """
+    Indicateurs prévus (valid_indicators disponibles) pour chaque pays et
+    chaque année end_year+1 .. end_year+horizon.
+    """
+    df_prev = stage_previsions(horizon, methode)[1]
+    return df_prev[["Pays", "Annee"] + [c for c in valid_indicators if c in df_prev.columns]]
 
-@st.cache_data(show_spinner=True)
-def countries10_Zscore():
-    # Dictionnaire ISO3 → vrai nom pays
-    iso3_to_name = {
-        "USA": "États-Unis",
-        "DEU": "Allemagne",
-        "FRA": "France",
-        "JPN": "Japon",
-        "CAN": "Canada",
-        "IND": "Inde",
-        "BRA": "Brésil",
-        "ZAF": "Afrique du Sud",
-        "IDN": "Indonésie",
-        "MAR": "Maroc"
-    }
+def _noter_previsions(df_prev):
+    annees = sorted(int(a) for a in df_prev["Annee"].unique())
+    return pd.concat([score_model(df_prev, a) for a in annees], ignore_index=True)
 
-    # Copier toutes les années depuis df_clean
-    df_manu = df_10countries()
+def notes_prevues(horizon=horizon_prevision, methode=prevision_methode):
+    """
+    Score de solvabilité et notation du modèle pour chaque année prévue
+    (classement au sein de chaque année, comme historique_notes_modele).
+    """
+    cle_prev, df_prev = stage_previsions(horizon, methode)
+    return stage(
+        "notes_prevues",
+        [cle_prev, all_features, poids_score, bonus_structurels, rating_scale,
+         version_code(_noter_previsions, zscore_model, rate_model)],
+        lambda: _noter_previsions(df_prev),
+    )[1]
+
+def _historique(df_pivot):
+    df_pivot = df_pivot.copy()
+    for col in ["Reserves_change_$", "Importations_$", "Croissance_PIB", "Inflation"]:
+        if col not in df_pivot.columns:
+            df_pivot[col] = np.nan
+
+    # Interpolation des séries par pays + variables dérivées
+    return build_features(df_pivot)
+
+def stage_historique():
+    # ===================== Téléchargement groupé WDI + WGI =====================
+    cle_wb, df_pivot = stage_wb_historique()
+    return stage(
+        "historique",
+        [cle_wb, derived_features,
+         version_code(_historique, build_features, _interpoler_par_pays, _calcul_derivee,
+                      _stat_glissante, _Groupes)],
+        lambda: _historique(df_pivot),
+    )
+
+def df_historique():
+    """
+    Historique long (annee_debut_historique–end_year) de tous les pays de l'univers.
+    """
+    return stage_historique()[1]
+
+# Dictionnaire ISO3 → vrai nom pays
+iso3_to_name = {
+    "USA": "États-Unis", "CAN": "Canada", "MEX": "Mexique", "GTM": "Guatemala",
+    "HND": "Honduras", "CRI": "Costa Rica", "PAN": "Panama", "BRA": "Brésil",
+    "ARG": "Argentine", "CHL": "Chili", "COL": "Colombie", "PER": "Pérou",
+    "VEN": "Venezuela", "ECU": "Équateur", "BOL": "Bolivie", "URY": "Uruguay",
+    "PRY": "Paraguay", "DEU": "Allemagne", "FRA": "France", "ITA": "Italie",
+    "ESP": "Espagne", "NLD": "Pays-Bas", "BEL": "Belgique", "CHE": "Suisse",
+    "AUT": "Autriche", "SWE": "Suède", "NOR": "Norvège", "DNK": "Danemark",
+    "FIN": "Finlande", "IRL": "Irlande", "GBR": "Royaume-Uni", "LUX": "Luxembourg",
+    "ISL": "Islande", "PRT": "Portugal", "POL": "Pologne", "CZE": "Tchéquie",
+    "HUN": "Hongrie", "ROU": "Roumanie", "BGR": "Bulgarie", "SVK": "Slovaquie",
+    "EST": "Estonie", "LVA": "Lettonie", "LTU": "Lituanie", "SRB": "Serbie",
+    "ZAF": "Afrique du Sud", "EGY": "Égypte", "NGA": "Nigeria", "KEN": "Kenya",
+    "MAR": "Maroc", "TUN": "Tunisie", "GHA": "Ghana", "CMR": "Cameroun",
+    "ETH": "Éthiopie", "UGA": "Ouganda", "CIV": "Côte d'Ivoire", "SEN": "Sénégal",
+    "TGO": "Togo", "BFA": "Burkina Faso", "MLI": "Mali", "TZA": "Tanzanie",
+    "MOZ": "Mozambique", "ZMB": "Zambie", "SDN": "Soudan", "NAM": "Namibie",
+    "ZWE": "Zimbabwe", "TUR": "Turquie", "SAU": "Arabie saoudite", "ISR": "Israël",
+    "JOR": "Jordanie", "LBN": "Liban", "QAT": "Qatar", "ARE": "Émirats arabes unis",
+    "KWT": "Koweït", "JPN": "Japon", "KOR": "Corée du Sud", "CHN": "Chine",
+    "SGP": "Singapour", "IDN": "Indonésie", "THA": "Thaïlande", "PHL": "Philippines",
+    "MYS": "Malaisie", "VNM": "Viêt Nam", "AUS": "Australie", "IND": "Inde",
+    "PAK": "Pakistan", "BGD": "Bangladesh", "LKA": "Sri Lanka", "NPL": "Népal",
+    "MDV": "Maldives", "CUB": "Cuba", "HTI": "Haïti", "JAM": "Jamaïque",
+    "PNG": "Papouasie-Nouvelle-Guinée",
+}
+
+def _historique_Zscore(df_manu, df_model, annee=end_year):
+    df_manu = df_manu.copy()
 
     # Ajouter le vrai nom des pays
     df_manu["Pays_nom"] = df_manu["Pays"].map(iso3_to_name)
@@ -503,110 +1816,332 @@ def countries10_Zscore():
     # Colonnes scores depuis df_ratings
     cols_scores = ["Score_solvabilite", "Rating_modele"]
 
-    df_model = compute_Zscore()
     # Colonnes z-scores et bonus depuis df_model
     cols_zscores = [c for c in df_model.columns if c.endswith("_z")]
     cols_bonus   = [c for c in ["Monnaie_reserve","Safe_haven","Euro_core","Developpe"] if c in df_model.columns]
 
-    # Sélection des données 2024
-    df_2024 = df_model[df_model["Annee"] == 2024][["Pays","Annee"] + cols_scores].copy()
+    # Sélection des données de l'année notée
+    df_annee = df_model[df_model["Annee"] == annee][["Pays","Annee"] + cols_scores].copy()
 
-    # Ajouter z-scores et bonus pour 2024 depuis df_model
-    df_model_2024 = df_model[df_model["Annee"] == 2024][["Pays","Annee"] + cols_zscores + cols_bonus].copy()
-    df_2024 = df_2024.merge(df_model_2024, on=["Pays","Annee"], how="left")
+    # Ajouter z-scores et bonus de l'année notée depuis df_model
+    df_model_annee = df_model[df_model["Annee"] == annee][["Pays","Annee"] + cols_zscores + cols_bonus].copy()
+    df_annee = df_annee.merge(df_model_annee, on=["Pays","Annee"], how="left")
 
-    # Fusion dans df_manu (uniquement année 2024 pour les scores, z-scores et bonus)
+    # Fusion dans df_manu (uniquement l'année notée pour les scores, z-scores et bonus)
     df_manu = df_manu.merge(
-        df_2024,
+        df_annee,
         on=["Pays","Annee"],
         how="left",
-        suffixes=("", "_2024")
+        suffixes=("", f"_{annee}")
     )
 
     # Tri pratique
     df_manu = df_manu.sort_values(["Pays","Annee"]).reset_index(drop=True)
 
-    # Export Excel
-    df_manu
     return df_manu
 
-def compare_agencies_ratings():
-    # Notations agences (2024)
-    
-    df_ag = pd.DataFrame(data_agences)
-
-    # conversion de notation texte en score numérique
-    rating_to_num = {
-        "AAA": 1,
-        "Aaa": 1,
-        "AA+": 2,
-        "Aa1": 2,
-        "AA": 3,
-        "Aa2": 3,
-        "AA-": 4,
-        "Aa3": 4,
-        "A+": 5,
-        "A1": 5,
-        "A": 6,
-        "A2": 6,
-        "A-": 7,
-        "A3": 7,
-        "BBB+": 8,
-        "Baa1": 8,
-        "BBB": 9,
-        "Baa2": 9,
-        "BBB-": 10,
-        "Baa3": 10,
-        "BB+": 11,
-        "Ba1": 11,
-        "BB": 12,
-        "Ba2": 12,
-        "BB-": 13,
-        "Ba3": 13,
-        "B+": 14,
-        "B1": 14,
-        "B": 15,
-        "B2": 15,
-        "B-": 16,
-        "B3": 16,
-        "CCC+": 17,
-        "CCC": 18,
-        "CCC-": 19,
-        "CC": 20,
-        "C": 21,
-        "D": 22
-    }
+def historique_Zscore():
+    """
+    Historique long de tous les pays, enrichi du nom du pays et, pour end_year,
+    du score, de la note, des Z-scores et des bonus du modèle.
+    """
+    cle_hist, df_manu = stage_historique()
+    cle_rating, df_model = stage_rating()
+    return stage(
+        "historique_zscore",
+        [cle_hist, cle_rating, iso3_to_name, end_year, version_code(_historique_Zscore)],
+        lambda: _historique_Zscore(df_manu, df_model, end_year),
+    )[1]
 
-    # Convertir les notations en score numérique
-    for agency in ["Moody", "Fitch", "S&P"]:
-        df_ag[f"{agency}_num"] = df_ag[agency].map(rating_to_num)
 
-    # Calcul de la moyenne agence (numérique) ---
-    df_ag["Moyenne_agences_num"] = df_ag[["Moody_num","Fitch_num","S&P_num"]].mean(axis=1)
+# ===================== PAYS COMPARABLES (BallTree) =====================
 
-    df_compare = countries10_Zscore()
-    df_ref = df_compare[df_compare["Annee"] == 2024]  # Données 2024
+class IndexPairs:
+    """
+    Index des plus proches voisins sur les vecteurs de Z-scores de chaque pays-année.
+
+    Un BallTree par année + un arbre global (analogues historiques). Lors d'un
+    rafraîchissement, seules les années dont les Z-scores ont changé sont
+    reconstruites ; l'arbre global n'est reconstruit que si au moins une année a changé.
+    """
+
+    def __init__(self):
+        self.cle = None
+        self.cols = [f + "_z" for f in all_features]
+        self.annees = {}      # annee -> (empreinte, arbre, pays, X, notes)
+        self.arbre_global = None
+        self.lignes_global = None   # DataFrame Pays/Annee/Rating_modele aligné sur l'arbre global
+        self.verrou = threading.Lock()
+
+    def mettre_a_jour(self, cle, df_z):
+        with self.verrou:
+            if cle == self.cle:
+                return
+            change = False
+            vues = set()
+            for annee, bloc in df_z.groupby("Annee"):
+                annee = int(annee)
+                vues.add(annee)
+                bloc = bloc.sort_values("Pays")
+                X = bloc[self.cols].to_numpy(dtype=float)
+                empreinte = hashlib.sha256(X.tobytes() + "|".join(bloc["Pays"]).encode()).hexdigest()
+                if annee in self.annees and self.annees[annee][0] == empreinte:
+                    continue
+                notes = bloc["Rating_modele"].to_numpy() if "Rating_modele" in bloc else None
+                self.annees[annee] = (empreinte, BallTree(X), bloc["Pays"].to_numpy(), X, notes)
+                change = True
+            for annee in set(self.annees) - vues:
+                del self.annees[annee]
+                change = True
+
+            if change or self.arbre_global is None:
+                annees = sorted(self.annees)
+                self.lignes_global = pd.DataFrame({
+                    "Pays": np.concatenate([self.annees[a][2] for a in annees]),
+                    "Annee": np.concatenate([np.full(len(self.annees[a][2]), a) for a in annees]),
+                    "Rating_modele": np.concatenate([
+                        self.annees[a][4] if self.annees[a][4] is not None
+                        else np.full(len(self.annees[a][2]), None) for a in annees
+                    ]),
+                })
+                self.arbre_global = BallTree(np.vstack([self.annees[a][3] for a in annees]))
+            self.cle = cle
+
+    def _vecteur(self, pays, annee):
+        if annee not in self.annees:
+            raise ValueError(f"Aucune donnée pour l'année {annee}")
+        _, _, codes, X, _ = self.annees[annee]
+        pos = np.flatnonzero(codes == pays)
+        if not len(pos):
+            raise ValueError(f"Aucune donnée pour {pays} en {annee}")
+        return X[pos[0]]
+
+    def pairs(self, pays, k=5, annee=end_year):
+        """
+        Les k pays les plus proches de `pays` la même année.
+        """
+        x = self._vecteur(pays, annee)
+        _, arbre, codes, _, notes = self.annees[annee]
+        dist, idx = arbre.query(x[None, :], k=min(k + 1, len(codes)))
+        dist, idx = dist[0], idx[0]
+        garde = codes[idx] != pays
+        res = pd.DataFrame({"Pays": codes[idx][garde], "Annee": annee, "Distance": dist[garde]})
+        if notes is not None:
+            res["Rating_modele"] = notes[idx][garde]
+        return res.head(k).reset_index(drop=True)
+
+    def analogues(self, pays, k=5, annee=end_year, autres_pays=True):
+        """
+        Les k pays-années les plus proches de `pays` en `annee`, toutes années confondues.
+        autres_pays=False autorise les années passées du même pays.
+        """
+        x = self._vecteur(pays, annee)
+        n = len(self.lignes_global)
+        k_requete = min(n, k + (len(self.annees) if autres_pays else 1))
+        dist, idx = self.arbre_global.query(x[None, :], k=k_requete)
+        res = self.lignes_global.iloc[idx[0]].assign(Distance=dist[0])
+        if autres_pays:
+            res = res[res["Pays"] != pays]
+        else:
+            res = res[~((res["Pays"] == pays) & (res["Annee"] == annee))]
+        return res.head(k).reset_index(drop=True)
+
+_index_pairs = IndexPairs()
+
+def index_pairs():
+    """
+    Index des pays comparables, mis à jour (incrémentalement) si la notation a changé.
+    """
+    cle, df_z = stage_rating_annees()
+    _index_pairs.mettre_a_jour(cle, df_z)
+    return _index_pairs
+
+def pays_comparables(pays, k=5, annee=end_year):
+    return index_pairs().pairs(pays, k, annee)
+
+def analogues_historiques(pays, k=5, annee=end_year, autres_pays=True):
+    return index_pairs().analogues(pays, k, annee, autres_pays)
+
+
+# ===================== GROUPES DE RISQUE (clustering) =====================
+
+variables_structurelles = ["Monnaie_reserve", "Safe_haven", "Euro_core", "Developpe", "Ressources_naturelles"]
+n_clusters = 6
+
+def _clusters(df_z, k):
+    """
+    MiniBatchKMeans sur Z-scores + variables structurelles de tous les pays-années.
+    Les groupes sont numérotés 1..k par score de solvabilité moyen décroissant.
+    """
+    cols = [f + "_z" for f in all_features] + variables_structurelles
+    X = df_z[cols].to_numpy(dtype=float)
 
-    df_ref = df_ref.merge(df_ag, on="Pays", how="left")
-    df_ref["Model_num"] = df_ref["Rating_modele"].map(rating_to_num)
-    df_ref["Ecart_model_vs_agences"] = df_ref["Model_num"] - df_ref["Moyenne_agences_num"]
+    km = MiniBatchKMeans(n_clusters=k, batch_size=1024, n_init=3, random_state=0)
+    labels = km.fit_predict(X)
 
-    fig, ax = plt.subplots(figsize=(10,6))
+    # un groupe vide (possible avec MiniBatchKMeans) reçoit les derniers numéros
+    ordre = (
+        pd.Series(df_z["Score_solvabilite"].to_numpy()).groupby(labels).mean()
+        .reindex(np.arange(k)).sort_values(ascending=False, na_position="last").index
+    )
+    renum = np.full(k, -1)
+    renum[ordre.to_numpy()] = np.arange(1, k + 1)
+
+    membres = df_z[["Pays", "Annee", "Score_solvabilite", "Rating_modele"]].copy()
+    membres["Cluster"] = renum[labels]
+    membres["Distance_centroide"] = np.linalg.norm(X - km.cluster_centers_[labels], axis=1)
+
+    centroides = pd.DataFrame(km.cluster_centers_, columns=cols)
+    centroides.insert(0, "Cluster", renum[np.arange(k)])
+    centroides["Score_moyen"] = membres.groupby("Cluster")["Score_solvabilite"].mean().reindex(centroides["Cluster"]).to_numpy()
+    centroides = centroides.sort_values("Cluster").reset_index(drop=True)
+
+    return {"membres": membres.reset_index(drop=True), "centroides": centroides}
+
+def _stage_clusters():
+    cle, df_z = stage_rating_annees()
+    return stage(
+        "clusters",
+        [cle, n_clusters, variables_structurelles, version_code(_clusters)],
+        lambda: _clusters(df_z, n_clusters),
+    )[1]
+
+def clusters_pays():
+    """
+    Groupe de risque de chaque pays-année (Pays, Annee, Cluster, Distance_centroide...).
+    """
+    return _stage_clusters()["membres"]
+
+def centroides_clusters():
+    """
+    Profil moyen (Z-scores, variables structurelles, score) de chaque groupe.
+    """
+    return _stage_clusters()["centroides"]
+
+def migrations_clusters():
+    """
+    Changements de groupe d'une année à l'autre : Pays, Annee, De, Vers.
+    """
+    m = clusters_pays().sort_values(["Pays", "Annee"])
+    precedent = m.groupby("Pays")["Cluster"].shift()
+    change = precedent.notna() & (precedent != m["Cluster"])
+    return pd.DataFrame({
+        "Pays": m.loc[change, "Pays"],
+        "Annee": m.loc[change, "Annee"],
+        "De": precedent[change].astype(int),
+        "Vers": m.loc[change, "Cluster"],
+    }).reset_index(drop=True)
+
+def pays_du_cluster(pays, annee=end_year):
+    """
+    Pays appartenant au même groupe que `pays` en `annee` (hors `pays`).
+    """
+    m = clusters_pays()
+    m = m[m["Annee"] == annee]
+    ligne = m[m["Pays"] == pays]
+    if ligne.empty:
+        raise ValueError(f"Aucun groupe pour {pays} en {annee}")
+    cluster = ligne["Cluster"].iloc[0]
+    return cluster, m[(m["Cluster"] == cluster) & (m["Pays"] != pays)].sort_values(
+        "Score_solvabilite", ascending=False
+    ).reset_index(drop=True)
+
+# ===================== NOTES DES AGENCES =====================
+
+def _lire_notes_agences(path):
+    """
+    Fichier long des actions de notation → une ligne par pays de l'univers
+    (dernière note et date par agence, équivalents numériques, moyenne).
+    Une action sans date (NaT) est plus ancienne que toute action datée ; à
+    date égale, la dernière ligne du fichier l'emporte.
+    """
+    df = pd.read_csv(path, dtype={"Note": str})
+    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+    df = (df.sort_values("Date", kind="stable", na_position="first")
+            .groupby(["Pays", "Agence"]).tail(1)
+            .set_index(["Pays", "Agence"]))
+
+    notes = df["Note"].unstack("Agence").reindex(columns=agences)
+    dates = df["Date"].unstack("Agence").reindex(columns=agences).add_suffix("_date")
+
+    univers = sorted(set(mapping_imf_to_iso.values()) | set(notes.index))
+    df_ag = notes.join(dates).reindex(univers)
+    df_ag.index.name = "Pays"
+    df_ag.columns.name = None
+
+    for agency in agences:
+        df_ag[f"{agency}_num"] = notes_en_num(df_ag[agency])
+    df_ag["Moyenne_agences_num"] = df_ag[[f"{a}_num" for a in agences]].mean(axis=1)
+
+    return df_ag
+
+def notes_agences(path: str = data_agences_path):
+    """
+    Notes des agences indexées par code ISO3 (tout l'univers, NaN si non noté).
+    Rechargé automatiquement quand le fichier change.
+    """
+    empreinte, chemin = source_figee(path)
+    return stage(
+        "notes_agences",
+        [empreinte, agences, rating_to_num, version_code(_lire_notes_agences)],
+        lambda: _lire_notes_agences(chemin),
+    )[1]
+
+def notes_pays(pays, path: str = data_agences_path):
+    """
+    {agence: note} pour un pays ("N/A" si l'agence ne le note pas).
+    """
+    df_ag = notes_agences(path)
+    if pays not in df_ag.index:
+        return {agency: "N/A" for agency in agences}
+    row = df_ag.loc[pays]
+    return {agency: row[agency] if isinstance(row[agency], str) else "N/A" for agency in agences}
+
+def dates_notes_pays(pays, path: str = data_agences_path):
+    """
+    {agence: date "AAAA-MM-JJ" de la dernière action} pour un pays
+    (None si l'agence ne le note pas ou si la date n'est pas renseignée).
+    """
+    df_ag = notes_agences(path)
+    if pays not in df_ag.index:
+        return {agency: None for agency in agences}
+    row = df_ag.loc[pays]
+    return {agency: None if pd.isna(row[f"{agency}_date"]) else row[f"{agency}_date"].strftime("%Y-%m-%d")
+            for agency in agences}
+
+def compare_agencies_ratings():
+    """
+    Écart entre la note du modèle et la moyenne des agences,
+    pour tous les pays notés à la fois par le modèle et par au moins une agence.
+    """
+    df_ag = notes_agences()
+
+    df_ref = compute_Zscore().join(df_ag, on="Pays", how="inner")
+    df_ref = df_ref.dropna(subset=["Moyenne_agences_num"])
+    pays_nom = df_ref["Pays"].map(iso3_to_name).fillna(df_ref["Pays"])
+    ecart = notes_en_num(df_ref["Rating_modele"]) - df_ref["Moyenne_agences_num"]
+    df_ref = pd.DataFrame({"Pays_nom": pays_nom, "Ecart_model_vs_agences": ecart})
+
+    fig = Figure(figsize=(max(10, 0.35 * len(df_ref)), 6))
+
+    ax = fig.subplots()
 
     ax.bar(df_ref["Pays_nom"], df_ref["Ecart_model_vs_agences"], color="skyblue")
     ax.axhline(0, color="black", linewidth=0.8)
     ax.set_xticks(range(len(df_ref)))
     ax.set_xticklabels(df_ref["Pays_nom"], rotation=45)
     ax.set_ylabel("Écart (score modèle – moyenne agences)")
-    ax.set_title("Écart de notation : modèle vs moyenne des agences (2024)")
+    ax.set_title(f"Écart de notation : modèle vs moyenne des agences ({end_year})")
     fig.tight_layout()
 
     return fig
 
-def radar_country(country_iso3):
+def radar_country(country_iso3, df=None):
     """
     Affiche 2 radars (macro + institutionnel) pour un pays ISO3
     avec conversion z-score → note /10.
+
+    df : résultat de historique_Zscore() déjà chargé par l'appelant (optionnel).
     """
     # ------------------------------------------------------------
     # 0. Colonnes utilisées
@@ -631,7 +2166,8 @@ def radar_country(country_iso3):
     # ------------------------------------------------------------
     # 1. Charger dernière année
     # ------------------------------------------------------------
-    df = countries10_Zscore().copy()
+    if df is None:
+        df = historique_Zscore()
     df = df[df["Annee"] == df["Annee"].max()].set_index("Pays")
 
     if country_iso3 not in df.index:
@@ -639,6 +2175,17 @@ def radar_country(country_iso3):
 
     row = df.loc[country_iso3]
 
+    # Contribution au score de chaque axe (table d'attribution)
+    try:
+        contrib = contributions_pays(country_iso3)
+    except ValueError:
+        contrib = pd.Series(dtype=float)
+
+    def libelle(c):
+        if c[:-2] not in contrib.index:
+            return c
+        return f"{c}\n({contrib[c[:-2]]:+.2f} pt)"
+
     # ------------------------------------------------------------
     # 2. Fonction de conversion z → score/10 (interne)
     # ------------------------------------------------------------
@@ -664,10 +2211,8 @@ def radar_country(country_iso3):
     # ------------------------------------------------------------
     # 5. FIGURE : 2 radars côte à côte
     # ------------------------------------------------------------
-    fig, axes = plt.subplots(
-        1, 2, figsize=(13, 6),
-        subplot_kw=dict(polar=True)
-    )
+    fig = Figure(figsize=(13, 6))
+    axes = fig.subplots(1, 2, subplot_kw=dict(polar=True))
 
     ax_macro, ax_instit = axes
 
@@ -675,7 +2220,7 @@ def radar_country(country_iso3):
     ax_macro.plot(macro_angles, macro_vals)
     ax_macro.fill(macro_angles, macro_vals, alpha=0.2)
     ax_macro.set_xticks(macro_angles[:-1])
-    ax_macro.set_xticklabels(MACRO_COLS, fontsize=8)
+    ax_macro.set_xticklabels([libelle(c) for c in MACRO_COLS], fontsize=8)
     ax_macro.set_title(f"Radar Macro – {country_iso3}")
     ax_macro.set_yticks([0, 2, 4, 6, 8, 10])
     ax_macro.set_ylim(0, 10)
@@ -684,12 +2229,31 @@ def radar_country(country_iso3):
     ax_instit.plot(instit_angles, instit_vals)
     ax_instit.fill(instit_angles, instit_vals, alpha=0.2)
     ax_instit.set_xticks(instit_angles[:-1])
-    ax_instit.set_xticklabels(INSTIT_COLS, fontsize=8)
+    ax_instit.set_xticklabels([libelle(c) for c in INSTIT_COLS], fontsize=8)
     ax_instit.set_title(f"Radar Institutionnel – {country_iso3}")
     ax_instit.set_yticks([0, 2, 4, 6, 8, 10])
     ax_instit.set_ylim(0, 10)
 
-    plt.tight_layout()
+    fig.tight_layout()
+    return fig
+
+def plot_attribution(pays):
+    """
+    Barres horizontales des contributions au score de `pays` (poids × Z-score et bonus).
+    """
+    contrib = contributions_pays(pays)
+    contrib = contrib[contrib != 0].sort_values()
+
+    fig = Figure(figsize=(8, max(3, 0.35 * len(contrib))))
+
+    ax = fig.subplots()
+    ax.barh(contrib.index, contrib.to_numpy(),
+            color=np.where(contrib.to_numpy() >= 0, "seagreen", "indianred"))
+    ax.axvline(0, color="black", linewidth=0.8)
+    ax.set_xlabel("Contribution au score de solvabilité")
+    ax.set_title(f"Décomposition du score – {pays} ({end_year}) : {contrib.sum():.2f}")
+    ax.grid(axis="x", alpha=0.3, linestyle="--")
+    fig.tight_layout()
     return fig
 
 
@@ -704,68 +2268,96 @@ valid_indicators = [
     "Volatilite_Croissance", "Volatilite_Inflation"
 ]
 
-def time_series(indicator, countries=None):
+def _pivot_indicateur(df, indicator):
+    df = df[(df["Annee"] >= annee_debut_historique) & (df["Annee"] <= end_year)]
+    mat = df.pivot_table(index="Annee", columns="Pays", values=indicator, aggfunc="first", dropna=False)
+    mat.index = mat.index.astype(int)
+    return mat.sort_index()
 
+def panel_indicateur(indicator):
+    """
+    Matrice année × pays d'un indicateur sur l'historique 1984–2024 (mise en cache par indicateur).
+    """
     if indicator not in valid_indicators:
         raise ValueError(f"Indicateur '{indicator}' non valide.")
+    cle_hist, df = stage_historique()
+    if indicator not in df.columns:
+        df = df.assign(**{indicator: np.nan})
+    return stage(
+        "pivot",
+        [cle_hist, indicator, version_code(_pivot_indicateur)],
+        lambda: _pivot_indicateur(df, indicator),
+    )[1]
+
+def time_series(indicator, countries=None, bandes=False, max_points=2000):
+    """
+    Séries d'un indicateur pour `countries` (tous les pays par défaut), tracées
+    en un seul appel à partir de la matrice année × pays.
 
-    # Charger les données complètes
-    df = countries10_Zscore()
-    df.columns = df.columns.str.strip()
-    df["Annee"] = df["Annee"].astype(int)
-    df["Pays"] = df["Pays"].str.strip()
-
-    # Filtre années
-    df = df[(df["Annee"] >= 1984) & (df["Annee"] <= 2024)].copy()
+    bandes : ajoute la médiane et l'intervalle interquartile des pays tracés.
+    max_points : au-delà de ce nombre de points (années × pays), les années
+    sont sous-échantillonnées et les marqueurs retirés.
+    """
+    mat = panel_indicateur(indicator)
 
     # Liste de pays
-    if countries is None:
-        country_list = sorted(df["Pays"].unique())
-    else:
-        country_list = [c for c in countries if c in df["Pays"].unique()]
+    if countries is not None:
+        mat = mat[[c for c in countries if c in mat.columns]]
+    mat = mat.loc[:, mat.notna().any(axis=0)]
 
-    years = sorted(df["Annee"].unique())
+    if mat.empty:
+        raise ValueError(f"Aucune donnée disponible pour l'indicateur {indicator}")
 
-    # --- création du graphique ---
-    fig, ax = plt.subplots(figsize=(10, 6))
+    years = list(mat.index)
 
-    plotted_any = False
-    for country in country_list:
-        ser = (
-            df[df["Pays"] == country][["Annee", indicator]]
-            .drop_duplicates("Annee")
-            .set_index("Annee")[indicator]
-            .reindex(years)
-        )
-
-        if ser.dropna().empty:
-            continue
+    # Réduction du nombre de points quand beaucoup de séries sont tracées
+    pas = max(1, int(np.ceil(mat.size / max_points)))
+    if pas > 1:
+        garde = np.zeros(len(mat), dtype=bool)
+        garde[::pas] = True
+        garde[-1] = True
+        mat_trace = mat[garde]
+    else:
+        mat_trace = mat
+    nombreux = mat.shape[1] > 12
 
-        ax.plot(years, ser, marker="o", linewidth=1, label=country)
-        plotted_any = True
+    # --- création du graphique ---
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+
+    ax.plot(
+        mat_trace.index, mat_trace.to_numpy(),
+        marker=None if nombreux or pas > 1 else "o",
+        linewidth=0.6 if nombreux else 1,
+        alpha=0.5 if bandes or nombreux else 1,
+        label=list(mat_trace.columns),
+    )
 
-    if not plotted_any:
-        raise ValueError(f"Aucune donnée disponible pour l'indicateur {indicator}")
+    if bandes:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # années sans aucune donnée
+            q25, med, q75 = np.nanpercentile(mat.to_numpy(), [25, 50, 75], axis=1)
+        ax.fill_between(years, q25, q75, color="grey", alpha=0.25, label="Q1–Q3")
+        ax.plot(years, med, color="black", linewidth=2, label="Médiane")
 
     # Mise en forme
-    ax.set_title(f"{indicator} — 1984–2024", fontsize=14)
+    ax.set_title(f"{indicator} — {annee_debut_historique}–{end_year}", fontsize=14)
     ax.set_xlabel("Année")
     ax.set_ylabel(indicator)
     ax.set_xticks(years[::2])
     ax.tick_params(axis="x", rotation=45)
     ax.grid(alpha=0.3, linestyle="--")
-    ax.legend(fontsize=7, ncol=2)
+    if mat.shape[1] <= 20:
+        ax.legend(fontsize=7, ncol=2)
+    elif bandes:
+        handles, labels = ax.get_legend_handles_labels()
+        ax.legend(handles[-2:], labels[-2:], fontsize=7)
     fig.tight_layout()
 
     return fig
 
-@st.cache_data(show_spinner=True)
-def compute_slopes():
-    """
-    Calcule les pentes (tendances) macro pour chaque pays
-    à partir des séries historiques 1984–2024.
-    """
-    df = df_10countries().copy()
+def _pentes(df):
+    df = df.copy()
     df["Annee"] = df["Annee"].astype(int)
 
     slopes = []
@@ -790,70 +2382,165 @@ def compute_slopes():
 
     return pd.DataFrame(slopes)
 
-def compute_outlook(row):
+def stage_pentes():
+    cle_hist, df = stage_historique()
+    return stage("pentes", [cle_hist, version_code(_pentes)], lambda: _pentes(df))
+
+def compute_slopes():
+    """
+    Calcule les pentes (tendances) macro pour chaque pays
+    à partir des séries historiques 1984–2024.
+    """
+    return stage_pentes()[1]
+
+# ===================== OUTLOOK DU MODÈLE (règles) =====================
+
+# Règles évaluées dans l'ordre : la première dont toutes les conditions sont
+# vraies donne l'outlook ("Stable" si aucune). Une condition (colonne, op, seuil)
+# sur une colonne absente vaut comme si la colonne était à 0 ; une valeur NaN
+# rend la condition fausse. Les colonnes "slope_X" sont les pentes de X.
+regles_outlook = [
+    {"nom": "Dette publique > 140 % du PIB", "outlook": "Negative",
+     "conditions": [("Dette_publique_PIB", ">", 140)]},
+    {"nom": "Inflation > 50 %", "outlook": "Negative",
+     "conditions": [("Inflation", ">", 50)]},
+    {"nom": "Croissance en hausse, dette en baisse, réserves en hausse", "outlook": "Positive",
+     "conditions": [("slope_Croissance_PIB", ">", 0.03),
+                    ("slope_Dette_publique_PIB", "<", -0.5),
+                    ("slope_Reserves_sur_Importations", ">", 0)]},
+    {"nom": "Croissance en baisse, dette et inflation en hausse", "outlook": "Negative",
+     "conditions": [("slope_Croissance_PIB", "<", -0.01),
+                    ("slope_Dette_publique_PIB", ">", 0.5),
+                    ("slope_Inflation", ">", 0.5)]},
+]
+
+# Règles ajoutées après celles du modèle quand l'outlook IMF est combiné
+regles_outlook_imf = [
+    {"nom": "Outlook IMF négatif", "outlook": "Negative",
+     "conditions": [("Score_outlook_imf", "<", -0.20)]},
+    {"nom": "Outlook IMF positif", "outlook": "Positive",
+     "conditions": [("Score_outlook_imf", ">", 0.20)]},
+]
+
+# Pente des indicateurs "slope_X" sur le panel : fenêtre expansive (depuis la première année)
+pente_outlook = {"calcul": "slope", "fenetre": None, "min_periods": 2}
+
+_operateurs = {">": np.greater, "<": np.less, ">=": np.greater_equal, "<=": np.less_equal}
+
+def evaluer_outlook(df, regles=None):
+    """
+    Outlook de toutes les lignes de df en une passe : colonnes Outlook et
+    Regle_outlook (nom de la règle appliquée, "Aucune règle" sinon).
+    """
+    regles = regles_outlook if regles is None else regles
+    conditions = []
+    for regle in regles:
+        ok = np.ones(len(df), dtype=bool)
+        for col, op, seuil in regle["conditions"]:
+            x = df[col].to_numpy(dtype=float) if col in df.columns else np.zeros(len(df))
+            with np.errstate(invalid="ignore"):
+                ok &= _operateurs[op](x, seuil)
+        conditions.append(ok)
+    return pd.DataFrame({
+        "Outlook": np.select(conditions, [r["outlook"] for r in regles], default="Stable"),
+        "Regle_outlook": np.select(conditions, [r["nom"] for r in regles], default="Aucune règle"),
+    }, index=df.index)
+
+def _colonnes_pentes(regles):
+    return sorted({c for r in regles for c, _, _ in r["conditions"] if c.startswith("slope_")})
+
+def _outlooks_panel(df_feat):
+    """
+    Panel Pays/Annee → niveaux et pentes utilisés par les règles + outlook de chaque ligne.
+    """
+    df = df_feat.sort_values(["Pays", "Annee"]).reset_index(drop=True)
+    pentes = _colonnes_pentes(regles_outlook)
+    niveaux = sorted({c for r in regles_outlook for c, _, _ in r["conditions"]
+                      if not c.startswith("slope_") and c in df.columns})
+    g = _Groupes(df)
+    res = df[["Pays", "Annee"] + niveaux].assign(**{
+        col: _stat_glissante(g, df[col[len("slope_"):]].to_numpy(dtype=float), pente_outlook)
+        for col in pentes if col[len("slope_"):] in df.columns
+    })
+    return res.join(evaluer_outlook(res))
+
+def stage_outlooks():
+    cle_feat, df_feat = stage_features()
+    return stage(
+        "outlooks",
+        [cle_feat, regles_outlook, pente_outlook,
+         version_code(_outlooks_panel, evaluer_outlook, _colonnes_pentes, _stat_glissante, _Groupes)],
+        lambda: _outlooks_panel(df_feat),
+    )
+
+def outlooks_annuels():
     """
-    Détermine l'outlook souverain selon quelques règles simples.
+    Outlook du modèle pour chaque pays et chaque année du panel
+    (pentes calculées depuis la première année jusqu'à l'année considérée).
     """
-    # seuils critiques
-    if row.get("Dette_publique_PIB", 0) > 140:
-        return "Negative"
-    if row.get("Inflation", 0) > 50:
-        return "Negative"
+    return stage_outlooks()[1][["Pays", "Annee", "Outlook", "Regle_outlook"]]
 
-    g = row.get("slope_Croissance_PIB", 0)
-    d = row.get("slope_Dette_publique_PIB", 0)
-    i = row.get("slope_Inflation", 0)
-    r = row.get("slope_Reserves_sur_Importations", 0)
+def outlooks_pays(avec_imf=False):
+    """
+    Outlook du modèle de tous les pays pour end_year : Pays, Annee, Outlook, Regle_outlook.
+
+    Les pentes viennent de l'historique long 1984–2024 (compute_slopes) quand il
+    existe pour le pays, sinon du panel du modèle. avec_imf : ajoute
+    Score_outlook_imf et les règles regles_outlook_imf après celles du modèle.
+    """
+    df = stage_outlooks()[1]
+    df = df[df["Annee"] == end_year].set_index("Pays")
+    historique = compute_slopes().set_index("Pays").reindex(df.index)
+    pentes = [c for c in _colonnes_pentes(regles_outlook) if c in df.columns and c in historique.columns]
+    df = df.assign(**{c: historique[c].combine_first(df[c]) for c in pentes})
+
+    regles = regles_outlook
+    if avec_imf:
+        try:
+            imf = outlook_imf_scores().set_index("CountryCode")["Score_outlook_imf"]
+        except FileNotFoundError:
+            imf = pd.Series(dtype=float)
+        df = df.assign(Score_outlook_imf=imf.reindex(df.index))
+        regles = regles_outlook + regles_outlook_imf
 
-    # règles heuristiques
-    if g > 0.03 and d < -0.5 and r > 0:
-        return "Positive"
-    if g < -0.01 and d > 0.5 and i > 0.5:
-        return "Negative"
+    df = df.drop(columns=["Outlook", "Regle_outlook"]).join(evaluer_outlook(df, regles))
+    return df.reset_index()
 
-    return "Stable"
+def compute_outlook(row):
+    """
+    Détermine l'outlook souverain d'une seule ligne (dict) selon regles_outlook.
+    """
+    cols = {c for r in regles_outlook for c, _, _ in r["conditions"]}
+    ligne = pd.DataFrame([{c: row.get(c, 0) for c in cols}], dtype=float)
+    return evaluer_outlook(ligne)["Outlook"].iloc[0]
 
 def make_comment(row):
     """
     Produit un commentaire automatique type agence :
     score, rating, outlook, points forts, points faibles.
+    Points forts / faibles : plus grande et plus petite contribution au score
+    (table d'attribution).
     """
     score = row.get("Score_solvabilite", np.nan)
     rating = row.get("Rating_modele", "N/A")
     outlook = row.get("outlook", "N/A")
 
-    pillars = {
-        "Croissance_PIB_z": row.get("Croissance_PIB_z", np.nan),
-        "PIB_par_habitant_z": row.get("PIB_par_habitant_z", np.nan),
-        "Dette_publique_PIB_z": row.get("Dette_publique_PIB_z", np.nan),
-        "Inflation_z": row.get("Inflation_z", np.nan),
-        "BalanceCourante_PIB_z": row.get("BalanceCourante_PIB_z", np.nan),
-        "Efficacite_Gouvernement_z": row.get("Efficacite_Gouvernement_z", np.nan),
-    }
-
-    # Top 1 et Bottom 1
-    sorted_p = sorted(
-        pillars.items(),
-        key=lambda x: np.nan_to_num(x[1], nan=-999),
-        reverse=True
-    )
+    try:
+        contrib = contributions_pays(row.get("Pays"))
+    except ValueError:
+        return "Décomposition du score indisponible pour ce pays."
 
-    best = sorted_p[0]
-    worst = sorted_p[-1]
+    best = (contrib.index[0], contrib.iloc[0])
+    worst = (contrib.index[-1], contrib.iloc[-1])
 
     return (
         # f"Score final : {score:.2f} ({rating}, outlook {outlook}). "
-        f"Point fort : {best[0]} ({best[1]:.2f}). "
-        f"Point faible : {worst[0]} ({worst[1]:.2f})."
+        f"Point fort : {best[0]} ({best[1]:+.2f} pt de score). "
+        f"Point faible : {worst[0]} ({worst[1]:+.2f} pt de score)."
     )
 
 
-@st.cache_data(show_spinner=True)
-def _load_outlook_imf_panel(excel_path: str = data_imf_path):
-    """
-    Charge le fichier IMF Outlook et renvoie le panel CountryCode / COUNTRY / Annee / variables.
-    Cette fonction est cachée et réutilisée grâce au cache Streamlit.
-    """
+def _lire_outlook_imf_panel(excel_path):
     df_raw = pd.read_excel(excel_path)
 
     # Colonnes d'années
@@ -898,6 +2585,74 @@ def _load_outlook_imf_panel(excel_path: str = data_imf_path):
     df_panel = df_panel.sort_values(["CountryCode", "Annee"])
     return df_panel
 
+def _load_outlook_imf_panel(excel_path: str = data_imf_path):
+    """
+    Charge le fichier IMF Outlook et renvoie le panel CountryCode / COUNTRY / Annee / variables.
+    Le résultat est mis en cache sous l'empreinte du fichier : il est relu dès que le fichier change.
+    """
+    empreinte, chemin = source_figee(excel_path)
+    return stage(
+        "outlook_imf",
+        [empreinte, version_code(_lire_outlook_imf_panel)],
+        lambda: _lire_outlook_imf_panel(chemin),
+    )[1]
+
+# ---------- paramètres / mappings Outlook IMF ----------
+indicators_weights = {
+    "Solde_budgetaire_PIB":   +0.35,
+    "Dette_publique_PIB":     -0.20,
+    "Epargne_nationale_PIB":  +0.10,
+    "BalanceCourante_PIB":    +0.10,
+    "Croissance_PIB":         +0.10,
+    "Inflation_CPI":          -0.07,
+    "Taux_chomage":           -0.08
+}
+
+def _slope_last_years(series, n=5):
+    s = series.dropna()
+    if len(s) < n:
+        return np.nan
+    y = s.tail(n).values
+    x = np.arange(len(y))
+    return np.polyfit(x, y, 1)[0]
+
+def classify_outlook(score):
+    if score > 0.20:
+        return "POSITIVE"
+    elif score < -0.20:
+        return "NEGATIVE"
+    return "STABLE"
+
+def _score_outlook_pays(df_c):
+    """
+    Score d'outlook IMF d'un pays (df_c indexé par Annee, trié).
+    """
+    outlook_score = 0.0
+    for ind, weight in indicators_weights.items():
+        if ind not in df_c.columns:
+            continue
+        slope = _slope_last_years(df_c[ind], 5)
+        if not np.isnan(slope):
+            outlook_score += slope * weight
+    return outlook_score
+
+def outlook_imf_scores(excel_path: str = data_imf_path):
+    """
+    Score et classe d'outlook IMF pour tous les pays du fichier Outlook.
+    Colonnes : CountryCode, Score_outlook_imf, Outlook_imf.
+    """
+    df_panel = _load_outlook_imf_panel(excel_path)
+    scores = {
+        code: _score_outlook_pays(df_c.set_index("Annee").sort_index())
+        for code, df_c in df_panel.groupby("CountryCode")
+    }
+    df_scores = pd.DataFrame({
+        "CountryCode": list(scores.keys()),
+        "Score_outlook_imf": list(scores.values()),
+    })
+    df_scores["Outlook_imf"] = df_scores["Score_outlook_imf"].map(classify_outlook)
+    return df_scores
+
 def outlook_imf(country_code: str, excel_path: str = data_imf_path):
     """
     Calcule l'outlook IMF pour un pays (code ISO3/IMF, ex 'USA', 'FRA')
@@ -906,17 +2661,6 @@ def outlook_imf(country_code: str, excel_path: str = data_imf_path):
     Retourne :
         fig_dette, fig_epargne, fig_autres, outlook_score, outlook_class
     """
-    # ---------- paramètres / mappings ----------
-    indicators_weights = {
-        "Solde_budgetaire_PIB":   +0.35,
-        "Dette_publique_PIB":     -0.20,
-        "Epargne_nationale_PIB":  +0.10,
-        "BalanceCourante_PIB":    +0.10,
-        "Croissance_PIB":         +0.10,
-        "Inflation_CPI":          -0.07,
-        "Taux_chomage":           -0.08
-    }
-
     pretty_names = {
         "Solde_budgetaire_PIB":  "Solde budgétaire (% PIB)",
         "Dette_publique_PIB":    "Dette publique (% PIB)",
@@ -927,27 +2671,11 @@ def outlook_imf(country_code: str, excel_path: str = data_imf_path):
         "Taux_chomage":          "Chômage (%)"
     }
 
-    # helpers internes
-    def slope_last_years(series, n=5):
-        s = series.dropna()
-        if len(s) < n:
-            return np.nan
-        y = s.tail(n).values
-        x = np.arange(len(y))
-        return np.polyfit(x, y, 1)[0]
-
-    def classify_outlook(score):
-        if score > 0.20:
-            return "POSITIVE"
-        elif score < -0.20:
-            return "NEGATIVE"
-        return "STABLE"
-
     # ---------- 1. Chargement du panel via le cache ----------
     df_panel = _load_outlook_imf_panel(excel_path)
 
     # ---------- 2. Filtre sur le pays demandé ----------
-    df_c = df_panel[df_panel["CountryCode"] == country_code].copy()
+    df_c = df_panel[df_panel["CountryCode"] == country_code]
     if df_c.empty:
         raise ValueError(f"Aucune donnée IMF Outlook pour le pays {country_code}")
 
@@ -955,20 +2683,14 @@ def outlook_imf(country_code: str, excel_path: str = data_imf_path):
     country_name = df_c["COUNTRY"].iloc[0]
 
     # ---------- 3. Score d'outlook ----------
-    outlook_score = 0.0
-    for ind, weight in indicators_weights.items():
-        if ind not in df_c.columns:
-            continue
-        slope = slope_last_years(df_c[ind], 5)
-        if not np.isnan(slope):
-            outlook_score += slope * weight
-
+    outlook_score = _score_outlook_pays(df_c)
     outlook_class = classify_outlook(outlook_score)
 
     # ---------- 4. Graphique 1 : dette publique ----------
     fig_dette = None
     if "Dette_publique_PIB" in df_c.columns and not df_c["Dette_publique_PIB"].dropna().empty:
-        fig_dette, ax = plt.subplots(figsize=(8, 5))
+        fig_dette = Figure(figsize=(8, 5))
+        ax = fig_dette.subplots()
         ax.plot(df_c.index, df_c["Dette_publique_PIB"], marker="o")
         ax.set_title(f"{country_name} — Dette publique (% PIB)")
         ax.set_xlabel("Année")
@@ -979,7 +2701,8 @@ def outlook_imf(country_code: str, excel_path: str = data_imf_path):
     # ---------- 5. Graphique 2 : épargne nationale ----------
     fig_epargne = None
     if "Epargne_nationale_PIB" in df_c.columns and not df_c["Epargne_nationale_PIB"].dropna().empty:
-        fig_epargne, ax = plt.subplots(figsize=(8, 5))
+        fig_epargne = Figure(figsize=(8, 5))
+        ax = fig_epargne.subplots()
         ax.plot(df_c.index, df_c["Epargne_nationale_PIB"], marker="o")
         ax.set_title(f"{country_name} — Épargne nationale (% PIB)")
         ax.set_xlabel("Année")
@@ -996,7 +2719,9 @@ def outlook_imf(country_code: str, excel_path: str = data_imf_path):
         "BalanceCourante_PIB"
     ]
 
-    fig_autres, ax = plt.subplots(figsize=(10, 6))
+    fig_autres = Figure(figsize=(10, 6))
+
+    ax = fig_autres.subplots()
     plotted_any = False
     for ind in others:
         if ind in df_c.columns and not df_c[ind].dropna().empty:
@@ -1005,7 +2730,6 @@ def outlook_imf(country_code: str, excel_path: str = data_imf_path):
             plotted_any = True
 
     if not plotted_any:
-        plt.close(fig_autres)
         fig_autres = None
     else:
         ax.set_title(f"{country_name} ({country_code}) — Autres indicateurs Outlook")
@@ -1021,11 +2745,11 @@ def plot_score_distribution():
     Histogramme de la distribution des scores de solvabilité
     pour tous les pays (année la plus récente = end_year).
     """
-    df_model = compute_Zscore().copy()
+    scores = compute_Zscore()["Score_solvabilite"].dropna()
 
-    scores = df_model["Score_solvabilite"].dropna()
+    fig = Figure(figsize=(8, 5))
 
-    fig, ax = plt.subplots(figsize=(8, 5))
+    ax = fig.subplots()
     ax.hist(scores, bins=20)  # tu peux ajuster le nombre de bins
     ax.set_title(f"Distribution des scores de solvabilité ({end_year})")
     ax.set_xlabel("Score de solvabilité")
@@ -1033,4 +2757,734 @@ def plot_score_distribution():
     ax.grid(alpha=0.3, linestyle="--")
     fig.tight_layout()
 
-    return fig
\ No newline at end of file
+    return fig
+
+# ===================== SCORE FACTORIEL (ACP) =====================
+
+# Alternative aux poids choisis à la main : les Z-scores de all_features sont
+# résumés par n_facteurs facteurs latents (SVD randomisée), ce qui regroupe les
+# indicateurs colinéaires (Etat_de_droit, Corruption, Efficacite_Gouvernement...).
+#
+# L'ajustement est incrémental année par année : l'état (S, Vt) de l'année
+# précédente est empilé avec les lignes de l'année, [diag(S)·Vt ; X], puis
+# re-décomposé. Chaque étape est une étape du cache, indexée par l'étape
+# précédente et le contenu de l'année : une année ajoutée ou révisée ne refait
+# que les étapes à partir d'elle. Le coût d'une étape est linéaire dans le
+# nombre d'indicateurs (O(lignes × indicateurs × n_facteurs)).
+#
+# Les Z-scores étant centrés chaque année, aucune correction de moyenne n'est
+# faite. Chaque facteur est orienté dans le sens des poids de poids_score
+# (facteur élevé = meilleure solvabilité). Le score est la somme des facteurs
+# pondérés par leur part de variance ; la note suit la même échelle
+# (percentile de l'année → rating_scale) que Rating_modele.
+
+n_facteurs = 5
+facteurs_marge = 5   # composantes supplémentaires gardées dans l'état entre deux années
+
+def _maj_facteurs(etat, X):
+    """
+    État {"S", "Vt", "total"} + lignes X d'une année → nouvel état.
+    """
+    if etat is None:
+        M, total = X, 0.0
+    else:
+        M, total = np.vstack([etat["S"][:, None] * etat["Vt"], X]), etat["total"]
+    k = min(n_facteurs + facteurs_marge, *M.shape)
+    _, S, Vt = randomized_svd(M, n_components=k, n_iter=4, random_state=0)
+    return {"S": S, "Vt": Vt, "total": total + float(np.square(X).sum())}
+
+def _colonnes_facteurs():
+    return [f + "_z" for f in all_features]
+
+def stage_facteurs():
+    """
+    (cle, état) des facteurs ajustés sur toutes les années du panel noté.
+    """
+    cle_annees, df = stage_rating_annees()
+    cols = _colonnes_facteurs()
+    cle, etat = None, None
+    for annee, bloc in df.groupby("Annee", sort=True):
+        X = bloc[cols].to_numpy(dtype=float)
+        empreinte = hashlib.sha256(X.tobytes()).hexdigest()
+        cle, etat = stage(
+            "facteurs",
+            [cle, int(annee), empreinte, cols, n_facteurs, facteurs_marge, version_code(_maj_facteurs)],
+            lambda: _maj_facteurs(etat, X),
+        )
+    return cle, etat
+
+def _charges_orientees(etat):
+    Vt = etat["Vt"][:n_facteurs]
+    poids = np.array([poids_score.get(c, 0.0) for c in _colonnes_facteurs()])
+    signes = np.where(Vt @ poids < 0, -1.0, 1.0)
+    return Vt * signes[:, None]
+
+def _noter_facteurs(df, etat):
+    Vt = _charges_orientees(etat)
+    S = etat["S"][:n_facteurs]
+    parts = S ** 2 / np.sum(S ** 2)
+    F = df[_colonnes_facteurs()].to_numpy(dtype=float) @ Vt.T
+
+    res = df[["Pays", "Annee", "Rating_modele"]].assign(
+        **{f"F{i + 1}": F[:, i] for i in range(F.shape[1])},
+        Score_facteurs=F @ parts,
+    )
+    res["Score_percentile_facteurs"] = res.groupby("Annee")["Score_facteurs"].rank(pct=True)
+    res["Rating_facteurs"] = pct_en_notes(res["Score_percentile_facteurs"], rating_scale)
+    res["Ecart_crans"] = notes_en_num(res["Rating_facteurs"]) - notes_en_num(res["Rating_modele"])
+    return res
+
+def notes_facteurs():
+    """
+    Score et note du modèle factoriel pour chaque pays-année : facteurs F1..Fk,
+    Score_facteurs, Rating_facteurs et écart en crans avec Rating_modele
+    (positif = note factorielle plus basse).
+    """
+    cle_annees, df = stage_rating_annees()
+    cle_fact, etat = stage_facteurs()
+    return stage(
+        "notes_facteurs",
+        [cle_annees, cle_fact, n_facteurs, poids_score, rating_scale,
+         version_code(_noter_facteurs, _charges_orientees)],
+        lambda: _noter_facteurs(df, etat),
+    )[1]
+
+def charges_facteurs():
+    """
+    Charges (orientées) de chaque indicateur sur les facteurs, et part de la
+    variance totale des Z-scores expliquée par chaque facteur.
+    """
+    _, etat = stage_facteurs()
+    Vt = _charges_orientees(etat)
+    charges = pd.DataFrame(Vt.T, index=pd.Index(all_features, name="Indicateur"),
+                           columns=[f"F{i + 1}" for i in range(len(Vt))])
+    variance = pd.Series(etat["S"][:n_facteurs] ** 2 / etat["total"], index=charges.columns, name="Part_variance")
+    return charges, variance
+
+# ===================== SCREENER =====================
+
+# Recherche de pays sur le panel combiné (une ligne par pays-année) :
+# historique long, sortie du modèle (score, cran de notation), outlook annuel
+# et pentes historiques du pays. Une condition (colonne, op, seuil) est résolue
+# par recherche dichotomique dans les valeurs triées de la colonne (index
+# précalculé) et donne un masque de lignes ; les lignes étant triées par année,
+# une période est une tranche. Les masques sont combinés par ET puis agrégés par pays.
+#
+# Rating_modele se compare en qualité de crédit : ("Rating_modele", ">=", "BBB-")
+# garde les notes BBB- ou meilleures. Outlook accepte "==" et "!=".
+
+_operateurs_screener = {**_operateurs, "==": np.equal, "!=": np.not_equal}
+_inverse_notes = {">": "<", "<": ">", ">=": "<=", "<=": ">=", "==": "==", "!=": "!="}
+
+def _panel_screener(df_hist, df_annees, pentes, outlooks):
+    cle = ["Pays", "Annee"]
+    hist = df_hist.assign(Annee=df_hist["Annee"].astype(int)).set_index(cle)
+    modele = df_annees.assign(Annee=df_annees["Annee"].astype(int)).set_index(cle)
+
+    # valeurs du modèle (priorité IMF) sur ses années, historique ailleurs
+    panel = modele.select_dtypes("number").combine_first(hist.select_dtypes("number"))
+    panel["Rating_cran"] = notes_en_num(modele["Rating_modele"]).reindex(panel.index)
+    panel["Outlook"] = outlooks.assign(Annee=outlooks["Annee"].astype(int)) \
+        .set_index(cle)["Outlook"].reindex(panel.index)
+
+    panel = panel.reset_index().merge(pentes, on="Pays", how="left")
+    return panel.sort_values(["Annee", "Pays"]).reset_index(drop=True)
+
+def stage_screener():
+    cle_hist, df_hist = stage_historique()
+    cle_annees, df_annees = stage_rating_annees()
+    cle_pentes, pentes = stage_pentes()
+    cle_outlooks, outlooks = stage_outlooks()
+    return stage(
+        "screener",
+        [cle_hist, cle_annees, cle_pentes, cle_outlooks, version_code(_panel_screener)],
+        lambda: _panel_screener(df_hist, df_annees, pentes, outlooks[["Pays", "Annee", "Outlook"]]),
+    )
+
+def _conditions_texte(requete):
+    """
+    "Dette_publique_PIB > 90 & slope_Dette_publique_PIB > 0 & Rating_modele >= BBB-"
+    → [(colonne, op, seuil), ...]
+    """
+    conditions = []
+    for morceau in requete.split("&"):
+        m = re.fullmatch(r"\s*([\w$]+)\s*(>=|<=|==|!=|>|<)\s*(.+?)\s*", morceau)
+        if m is None:
+            raise ValueError(f"Condition invalide : {morceau.strip()!r}")
+        col, op, seuil = m.groups()
+        seuil = seuil.strip("\"'")
+        try:
+            seuil = float(seuil)
+        except ValueError:
+            pass
+        conditions.append((col, op, seuil))
+    return conditions
+
+class IndexScreener:
+    """
+    Index du screener : pour chaque colonne numérique, valeurs non manquantes
+    triées et positions des lignes correspondantes ; pour chaque colonne texte,
+    un masque de lignes par valeur. Reconstruit quand le panel change.
+    """
+
+    def __init__(self):
+        self.cle = None
+        self.verrou = threading.Lock()
+
+    def mettre_a_jour(self, cle, df):
+        with self.verrou:
+            if cle == self.cle:
+                return
+            self.df = df
+            self.n = len(df)
+            self.annees = df["Annee"].to_numpy(dtype=int)
+            self.codes_pays, self.pays = np.unique(df["Pays"].to_numpy(dtype=str), return_inverse=True)
+
+            self.tri = {}
+            for col in df.select_dtypes("number").columns.drop("Annee"):
+                x = df[col].to_numpy(dtype=float)
+                pos = np.flatnonzero(~np.isnan(x))
+                ordre = np.argsort(x[pos], kind="stable")
+                self.tri[col] = (x[pos][ordre], pos[ordre])
+
+            self.masques = {}
+            for col in df.select_dtypes(exclude="number").columns.drop("Pays"):
+                valeurs = df[col].to_numpy(dtype=object)
+                renseigne = np.array([isinstance(v, str) for v in valeurs])
+                self.masques[col] = (renseigne, {v: valeurs == v for v in pd.unique(valeurs[renseigne])})
+            self.cle = cle
+
+    def colonnes(self):
+        return sorted(self.tri) + sorted(self.masques) + ["Rating_modele"]
+
+    def _lignes(self, col, op, seuil):
+        if op not in _operateurs_screener:
+            raise ValueError(f"Opérateur inconnu : {op}")
+        if col == "Rating_modele":
+            cran = notes_en_num([seuil])[0]
+            if np.isnan(cran):
+                raise ValueError(f"Note inconnue : {seuil}")
+            col, op, seuil = "Rating_cran", _inverse_notes[op], cran
+
+        if col in self.masques:
+            if op not in ("==", "!="):
+                raise ValueError(f"{col} n'accepte que == et !=")
+            renseigne, par_valeur = self.masques[col]
+            m = par_valeur.get(seuil, np.zeros(self.n, dtype=bool))
+            return m.copy() if op == "==" else renseigne & ~m
+
+        if col not in self.tri:
+            raise ValueError(f"Colonne inconnue : {col}")
+        if isinstance(seuil, str):
+            raise ValueError(f"Seuil numérique attendu pour {col} : {seuil!r}")
+        valeurs, pos = self.tri[col]
+        gauche = np.searchsorted(valeurs, seuil, "left")
+        droite = np.searchsorted(valeurs, seuil, "right")
+        tranche = {">": pos[droite:], ">=": pos[gauche:], "<": pos[:gauche], "<=": pos[:droite],
+                   "==": pos[gauche:droite], "!=": np.concatenate([pos[:gauche], pos[droite:]])}[op]
+        m = np.zeros(self.n, dtype=bool)
+        m[tranche] = True
+        return m
+
+    def filtrer(self, conditions, depuis=None, jusqua=None, mode="any"):
+        """
+        Pays dont les lignes de depuis..jusqua vérifient toutes les conditions :
+        mode "any" (au moins une année), "all" (toutes les années de la période)
+        ou "dernier" (dernière année de la période).
+        """
+        depuis = self.annees[0] if depuis is None else depuis
+        jusqua = self.annees[-1] if jusqua is None else jusqua
+        a, b = np.searchsorted(self.annees, [depuis, jusqua + 1])
+        if mode == "dernier":
+            a = np.searchsorted(self.annees, self.annees[b - 1]) if b > a else b
+
+        m = np.zeros(self.n, dtype=bool)
+        m[a:b] = True
+        for col, op, seuil in conditions:
+            m &= self._lignes(col, op, seuil)
+
+        nb = np.bincount(self.pays[m], minlength=len(self.codes_pays))
+        if mode == "all":
+            garde = (nb > 0) & (nb == np.bincount(self.pays[a:b], minlength=len(self.codes_pays)))
+        elif mode in ("any", "dernier"):
+            garde = nb > 0
+        else:
+            raise ValueError(f"Mode inconnu : {mode}")
+
+        lignes = np.flatnonzero(m & garde[self.pays])
+        # dernière année retenue par pays (lignes triées par année)
+        derniere = np.full(len(self.codes_pays), -1)
+        derniere[self.pays[lignes]] = lignes
+        derniere = derniere[garde]
+
+        cols = list(dict.fromkeys(
+            "Rating_cran" if c == "Rating_modele" else c for c, _, _ in conditions
+        ))
+        res = self.df.iloc[derniere][["Pays", "Annee"] + cols].rename(columns={"Annee": "Derniere_annee"})
+        if "Rating_cran" in res.columns:
+            res = res.assign(Rating_cran=num_en_notes(res["Rating_cran"])).rename(
+                columns={"Rating_cran": "Rating_modele"})
+        annees = pd.Series(self.annees[lignes]).groupby(self.pays[lignes]).agg(
+            lambda a: ", ".join(map(str, a)))
+        res.insert(1, "Pays_nom", res["Pays"].map(iso3_to_name).fillna(res["Pays"]).to_numpy())
+        res.insert(2, "Nb_annees", nb[garde])
+        res.insert(3, "Annees", annees.to_numpy())
+        return res.sort_values("Pays").reset_index(drop=True)
+
+_index_screener = IndexScreener()
+
+def index_screener():
+    """
+    Index du screener, reconstruit si le panel combiné a changé.
+    """
+    cle, df = stage_screener()
+    _index_screener.mettre_a_jour(cle, df)
+    return _index_screener
+
+def screener(conditions, depuis=None, jusqua=None, mode="any"):
+    """
+    Pays vérifiant toutes les `conditions` sur la période depuis..jusqua
+    (par défaut tout l'historique), selon `mode` ("any", "all", "dernier").
+
+    conditions : liste de (colonne, op, seuil) comme les règles d'outlook, ou texte
+    "Dette_publique_PIB > 90 & slope_Dette_publique_PIB > 0 & Rating_modele >= BBB-".
+    """
+    if isinstance(conditions, str):
+        conditions = _conditions_texte(conditions)
+    return index_screener().filtrer(conditions, depuis, jusqua, mode)
+
+# ===================== RENDU DES GRAPHIQUES =====================
+
+# Les graphiques sont construits avec l'API objet de matplotlib (Figure +
+# FigureCanvasAgg), sans l'état global de pyplot : chaque appel a sa propre
+# figure, ce qui permet de les dessiner depuis plusieurs threads et isole les
+# sessions Streamlit les unes des autres. Le dessin et la rastérisation en PNG
+# se font dans un pool dédié : une page à plusieurs graphiques les lance tous,
+# puis affiche les PNG au fur et à mesure.
+#
+# C'est un pool de threads : le dessin Agg garde le GIL pour l'essentiel, donc
+# plusieurs graphiques ne sont pas rastérisés en parallèle sur plusieurs cœurs.
+# Le pool recouvre seulement le rendu avec le travail du thread Streamlit
+# (calculs de la page, envoi des éléments déjà prêts). Un pool de processus
+# devrait recharger ou transmettre les données des étapes à chaque worker,
+# pour un gain inférieur à ce coût sur des graphiques de cette taille.
+
+graphiques_workers = int(os.environ.get("RATING_GRAPHIQUES_WORKERS", min(4, os.cpu_count() or 1)))
+graphiques_dpi = 100
+_pool_graphiques = ThreadPoolExecutor(max_workers=graphiques_workers, thread_name_prefix="graphiques")
+
+def figure_png(fig, dpi=graphiques_dpi):
+    """
+    Figure → PNG (bytes), via un canvas Agg propre à la figure.
+    """
+    FigureCanvasAgg(fig)
+    tampon = io.BytesIO()
+    fig.savefig(tampon, format="png", dpi=dpi)
+    return tampon.getvalue()
+
+def _rasteriser(resultat):
+    if isinstance(resultat, Figure):
+        return figure_png(resultat)
+    if isinstance(resultat, tuple):
+        return tuple(_rasteriser(r) for r in resultat)
+    return resultat
+
+def rendre(fonction, *args, **kwargs):
+    """
+    Lance `fonction(*args, **kwargs)` dans le pool de rendu et renvoie un Future
+    de son résultat, où chaque Figure est remplacée par son PNG. Les exceptions
+    (ValueError, FileNotFoundError...) sont relevées par `.result()`.
+    Le rendu avance pendant que le thread Streamlit continue la page, mais
+    les graphiques d'une même page se partagent le GIL (pool de threads).
+    """
+    return _pool_graphiques.submit(lambda: _rasteriser(fonction(*args, **kwargs)))
+
+# ===================== VINTAGES DES DONNÉES =====================
+
+# Chaque version des données notées (historique_notes_modele : indicateurs,
+# Z-scores, score et cran de notation de chaque pays-année) est conservée dans
+# vintages_dir sous forme de fichier Arrow compressé. Un vintage sur
+# vintage_complet_tous est complet ; les autres ne contiennent que les cellules
+# (Pays, Annee, Variable, Valeur) qui diffèrent du vintage précédent, plus la
+# liste des lignes supprimées. Un nouveau vintage n'est écrit que si les
+# données ont changé.
+#
+# Les vintages ne sont enregistrés qu'à deux moments : par publier_cache, et
+# par la surveillance des sources (rafraichir_source) quand data_path ou une
+# archive WDI/WGI change. L'application ne fait que les lire : une session
+# Streamlit n'enregistre jamais de vintage.
+
+vintages_dir = r"data/vintages"
+vintage_complet_tous = 12
+# Deux valeurs sont identiques si |a - b| <= vintage_atol + vintage_rtol × |b| :
+# les écarts d'arrondi des recalculs ne sont pas des révisions.
+vintage_rtol = 1e-9
+vintage_atol = 1e-12
+
+def _table_vintage(df_annees):
+    """
+    Résultat de historique_notes_modele → table numérique indexée par (Pays, Annee),
+    la note étant convertie en cran (1 = AAA).
+    """
+    cols = [c for c in df_annees.select_dtypes("number").columns if c != "Annee"]
+    table = df_annees[["Pays", "Annee"] + cols].assign(
+        Annee=df_annees["Annee"].astype(int),
+        Rating_cran=notes_en_num(df_annees["Rating_modele"]).to_numpy(),
+    )
+    return table.set_index(["Pays", "Annee"]).sort_index().astype(float)
+
+def _meta_vintage(vid):
+    meta = pa.ipc.open_file(pa.memory_map(os.path.join(vintages_dir, vid + ".arrow"), "r")).schema.metadata
+    return {k.decode(): json.loads(v) for k, v in meta.items()}
+
+def lister_vintages():
+    """
+    Vintages disponibles, du plus ancien au plus récent : id, type, parent, cellules.
+    """
+    if not os.path.isdir(vintages_dir):
+        return pd.DataFrame(columns=["id", "type", "parent", "cellules"])
+    ids = sorted(f[:-len(".arrow")] for f in os.listdir(vintages_dir) if f.endswith(".arrow"))
+    metas = [_meta_vintage(v) for v in ids]
+    return pd.DataFrame({
+        "id": ids,
+        "type": [m["type"] for m in metas],
+        "parent": [m["parent"] for m in metas],
+        "cellules": [m["cellules"] for m in metas],
+    })
+
+def _appliquer_delta(table, delta, meta):
+    """
+    Applique au tableau du vintage parent les cellules modifiées d'un delta.
+    """
+    supprimees = pd.MultiIndex.from_tuples([tuple(l) for l in meta["supprimees"]], names=["Pays", "Annee"])
+    lignes = pd.MultiIndex.from_arrays([delta["Pays"], delta["Annee"]], names=["Pays", "Annee"])
+    index = table.index.difference(supprimees).union(lignes.unique()) if len(lignes) else table.index.difference(supprimees)
+    table = table.reindex(index=index, columns=meta["colonnes"])
+
+    valeurs = table.to_numpy(copy=True)
+    i = table.index.get_indexer(lignes)
+    j = table.columns.get_indexer(delta["Variable"])
+    valeurs[i, j] = delta["Valeur"].to_numpy()
+    return pd.DataFrame(valeurs, index=table.index, columns=table.columns)
+
+@lru_cache(maxsize=8)
+def charger_vintage(vid):
+    """
+    Table complète d'un vintage (reconstruite depuis le dernier vintage complet
+    de sa chaîne). Les fichiers sont immuables : le résultat est mémorisé.
+    """
+    chemin = os.path.join(vintages_dir, vid + ".arrow")
+    if not os.path.exists(chemin):
+        raise ValueError(f"Vintage inconnu : {vid}")
+    meta = _meta_vintage(vid)
+    df = pa.ipc.open_file(pa.memory_map(chemin, "r")).read_all().to_pandas()
+    if meta["type"] == "complet":
+        return df.set_index(["Pays", "Annee"])[meta["colonnes"]]
+    return _appliquer_delta(charger_vintage(meta["parent"]), df, meta)
+
+def _cellules_modifiees(avant, apres):
+    """
+    Cellules de `apres` absentes de `avant` ou de valeur différente au-delà de
+    la tolérance vintage_rtol / vintage_atol (NaN = NaN).
+    Renvoie (Pays, Annee, Variable, Avant, Apres) et les lignes supprimées.
+    """
+    index = apres.index.union(avant.index)
+    colonnes = apres.columns.union(avant.columns, sort=False)
+    a = avant.reindex(index=index, columns=colonnes).to_numpy()
+    b = apres.reindex(index=index, columns=colonnes).to_numpy()
+    lignes_apres = index.isin(apres.index)
+
+    identique = np.isclose(a, b, rtol=vintage_rtol, atol=vintage_atol, equal_nan=True)
+    change = ~identique & lignes_apres[:, None]
+    i, j = np.nonzero(change)
+    cellules = pd.DataFrame({
+        "Pays": index.get_level_values("Pays")[i],
+        "Annee": index.get_level_values("Annee")[i].astype(int),
+        "Variable": colonnes[j],
+        "Avant": a[i, j],
+        "Apres": b[i, j],
+    })
+    return cellules, index[~lignes_apres]
+
+def _ecrire_vintage(vid, table, meta):
+    os.makedirs(vintages_dir, exist_ok=True)
+    meta = {k: json.dumps(v) for k, v in meta.items()}
+    table = pa.Table.from_pandas(table, preserve_index=False).replace_schema_metadata(meta)
+    chemin = os.path.join(vintages_dir, vid + ".arrow")
+    tmp = f"{chemin}.{os.getpid()}.tmp"
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.OSFile(tmp, "wb") as f, pa.ipc.new_file(f, table.schema, options=options) as w:
+        w.write_table(table)
+    os.replace(tmp, chemin)
+
+def enregistrer_vintage():
+    """
+    Enregistre les données notées actuelles comme nouveau vintage si elles
+    diffèrent du dernier vintage ; renvoie l'id du vintage courant.
+    """
+    table = _table_vintage(historique_notes_modele())
+    empreinte = hashlib.sha256(
+        pd.util.hash_pandas_object(table, index=True).to_numpy().tobytes()
+        + "|".join(table.columns).encode()
+    ).hexdigest()[:24]
+
+    os.makedirs(vintages_dir, exist_ok=True)
+    with _VerrouConstruction(os.path.join(vintages_dir, "vintages")):
+        existants = lister_vintages()
+        if len(existants):
+            dernier = existants["id"].iloc[-1]
+            if _meta_vintage(dernier)["empreinte"] == empreinte:
+                return dernier
+
+        vid = time.strftime("%Y%m%d-%H%M%S")
+        while vid in set(existants["id"]):
+            vid += "b"
+        meta = {"empreinte": empreinte, "colonnes": list(table.columns), "supprimees": []}
+
+        depuis_complet = 0
+        for t in existants["type"][::-1]:
+            if t == "complet":
+                break
+            depuis_complet += 1
+
+        if not len(existants) or depuis_complet + 1 >= vintage_complet_tous:
+            meta.update(type="complet", parent="", cellules=int(table.size))
+            _ecrire_vintage(vid, table.reset_index(), meta)
+        else:
+            parent = existants["id"].iloc[-1]
+            cellules, supprimees = _cellules_modifiees(charger_vintage(parent), table)
+            meta.update(type="delta", parent=parent, cellules=len(cellules),
+                        supprimees=[[p, int(a)] for p, a in supprimees])
+            _ecrire_vintage(vid, cellules[["Pays", "Annee", "Variable", "Apres"]].rename(
+                columns={"Apres": "Valeur"}), meta)
+        return vid
+
+def _deux_vintages(avant, apres):
+    ids = list(lister_vintages()["id"])
+    if apres is None:
+        if not ids:
+            raise ValueError("Aucun vintage enregistré")
+        apres = ids[-1]
+    if avant is None:
+        precedents = [v for v in ids if v < apres]
+        if not precedents:
+            raise ValueError(f"Aucun vintage antérieur à {apres}")
+        avant = precedents[-1]
+    return avant, apres
+
+def diff_vintages(avant=None, apres=None):
+    """
+    Cellules modifiées entre deux vintages (par défaut les deux derniers) :
+    Pays, Annee, Variable, Avant, Apres, Ecart.
+    """
+    avant, apres = _deux_vintages(avant, apres)
+    cellules, _ = _cellules_modifiees(charger_vintage(avant), charger_vintage(apres))
+    return cellules.assign(Ecart=cellules["Apres"] - cellules["Avant"])
+
+def changements_notes(avant=None, apres=None, annee=end_year):
+    """
+    Pour chaque pays dont une donnée de l'année `annee` a changé entre deux vintages :
+    notes et scores avant / après, nombre d'indicateurs révisés et terme du
+    score dont la contribution (poids × Z-score) a le plus varié.
+    """
+    avant, apres = _deux_vintages(avant, apres)
+    ta, tb = charger_vintage(avant), charger_vintage(apres)
+    pays = diff_vintages(avant, apres)
+    pays = pays[pays["Annee"] == annee]
+
+    revisions = pays[pays["Variable"].isin(all_features + list(derived_features))]
+    res = pd.DataFrame(index=pd.Index(sorted(pays["Pays"].unique()), name="Pays"))
+    cle = pd.MultiIndex.from_arrays([res.index, np.full(len(res), annee)])
+
+    def valeurs(t, col):
+        if col not in t.columns:
+            return np.full(len(res), np.nan)
+        return t[col].reindex(cle).to_numpy()
+
+    res["Rating_avant"] = num_en_notes(valeurs(ta, "Rating_cran"))
+    res["Rating_apres"] = num_en_notes(valeurs(tb, "Rating_cran"))
+    res["Ecart_crans"] = valeurs(tb, "Rating_cran") - valeurs(ta, "Rating_cran")
+    res["Score_avant"] = valeurs(ta, "Score_solvabilite")
+    res["Score_apres"] = valeurs(tb, "Score_solvabilite")
+    res["Indicateurs_revises"] = revisions.groupby("Pays").size().reindex(res.index, fill_value=0)
+
+    termes = [t for t in poids_score if t.endswith("_z")]
+
+    def variation(t):
+        a, b = valeurs(ta, t), valeurs(tb, t)
+        identique = np.isclose(a, b, rtol=vintage_rtol, atol=vintage_atol, equal_nan=True)
+        return np.where(identique, 0.0, poids_score[t] * (b - a))
+
+    dc = np.nan_to_num(np.column_stack([np.zeros(len(res))] + [variation(t) for t in termes]))
+    # colonne 0 = aucun terme : retenue seulement si aucune contribution n'a bougé
+    principal = np.abs(dc).argmax(axis=1)
+    res["Facteur_principal"] = np.array([None] + [t[:-2] for t in termes], dtype=object)[principal]
+    res["Variation_contribution"] = dc[np.arange(len(res)), principal]
+
+    return res.reset_index().sort_values("Ecart_crans", key=np.abs, ascending=False, na_position="last") \
+        .reset_index(drop=True)
+
+# ===================== PUBLICATION DU CACHE =====================
+
+def _publier_modele():
+    compute_Zscore()
+    historique_notes_modele()
+    notes_prevues()
+    attribution_scores()
+    outlooks_pays()
+    historique_Zscore()
+    compute_slopes()
+    clusters_pays()
+    notes_facteurs()
+    stage_screener()
+    for indicator in valid_indicators:
+        panel_indicateur(indicator)
+
+def _publier_outlook_imf():
+    try:
+        outlook_imf_scores()
+    except FileNotFoundError:
+        pass
+
+def publier_cache():
+    """
+    Construit et publie dans cache_dir toutes les étapes utilisées par l'application,
+    pour que les processus Streamlit démarrent sur des snapshots déjà prêts,
+    puis retire de cache_dir les anciens snapshots (nettoyer_cache) en gardant
+    toutes les clés publiées. Renvoie ces clés.
+    """
+    _cache_collecte.cles = set()
+    try:
+        _publier_modele()
+        notes_agences()
+        _publier_outlook_imf()
+        enregistrer_vintage()
+        publiees = _cache_collecte.cles
+    finally:
+        _cache_collecte.cles = None
+    nettoyer_cache(publiees)
+    return sorted(publiees)
+
+
+# ===================== SURVEILLANCE DES SOURCES =====================
+
+# Quand un fichier source change (nouveau data.csv, outlook_datas.xlsx, ...),
+# seules les étapes qui en dépendent sont reconstruites, dans un thread, sous
+# l'empreinte du nouveau contenu. Pendant ce temps les lecteurs continuent de
+# recevoir les résultats de la version publiée ; l'empreinte publiée n'est
+# basculée qu'une fois la reconstruction terminée (les clés suivantes pointent
+# alors sur des snapshots déjà prêts). Si la reconstruction échoue, l'ancienne
+# version reste servie.
+
+surveillance_delai = 2.0   # secondes sans nouvel évènement avant reconstruction
+
+def _etapes_sources():
+    """
+    Fichier source (chemin absolu) → (étapes à reconstruire, nouveau vintage ?).
+    """
+    etapes = {
+        data_path: (_publier_modele, True),
+        data_imf_path: (_publier_outlook_imf, False),
+        data_agences_path: (notes_agences, False),
+    }
+    etapes.update({p: (_publier_modele, True) for p in wb_archives})
+    return {os.path.abspath(p): e for p, e in etapes.items()}
+
+_rafraichissement_verrou = threading.Lock()
+
+def rafraichir_source(path):
+    """
+    Reconstruit les étapes qui dépendent de `path` pour son contenu actuel,
+    puis publie la nouvelle empreinte. Renvoie la nouvelle empreinte, ou None
+    si rien n'a changé.
+    """
+    chemin = os.path.abspath(path)
+    construire, vintage = _etapes_sources()[chemin]
+    with _rafraichissement_verrou:
+        if not os.path.exists(chemin):
+            _empreintes_publiees.pop(chemin, None)
+            return None
+        ancienne = _empreintes_publiees.get(chemin)
+        nouvelle = _figer_source(chemin)
+        if ancienne == nouvelle:
+            return None
+
+        _empreintes_reconstruction.forcees = {chemin: nouvelle}
+        try:
+            construire()
+        finally:
+            _empreintes_reconstruction.forcees = {}
+        _empreintes_publiees[chemin] = nouvelle
+        # la version précédente peut encore être lue par une construction en cours
+        _retirer_sources_figees(chemin, {nouvelle, ancienne})
+
+        if vintage:
+            enregistrer_vintage()
+        return nouvelle
+
+class _GestionnaireSources(FileSystemEventHandler):
+    """
+    Regroupe les évènements par fichier source (copie en plusieurs écritures,
+    remplacement par renommage) et lance une reconstruction après
+    surveillance_delai secondes de calme.
+    """
+
+    def __init__(self, sources):
+        self.sources = sources
+        self.minuteurs = {}
+        self.verrou = threading.Lock()
+
+    # seuls les évènements qui changent le contenu comptent : une simple
+    # lecture (opened, closed_no_write) ne relance rien
+    def on_modified(self, event):
+        self._evenement(event)
+
+    def on_created(self, event):
+        self._evenement(event)
+
+    def on_moved(self, event):
+        self._evenement(event)
+
+    def _evenement(self, event):
+        for chemin in {event.src_path, getattr(event, "dest_path", "")}:
+            chemin = os.path.abspath(os.fsdecode(chemin)) if chemin else ""
+            if chemin in self.sources:
+                self._planifier(chemin)
+
+    def _planifier(self, chemin):
+        with self.verrou:
+            if chemin in self.minuteurs:
+                self.minuteurs[chemin].cancel()
+            minuteur = threading.Timer(surveillance_delai, self._reconstruire, args=(chemin,))
+            minuteur.daemon = True
+            self.minuteurs[chemin] = minuteur
+            minuteur.start()
+
+    def _reconstruire(self, chemin):
+        try:
+            rafraichir_source(chemin)
+        except Exception as e:
+            warnings.warn(f"Reconstruction après modification de {chemin} abandonnée ({e})")
+
+def surveiller_sources():
+    """
+    Démarre (en arrière-plan) la surveillance des fichiers sources et fige leur
+    contenu actuel comme version publiée. Renvoie l'observer watchdog.
+    """
+    sources = _etapes_sources()
+    for chemin in sources:
+        if os.path.exists(chemin):
+            _empreintes_publiees.setdefault(chemin, _figer_source(chemin))
+
+    gestionnaire = _GestionnaireSources(sources)
+    observer = Observer()
+    for dossier in {os.path.dirname(c) for c in sources}:
+        os.makedirs(dossier, exist_ok=True)
+        observer.schedule(gestionnaire, dossier, recursive=False)
+    observer.daemon = True
+    observer.start()
+    return observer
+
+if __name__ == "__main__":
+    for cle in publier_cache():
+        print(cle)
@@ -0,0 +1,206 @@
+"""
+Service HTTP JSON des notations du modèle (tornado).
+
+Les réponses sont servies depuis un snapshot en mémoire, indexé par code ISO3 :
+chaque pays est sérialisé une seule fois à la construction du snapshot, avec
+son ETag. Aucune opération pandas n'est faite pendant une requête. Le snapshot
+est reconstruit en arrière-plan (POST /refresh ou --refresh N secondes) puis
+remplacé d'un bloc.
+
+    python service_rating.py --port 8888 --refresh 3600
+
+Routes :
+    GET  /ratings               tout l'univers
+    GET  /ratings?pays=FRA,DEU  lot de pays
+    GET  /ratings/FRA           un pays
+    POST /refresh               reconstruction + bascule du snapshot
+"""
+import argparse
+import hashlib
+import json
+import math
+import time
+
+import tornado.ioloop
+import tornado.web
+
+import script_rating as sr
+
+
+# ===================== SNAPSHOT =====================
+
+def _propre(v):
+    """
+    Valeur JSON : NaN → null, types numpy → types Python.
+    """
+    if v is None:
+        return None
+    if hasattr(v, "item"):
+        v = v.item()
+    if isinstance(v, float) and math.isnan(v):
+        return None
+    return v
+
+def _etag(corps):
+    return '"' + hashlib.sha1(corps).hexdigest() + '"'
+
+class Snapshot:
+    """
+    Réponses pré-sérialisées : un document JSON (bytes) et un ETag par pays,
+    plus le document de l'univers complet.
+    """
+
+    def __init__(self, documents):
+        self.version = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.pays = {}
+        for iso3, doc in documents.items():
+            corps = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self.pays[iso3] = (corps, _etag(corps))
+
+        self.univers = self.lot(sorted(self.pays))
+
+    def lot(self, codes):
+        """
+        Document {ISO3: {...}} pour `codes`, assemblé à partir des bytes
+        déjà sérialisés (les codes inconnus sont ignorés).
+        """
+        codes = [c for c in codes if c in self.pays]
+        corps = b"{" + b",".join(b'"' + c.encode() + b'":' + self.pays[c][0] for c in codes) + b"}"
+        return corps, _etag(b"".join(self.pays[c][1].encode() for c in codes))
+
+def construire_snapshot():
+    """
+    Calcule les documents de tous les pays notés par le modèle :
+    notation, score, Z-scores, pentes, outlook du modèle et outlook IMF.
+    """
+    df_model = sr.compute_Zscore()
+    slopes = sr.compute_slopes().set_index("Pays")
+    outlooks = sr.outlooks_pays().set_index("Pays")
+    try:
+        imf = sr.outlook_imf_scores().set_index("CountryCode")
+    except FileNotFoundError:
+        imf = None
+
+    cols_z = [c for c in df_model.columns if c.endswith("_z")]
+    cols_slopes = [c for c in slopes.columns if c.startswith("slope_")]
+
+    documents = {}
+    for row in df_model.to_dict("records"):
+        iso3 = row["Pays"]
+        doc = {
+            "Pays": iso3,
+            "Annee": _propre(row["Annee"]),
+            "Rating_modele": row["Rating_modele"],
+            "Score_solvabilite": _propre(row["Score_solvabilite"]),
+            "Zscores": {c[:-2]: _propre(row[c]) for c in cols_z},
+            "Pentes": None,
+            "Outlook_modele": None,
+            "Outlook_imf": None,
+        }
+        if iso3 in slopes.index:
+            doc["Pentes"] = {c[len("slope_"):]: _propre(slopes.at[iso3, c]) for c in cols_slopes}
+        if iso3 in outlooks.index:
+            doc["Outlook_modele"] = {
+                "outlook": outlooks.at[iso3, "Outlook"],
+                "regle": outlooks.at[iso3, "Regle_outlook"],
+            }
+        if imf is not None and iso3 in imf.index:
+            doc["Outlook_imf"] = {
+                "score": _propre(imf.at[iso3, "Score_outlook_imf"]),
+                "classe": imf.at[iso3, "Outlook_imf"],
+            }
+        documents[iso3] = doc
+
+    return Snapshot(documents)
+
+
+# ===================== HANDLERS =====================
+
+class _BaseHandler(tornado.web.RequestHandler):
+
+    def set_default_headers(self):
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+
+    def compute_etag(self):
+        # ETag pré-calculé dans le snapshot (évite un sha1 du corps par requête)
+        return getattr(self, "_etag_snapshot", None)
+
+    def repondre(self, corps, etag):
+        snapshot = self.application.snapshot
+        self._etag_snapshot = etag
+        self.set_header("X-Snapshot-Version", snapshot.version)
+        self.finish(corps)
+
+    def erreur(self, statut, message):
+        self.set_status(statut)
+        self.finish(json.dumps({"erreur": message}, ensure_ascii=False))
+
+class PaysHandler(_BaseHandler):
+
+    def get(self, iso3):
+        entree = self.application.snapshot.pays.get(iso3.upper())
+        if entree is None:
+            return self.erreur(404, f"Aucune notation pour {iso3.upper()}")
+        self.repondre(*entree)
+
+class UniversHandler(_BaseHandler):
+
+    def get(self):
+        snapshot = self.application.snapshot
+        pays = self.get_argument("pays", None)
+        if pays is None:
+            return self.repondre(*snapshot.univers)
+        codes = [c.strip().upper() for c in pays.split(",") if c.strip()]
+        self.repondre(*snapshot.lot(codes))
+
+class RefreshHandler(_BaseHandler):
+
+    async def post(self):
+        version = await self.application.rafraichir()
+        self.finish(json.dumps({"version": version}))
+
+
+# ===================== APPLICATION =====================
+
+class ServiceRating(tornado.web.Application):
+
+    def __init__(self, snapshot=None):
+        super().__init__([
+            (r"/ratings/([A-Za-z]{3})", PaysHandler),
+            (r"/ratings/?", UniversHandler),
+            (r"/refresh", RefreshHandler),
+        ])
+        self.snapshot = snapshot if snapshot is not None else construire_snapshot()
+        self._refresh_en_cours = None
+
+    async def rafraichir(self):
+        """
+        Reconstruit le snapshot dans un thread puis le remplace d'un bloc :
+        les requêtes en cours continuent sur l'ancien. Un seul refresh à la fois.
+        """
+        if self._refresh_en_cours is None:
+            self._refresh_en_cours = tornado.ioloop.IOLoop.current().run_in_executor(
+                None, construire_snapshot
+            )
+        try:
+            self.snapshot = await self._refresh_en_cours
+        finally:
+            self._refresh_en_cours = None
+        return self.snapshot.version
+
+def main():
+    parser = argparse.ArgumentParser(description="Service JSON des notations du modèle")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--refresh", type=int, default=0,
+                        help="période de reconstruction du snapshot en secondes (0 = jamais)")
+    args = parser.parse_args()
+
+    app = ServiceRating()
+    app.listen(args.port)
+    if args.refresh > 0:
+        tornado.ioloop.PeriodicCallback(app.rafraichir, args.refresh * 1000).start()
+    print(f"Service notations : http://localhost:{args.port}/ratings ({len(app.snapshot.pays)} pays)")
+    tornado.ioloop.IOLoop.current().start()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Notes des agences (_lire_notes_agences, notes_pays, dates_notes_pays) :
+dernière action par agence, dates manquantes, pays non couverts.
+"""
+import pandas as pd
+import pytest
+
+import script_rating as sr
+
+
+@pytest.fixture
+def fichier(tmp_path, monkeypatch):
+    monkeypatch.setattr(sr, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(sr, "_cache_memoire", sr.OrderedDict())
+    chemin = tmp_path / "notes_agences.csv"
+    chemin.write_text(
+        "Pays,Agence,Note,Date\n"
+        "FRA,S&P,AA-,2023-06-01\n"
+        "FRA,S&P,A+,\n"              # sans date : plus ancienne que toute action datée
+        "FRA,Moody,Aa2,\n"
+        "FRA,Moody,Aa3,\n"           # même date (inconnue) : la dernière ligne l'emporte
+        "FRA,Fitch,AA-,2023-04-28\n"
+        "FRA,Fitch,A+,2024-10-11\n"
+    )
+    return str(chemin)
+
+
+def test_derniere_action(fichier):
+    df_ag = sr._lire_notes_agences(fichier)
+    fra = df_ag.loc["FRA"]
+    assert [fra[a] for a in sr.agences] == ["Aa3", "A+", "AA-"]
+    assert pd.isna(fra["Moody_date"]) and fra["Fitch_date"] == pd.Timestamp("2024-10-11")
+    assert fra["Moyenne_agences_num"] == pytest.approx((4 + 5 + 4) / 3)
+
+    # tout l'univers, non noté si absent du fichier
+    assert "DEU" in df_ag.index and pd.isna(df_ag.loc["DEU", "Moyenne_agences_num"])
+
+
+def test_pays_non_couvert(fichier):
+    assert sr.notes_pays("FRA", fichier) == {"Moody": "Aa3", "Fitch": "A+", "S&P": "AA-"}
+    assert sr.dates_notes_pays("FRA", fichier) == {"Moody": None, "Fitch": "2024-10-11", "S&P": "2023-06-01"}
+    assert sr.notes_pays("DEU", fichier) == {a: "N/A" for a in sr.agences}
+    assert sr.dates_notes_pays("XXX", fichier) == {a: None for a in sr.agences}
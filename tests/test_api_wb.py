@@ -0,0 +1,95 @@
+"""
+Pagination de l'API Banque mondiale (_pages_wb) : nouvel essai sur erreur
+HTTP ou réponse illisible, échec franc plutôt qu'un indicateur tronqué,
+indicateur rejeté signalé sans nouvel essai.
+"""
+import pytest
+import requests
+
+import script_rating as sr
+
+
+class _Reponse:
+    def __init__(self, donnees=None, statut=200):
+        self.donnees, self.statut = donnees, statut
+
+    def raise_for_status(self):
+        if self.statut >= 400:
+            raise requests.HTTPError(f"HTTP {self.statut}")
+
+    def json(self):
+        if isinstance(self.donnees, Exception):
+            raise self.donnees
+        return self.donnees
+
+
+class _Session:
+    def __init__(self, reponses):
+        self.reponses, self.urls = list(reponses), []
+
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        return self.reponses.pop(0)
+
+
+def _page(page, pages, entrees):
+    return _Reponse([{"page": page, "pages": pages, "total": 2 * pages}, entrees])
+
+
+@pytest.fixture(autouse=True)
+def sans_attente(monkeypatch):
+    monkeypatch.setattr(sr, "wb_attente", 0.0)
+
+
+def _lire(session):
+    return [e for page in sr._pages_wb(session, "FRA;DEU", "NY.GDP.PCAP.CD", 2000, 2024) for e in page]
+
+
+def test_toutes_les_pages():
+    session = _Session([_page(1, 2, [{"v": 1}, {"v": 2}]), _page(2, 2, [{"v": 3}])])
+    assert _lire(session) == [{"v": 1}, {"v": 2}, {"v": 3}]
+    assert ["page=1&" in session.urls[0], "page=2&" in session.urls[1]] == [True, True]
+
+
+def test_nouvel_essai_apres_erreur():
+    session = _Session([
+        _page(1, 2, [{"v": 1}]),
+        _Reponse(statut=502),
+        _Reponse(requests.exceptions.JSONDecodeError("Expecting value", "<html>", 0)),
+        _Reponse("pas une liste"),
+        _page(2, 2, [{"v": 2}]),
+    ])
+    assert _lire(session) == [{"v": 1}, {"v": 2}]
+    assert len(session.urls) == 5
+
+
+def test_indicateur_rejete_sans_nouvel_essai():
+    message = [{"id": "120", "key": "Invalid value", "value": "The provided parameter value is not valid"}]
+    session = _Session([_Reponse([{"message": message}])] * sr.wb_tentatives)
+    with pytest.raises(ValueError, match="NY.GDP.PCAP.CD rejeté .*not valid"):
+        _lire(session)
+    assert len(session.urls) == 1
+
+
+def test_resultat_vide():
+    session = _Session([_Reponse([{"page": 1, "pages": 0, "total": 0}, None])])
+    assert _lire(session) == []
+
+
+def test_echec_persistant():
+    session = _Session([_page(1, 2, [{"v": 1}])] + [_Reponse(statut=500)] * sr.wb_tentatives)
+    with pytest.raises(RuntimeError, match="page 2"):
+        _lire(session)
+    assert len(session.urls) == 1 + sr.wb_tentatives
+
+
+def test_etape_non_publiee_apres_echec(tmp_path, monkeypatch):
+    monkeypatch.setattr(sr, "cache_dir", str(tmp_path))
+
+    def construire():
+        return _lire(_Session([_page(1, 2, [{"v": 1}])] + [_Reponse(statut=500)] * sr.wb_tentatives))
+
+    with pytest.raises(RuntimeError):
+        sr.stage("wb_test", ["echec"], construire)
+    assert list(tmp_path.iterdir()) == []
+    assert not any(c.startswith("wb_test-") for c in sr._cache_memoire)
@@ -0,0 +1,66 @@
+"""
+Cache des étapes : nettoyage de cache_dir et verrous par clé.
+"""
+import os
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import script_rating as sr
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(sr, "cache_dir", str(tmp_path))
+    monkeypatch.setattr(sr, "_cache_memoire", sr.OrderedDict())
+    return tmp_path
+
+
+def _snapshot(dossier, cle, age, taille=1000, ext=".pkl"):
+    chemin = dossier / (cle + ext)
+    chemin.write_bytes(b"x" * taille)
+    t = time.time() - age
+    os.utime(chemin, (t, t))
+    return chemin
+
+
+def test_nettoyage_par_age(cache):
+    _snapshot(cache, "vieux-1", age=30 * 86400)
+    _snapshot(cache, "publie-1", age=30 * 86400, ext=".arrow")
+    _snapshot(cache, "recent-1", age=60)
+    (cache / "vieux-1.lock").write_text("1")
+    _snapshot(cache, "abandon-1.arrow.42", age=2 * sr.cache_verrou_expiration, ext=".tmp")
+    _snapshot(cache, "en_cours-1.arrow.43", age=1, ext=".tmp")
+
+    assert sr.nettoyer_cache(["publie-1"], duree_max=7 * 86400) == ["vieux-1"]
+    assert sorted(os.listdir(cache)) == [
+        "en_cours-1.arrow.43.tmp", "publie-1.arrow", "recent-1.pkl", "vieux-1.lock"]
+
+
+def test_nettoyage_par_taille(cache):
+    for i in range(5):
+        _snapshot(cache, f"etape-{i}", age=100 * (5 - i))   # etape-0 la plus ancienne
+    sr._cache_memoire["etape-1"] = object()                 # servie par ce processus
+
+    retirees = sr.nettoyer_cache(["etape-0"], taille_max=3000, duree_max=86400)
+    assert retirees == ["etape-2", "etape-3"]
+    assert sorted(os.listdir(cache)) == ["etape-0.pkl", "etape-1.pkl", "etape-4.pkl"]
+
+
+def test_verrous_liberes(cache):
+    constructions = []
+
+    def construire():
+        constructions.append(1)
+        time.sleep(0.05)
+        return pd.DataFrame({"x": [1.0, 2.0]})
+
+    fils = [threading.Thread(target=sr.stage, args=("verrous", [1], construire)) for _ in range(8)]
+    for f in fils:
+        f.start()
+    for f in fils:
+        f.join()
+    assert len(constructions) == 1
+    assert not any(c.startswith("verrous-") for c in sr._cache_verrous_cles)
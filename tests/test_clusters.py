@@ -0,0 +1,50 @@
+"""
+Numérotation des groupes de risque (_clusters).
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import script_rating as sr
+
+
+@pytest.fixture
+def df_z():
+    rng = np.random.default_rng(4)
+    n = 300
+    df = pd.DataFrame({f + "_z": rng.normal(size=n) for f in sr.all_features})
+    for v in sr.variables_structurelles:
+        df[v] = rng.integers(0, 2, n)
+    df.insert(0, "Pays", [f"P{i % 30:02d}" for i in range(n)])
+    df.insert(1, "Annee", 2000 + np.arange(n) // 30)
+    df["Score_solvabilite"] = df[[f + "_z" for f in sr.all_features]].sum(axis=1)
+    df["Rating_modele"] = "BBB"
+    return df
+
+
+def _verifier(res, k):
+    centroides, membres = res["centroides"], res["membres"]
+    assert centroides["Cluster"].tolist() == list(range(1, k + 1))
+    moyens = centroides["Score_moyen"].dropna()
+    assert moyens.is_monotonic_decreasing
+    assert set(membres["Cluster"]) <= set(range(1, k + 1))
+    return centroides
+
+
+def test_numerotation(df_z):
+    _verifier(sr._clusters(df_z, 5), 5)
+
+
+def test_groupe_vide(df_z, monkeypatch):
+    # un groupe sans membre (possible avec MiniBatchKMeans) prend le dernier numéro
+    fit_predict = sr.MiniBatchKMeans.fit_predict
+
+    def avec_groupe_vide(self, X):
+        labels = fit_predict(self, X)
+        labels[labels == 2] = 1
+        return labels
+
+    monkeypatch.setattr(sr.MiniBatchKMeans, "fit_predict", avec_groupe_vide)
+    centroides = _verifier(sr._clusters(df_z, 5), 5)
+    assert np.isnan(centroides["Score_moyen"].iloc[-1])
+    assert centroides["Score_moyen"].iloc[:-1].notna().all()
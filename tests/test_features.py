@@ -0,0 +1,88 @@
+"""
+Mise à jour incrémentale des features (update_features, _mises_a_jour_brutes) :
+le résultat doit être identique à une reconstruction complète.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import script_rating as sr
+
+
+@pytest.fixture(scope="module")
+def brut():
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame([(f"P{i:02d}", a) for i in range(10) for a in range(2000, 2025)],
+                      columns=["Pays", "Annee"])
+    n = len(df)
+    echelle = np.repeat(10.0 ** rng.integers(0, 5, 10), 25)
+    df["Inflation"] = rng.normal(4, 3, n)
+    df["Croissance_PIB"] = rng.normal(2, 2, n)
+    df["Dette_publique_PIB"] = echelle * rng.uniform(0.3, 1.2, n)
+    df["PIB_par_habitant"] = echelle * rng.uniform(5, 50, n)
+    df["Reserves_change_$"] = echelle * rng.uniform(1, 10, n)
+    df["Importations_$"] = echelle * rng.uniform(1, 10, n)
+    for col in ["Inflation", "Croissance_PIB", "Dette_publique_PIB", "Importations_$"]:
+        df.loc[rng.random(n) < 0.1, col] = np.nan
+    return df
+
+
+def _differences(a, b):
+    return ~((a == b) | (a.isna() & b.isna()))
+
+
+@pytest.mark.parametrize("graine", range(6))
+def test_identique_a_build_features(brut, graine):
+    rng = np.random.default_rng(graine)
+    feat = sr.build_features(brut)
+
+    revise = brut.copy()
+    cols = ["Inflation", "Croissance_PIB", "Dette_publique_PIB", "PIB_par_habitant", "Importations_$"]
+    for _ in range(int(rng.integers(1, 4))):
+        i, col = int(rng.integers(len(revise))), cols[int(rng.integers(len(cols)))]
+        revise.loc[i, col] = rng.uniform(1, 2) * (abs(revise[col].mean()) + 1)
+
+    maj = sr._mises_a_jour_brutes(brut, revise)
+    assert maj is not None and len(maj)
+    _, incremental, impact = sr.update_features(brut, feat, maj)
+    complet = sr.build_features(revise)
+    pd.testing.assert_frame_equal(incremental, complet, check_exact=True)
+
+    # impact : exactement les cellules qui ont changé
+    change = _differences(feat, complet)
+    for col in change.columns:
+        attendu = change[col].to_numpy()
+        np.testing.assert_array_equal(impact.get(col, np.zeros(len(feat), dtype=bool)), attendu)
+
+
+def test_mises_a_jour_brutes(brut):
+    assert sr._mises_a_jour_brutes(brut, brut.copy()).empty
+
+    revise = brut.copy()
+    revise.loc[7, "Inflation"] = 99.0
+    maj = sr._mises_a_jour_brutes(brut, revise)
+    assert maj.values.tolist() == [[brut.at[7, "Pays"], brut.at[7, "Annee"], "Inflation", 99.0]]
+
+    # changements de structure : reconstruction complète
+    valeur_retiree = brut.copy()
+    valeur_retiree.loc[brut["Croissance_PIB"].first_valid_index(), "Croissance_PIB"] = np.nan
+    nouvelle_ligne = pd.concat([brut, brut.tail(1).assign(Annee=2025)], ignore_index=True)
+    for revise in [valeur_retiree, nouvelle_ligne, brut.drop(index=3),
+                   brut.assign(Solde_budgetaire_PIB=1.0), brut.drop(columns="Inflation")]:
+        assert sr._mises_a_jour_brutes(brut, revise) is None
+
+
+def test_nouvelle_derivee_sans_changement_des_donnees(brut, tmp_path, monkeypatch):
+    # les données brutes ne changent pas mais derived_features si : le panel
+    # précédent ne doit pas être réutilisé sous la nouvelle clé
+    monkeypatch.setattr(sr, "cache_dir", str(tmp_path))
+    monkeypatch.setattr(sr, "_cache_memoire", sr.OrderedDict())
+    monkeypatch.setattr(sr, "_incremental", {"features": None, "impact": None, "zscore": None})
+    monkeypatch.setattr(sr, "stage_ingestion", lambda: ("ingestion-test", brut))
+    cle_avant, _ = sr.stage_features()
+
+    monkeypatch.setitem(sr.derived_features, "Moyenne_Inflation_3a",
+                        {"deps": ["Inflation"], "calcul": "mean", "fenetre": 3, "min_periods": 1})
+    cle_apres, feat = sr.stage_features()
+    assert cle_apres != cle_avant
+    pd.testing.assert_frame_equal(feat, sr.build_features(brut), check_exact=True)
@@ -0,0 +1,104 @@
+"""
+Moteur des statistiques glissantes (_Groupes, _stat_glissante) comparé à
+pandas (groupby + rolling / expanding / ewm) sur un panel synthétique.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import script_rating as sr
+
+
+@pytest.fixture(scope="module")
+def panel():
+    # pays de longueurs différentes, échelles très différentes d'un pays à
+    # l'autre (comme PIB_total_$ et Inflation), valeurs manquantes
+    rng = np.random.default_rng(0)
+    lignes = []
+    for i in range(30):
+        n = int(rng.integers(1, 42))
+        echelle = 10.0 ** rng.integers(-2, 7)
+        x = echelle * (1 + 0.2 * rng.normal(size=n)) * np.linspace(1, 3, n)
+        x[rng.random(n) < 0.15] = np.nan
+        lignes += [(f"P{i:02d}", 2024 - n + 1 + k, v, echelle) for k, v in enumerate(x)]
+    df = pd.DataFrame(lignes, columns=["Pays", "Annee", "x", "echelle"])
+    return df.sort_values(["Pays", "Annee"]).reset_index(drop=True)
+
+
+def _calcul(df, spec):
+    return sr._stat_glissante(sr._Groupes(df), df["x"].to_numpy(dtype=float), spec)
+
+
+def _proche(res, ref, df):
+    # tolérance relative à l'échelle du pays, pas à la valeur (std, pente ~ 0)
+    assert np.array_equal(np.isnan(res), np.isnan(ref))
+    ecart = np.abs(res - ref) / df["echelle"].to_numpy()
+    assert np.nanmax(ecart, initial=0.0) < 1e-9
+
+
+def _pente(annees, x):
+    valide = ~np.isnan(x)
+    if valide.sum() < 2:
+        return np.nan
+    return np.polyfit(annees[valide], x[valide], 1)[0]
+
+
+@pytest.mark.parametrize("calcul", ["std", "mean"])
+@pytest.mark.parametrize("fenetre", [5, 10, None])
+def test_moments_comme_pandas(panel, calcul, fenetre):
+    spec = {"calcul": calcul, "fenetre": fenetre, "min_periods": 2}
+    g = panel.groupby("Pays")["x"]
+    if fenetre is None:
+        ref = g.transform(lambda s: getattr(s.expanding(min_periods=2), calcul)())
+    else:
+        ref = g.transform(lambda s: getattr(s.rolling(fenetre, min_periods=2), calcul)())
+    _proche(_calcul(panel, spec), ref.to_numpy(), panel)
+
+
+def test_zchange_comme_pandas(panel):
+    spec = sr.derived_features["Zchange_Croissance_PIB"]
+    d = panel.groupby("Pays")["x"].diff()
+    roulant = d.groupby(panel["Pays"]).rolling(spec["fenetre"], min_periods=spec["min_periods"])
+    m = roulant.mean().droplevel(0).sort_index()
+    sd = roulant.std().droplevel(0).sort_index()
+    ref = ((d - m) / sd.where(sd > 0)).to_numpy()
+    _proche(_calcul(panel, spec), ref, panel)
+
+
+def test_drawdown_comme_pandas(panel):
+    spec = sr.derived_features["Ecart_plus_haut_PIB_par_habitant"]
+    ref = panel["x"] - panel.groupby("Pays")["x"].cummax()
+    _proche(_calcul(panel, spec), ref.to_numpy(), panel)
+
+
+def test_ewma_comme_pandas(panel):
+    spec = sr.derived_features["Inflation_EWMA"]
+    ref = panel.groupby("Pays")["x"].transform(
+        lambda s: s.ewm(alpha=spec["alpha"], adjust=False, ignore_na=True).mean())
+    _proche(_calcul(panel, spec), ref.to_numpy(), panel)
+
+
+def test_pente_comme_moindres_carres(panel):
+    spec = sr.derived_features["Pente_Dette_publique_PIB_10a"]
+    fenetre, min_periods = spec["fenetre"], spec["min_periods"]
+    ref = np.full(len(panel), np.nan)
+    for _, groupe in panel.groupby("Pays"):
+        annees, x = groupe["Annee"].to_numpy(dtype=float), groupe["x"].to_numpy()
+        for k, i in enumerate(groupe.index):
+            lo = max(0, k - fenetre + 1)
+            if (~np.isnan(x[lo:k + 1])).sum() >= min_periods:
+                ref[i] = _pente(annees[lo:k + 1], x[lo:k + 1])
+    _proche(_calcul(panel, spec), ref, panel)
+
+
+@pytest.mark.parametrize("nom", list(sr.derived_features))
+def test_pays_isoles(panel, nom):
+    # modifier un pays ne change pas, même à l'arrondi près, les autres pays
+    spec = sr.derived_features[nom]
+    if spec["calcul"] == "ratio":
+        pytest.skip("calcul ligne à ligne")
+    modifie = panel.copy()
+    lignes = (modifie["Pays"] == "P03").to_numpy()
+    modifie.loc[lignes, "x"] *= 1 + 1e-9
+    avant, apres = _calcul(panel, spec), _calcul(modifie, spec)
+    np.testing.assert_array_equal(avant[~lignes], apres[~lignes])
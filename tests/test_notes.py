@@ -0,0 +1,71 @@
+"""
+Codage des notes (notes_en_num, num_en_notes, pct_en_notes) et matrices de
+transition.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import script_rating as sr
+
+
+def test_aller_retour_echelle():
+    crans = sr.notes_en_num(sr.echelle_notes)
+    np.testing.assert_array_equal(crans, np.arange(1, len(sr.echelle_notes) + 1))
+    assert list(sr.num_en_notes(crans)) == sr.echelle_notes
+
+    # Moody's : même cran que la note S&P/Fitch de même rang
+    moody = sr.notes_en_num(sr.echelle_moody)
+    assert list(sr.num_en_notes(moody)) == sr.echelle_notes[:len(sr.echelle_moody)]
+
+
+def test_aller_retour_rating_scale():
+    seuils = np.array([s for s, _ in sr.rating_scale])
+    notes = [n for _, n in sr.rating_scale]
+
+    # au seuil exact : la note du seuil ; juste en dessous : la note suivante
+    assert list(sr.pct_en_notes(seuils, sr.rating_scale)) == notes
+    assert list(sr.pct_en_notes(seuils - 1e-9, sr.rating_scale)) == notes[1:] + ["CCC-"]
+    assert list(sr.num_en_notes(sr.notes_en_num(notes))) == notes
+
+    # l'ordre des catégories suit l'échelle : percentile croissant ⇒ note non décroissante
+    pct = np.linspace(0, 1, 501)
+    notes_pct = sr.pct_en_notes(pct, sr.rating_scale)
+    assert pd.Series(notes_pct).is_monotonic_increasing
+
+
+def test_valeurs_manquantes_et_inconnues():
+    notes = pd.Series(["AA", None, np.nan, "ZZZ", "aa", "Baa2"], index=list("abcdef"), name="Note")
+    crans = sr.notes_en_num(notes)
+    assert crans.index.equals(notes.index) and crans.name == "Note"
+    np.testing.assert_array_equal(crans.to_numpy(), [3, np.nan, np.nan, np.nan, np.nan, 9])
+
+    # cran manquant → note manquante ; arrondi au cran le plus proche, borné à l'échelle
+    notes = sr.num_en_notes([np.nan, 3.4, 0, 40])
+    assert pd.isna(notes[0]) and list(notes[1:]) == ["AA", "AAA", "D"]
+
+    # percentile manquant : pas de seuil atteint, note plancher
+    assert list(sr.pct_en_notes([np.nan], sr.rating_scale)) == ["CCC-"]
+
+
+@pytest.mark.parametrize("horizon", [1, 2])
+def test_matrice_transition_stochastique(horizon):
+    rng = np.random.default_rng(5)
+    lignes = []
+    for p in range(40):
+        cran = int(rng.integers(1, 18))
+        for annee in range(2010, 2025):
+            cran = int(np.clip(cran + rng.integers(-1, 2), 1, 22))
+            note = sr.echelle_notes[cran - 1] if rng.random() > 0.05 else "inconnue"
+            lignes.append((f"P{p:02d}", annee, note))
+    df = pd.DataFrame(lignes, columns=["Pays", "Annee", "Rating_modele"])
+
+    comptes = sr.matrice_transition(df, horizon=horizon, normaliser=False)
+    mat = sr.matrice_transition(df, horizon=horizon)
+    assert list(mat.index) == list(mat.columns)
+    assert mat.index.isin(sr.echelle_notes).all()
+
+    avec_depart = comptes.sum(axis=1) > 0
+    np.testing.assert_allclose(mat[avec_depart].sum(axis=1), 1.0)
+    assert mat[~avec_depart].isna().all(axis=None)
+    assert comptes.to_numpy().sum() == len(sr._paires_transition(df, "Rating_modele", horizon))
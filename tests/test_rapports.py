@@ -0,0 +1,69 @@
+"""
+Génération en lot des fiches (generer_rapports) : une fiche en échec, même
+par la mort d'un processus du pool, n'empêche ni les autres ni l'index.
+"""
+import multiprocessing
+import os
+
+import pytest
+
+import rapports_pays as rp
+
+pytestmark = pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                                reason="les fonctions remplacées doivent être héritées par le pool")
+
+
+def _rien():
+    pass
+
+
+def _fiche(pays, dossier, pdf):
+    if pays == "XXX":
+        raise ValueError("Aucune notation pour XXX")
+    if pays == "ERR":
+        raise KeyError("Score_solvabilite")
+    chemin = os.path.join(dossier, f"{pays}.html")
+    with open(chemin, "w", encoding="utf-8") as f:
+        f.write(pays)
+    return chemin
+
+
+def _fiche_mortelle(pays, dossier, pdf):
+    os._exit(1)
+
+
+@pytest.fixture(autouse=True)
+def sans_donnees(monkeypatch):
+    monkeypatch.setattr(rp, "_precharger", _rien)
+
+
+def _index(dossier):
+    return (dossier / "index.html").read_text(encoding="utf-8")
+
+
+def test_erreurs_notees(tmp_path, monkeypatch):
+    monkeypatch.setattr(rp, "rapport_pays", _fiche)
+    chemins, erreurs = rp.generer_rapports(["FRA", "XXX", "ERR", "DEU"], str(tmp_path), processus=2)
+    assert sorted(chemins) == ["DEU", "FRA"]
+    assert erreurs == {"XXX": "Aucune notation pour XXX", "ERR": "KeyError : 'Score_solvabilite'"}
+    assert "FRA.html" in _index(tmp_path) and "ERR" not in _index(tmp_path)
+
+
+def test_pool_casse(tmp_path, monkeypatch):
+    monkeypatch.setattr(rp, "rapport_pays", _fiche_mortelle)
+    chemins, erreurs = rp.generer_rapports(["FRA", "DEU"], str(tmp_path), processus=1)
+    assert chemins == {}
+    assert sorted(erreurs) == ["DEU", "FRA"]
+    assert all(e.startswith("BrokenProcessPool") for e in erreurs.values())
+    assert "Fiches pays (0)" in _index(tmp_path)
+
+
+def test_index_ecrit_si_le_lot_est_interrompu(tmp_path, monkeypatch):
+    def interrompre(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(rp, "rapport_pays", _fiche)
+    monkeypatch.setattr(rp, "as_completed", interrompre)
+    with pytest.raises(KeyboardInterrupt):
+        rp.generer_rapports(["FRA"], str(tmp_path), processus=1)
+    assert "Fiches pays (0)" in _index(tmp_path)
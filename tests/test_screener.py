@@ -0,0 +1,101 @@
+"""
+Screener indexé (IndexScreener) comparé à un filtrage brut du panel.
+"""
+import operator
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import script_rating as sr
+
+ops = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+       "==": operator.eq, "!=": operator.ne}
+
+
+@pytest.fixture(scope="module")
+def panel():
+    # même forme que _panel_screener : trié par Annee puis Pays, note en cran,
+    # outlook texte, valeurs manquantes ; tous les pays n'ont pas toutes les années
+    rng = np.random.default_rng(0)
+    lignes = [(f"P{i:02d}", a) for i in range(40) for a in range(1990, 2025)
+              if a >= 1990 + i % 7]
+    df = pd.DataFrame(lignes, columns=["Pays", "Annee"])
+    n = len(df)
+    df["Dette_publique_PIB"] = np.round(rng.uniform(10, 150, n))   # valeurs répétées : cas ==
+    df["Inflation"] = rng.normal(4, 3, n)
+    df["Pente_Dette_publique_PIB_10a"] = rng.normal(0, 2, n)
+    df["Rating_cran"] = rng.integers(1, len(sr.rating_scale) + 1, n).astype(float)
+    df["Outlook"] = rng.choice(np.array(["Positive", "Stable", "Negative"], dtype=object), n)
+    for col in ["Dette_publique_PIB", "Inflation", "Rating_cran", "Outlook"]:
+        df.loc[rng.random(n) < 0.1, col] = np.nan
+    return df.sort_values(["Annee", "Pays"]).reset_index(drop=True)
+
+
+@pytest.fixture(scope="module")
+def index(panel):
+    idx = sr.IndexScreener()
+    idx.mettre_a_jour("synthetique", panel)
+    return idx
+
+
+def _force_brute(df, conditions, depuis, jusqua, mode):
+    d = df[df["Annee"].between(depuis, jusqua)]
+    if mode == "dernier":
+        d = d[d["Annee"] == d["Annee"].max()]
+    ok = pd.Series(True, index=d.index)
+    for col, op, seuil in conditions:
+        if col == "Rating_modele":
+            col, op, seuil = "Rating_cran", sr._inverse_notes[op], sr.notes_en_num([seuil])[0]
+        ok &= d[col].notna() & ops[op](d[col], seuil)
+    par_pays = ok.groupby(d["Pays"])
+    garde = par_pays.all() if mode == "all" else par_pays.any()
+    retenues = d[ok & d["Pays"].map(garde)]
+    return {p: (len(g), int(g["Annee"].max())) for p, g in retenues.groupby("Pays")}
+
+
+conditions_testees = [
+    [("Dette_publique_PIB", ">", 90)],
+    [("Dette_publique_PIB", "==", 100)],
+    [("Dette_publique_PIB", "!=", 100), ("Inflation", "<=", 2)],
+    [("Dette_publique_PIB", ">=", 60), ("Pente_Dette_publique_PIB_10a", ">", 0),
+     ("Rating_modele", ">=", "BBB-")],
+    [("Rating_modele", "<", "A"), ("Outlook", "==", "Negative")],
+    [("Outlook", "!=", "Stable"), ("Inflation", ">", 8)],
+    [("Pente_Dette_publique_PIB_10a", ">", -100)],
+    [("Inflation", "<", -100)],
+]
+
+
+@pytest.mark.parametrize("conditions", conditions_testees)
+@pytest.mark.parametrize("mode", ["any", "all", "dernier"])
+@pytest.mark.parametrize("depuis, jusqua", [(1990, 2024), (2010, 2015), (2024, 2024)])
+def test_comme_force_brute(panel, index, conditions, mode, depuis, jusqua):
+    res = index.filtrer(conditions, depuis, jusqua, mode)
+    attendu = _force_brute(panel, conditions, depuis, jusqua, mode)
+    obtenu = {r.Pays: (r.Nb_annees, r.Derniere_annee) for r in res.itertuples()}
+    assert obtenu == attendu
+
+    # valeurs affichées : celles de la dernière année retenue
+    ligne = panel.set_index(["Pays", "Annee"])
+    for r in res.itertuples():
+        for col in {c for c, _, _ in conditions} - {"Rating_modele", "Outlook"}:
+            assert getattr(r, col) == ligne.at[(r.Pays, r.Derniere_annee), col]
+
+
+def test_requete_texte(index):
+    texte = "Dette_publique_PIB >= 60 & Pente_Dette_publique_PIB_10a > 0 & Rating_modele >= BBB-"
+    liste = sr._conditions_texte(texte)
+    assert liste == conditions_testees[3]
+    pd.testing.assert_frame_equal(index.filtrer(liste, 2000), index.filtrer(conditions_testees[3], 2000))
+
+
+@pytest.mark.parametrize("conditions", [
+    [("Colonne_inconnue", ">", 1)],
+    [("Rating_modele", ">=", "ZZZ")],
+    [("Outlook", ">", "Stable")],
+    [("Inflation", ">", "beaucoup")],
+])
+def test_conditions_invalides(index, conditions):
+    with pytest.raises(ValueError):
+        index.filtrer(conditions)
@@ -0,0 +1,96 @@
+"""
+Service HTTP des notations (service_rating) : routes, ETag et bascule du
+snapshot par POST /refresh.
+"""
+import asyncio
+import json
+import threading
+
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+import service_rating as svc
+
+
+def _documents(note_fra="AA"):
+    return {
+        "FRA": {"Pays": "FRA", "Rating_modele": note_fra, "Score_solvabilite": 1.5},
+        "DEU": {"Pays": "DEU", "Rating_modele": "AAA", "Score_solvabilite": None},
+    }
+
+
+class TestServiceRating(AsyncHTTPTestCase):
+
+    def get_app(self):
+        self.constructions = 0
+        self.reprise = threading.Event()
+        self.reprise.set()
+
+        def construire():
+            self.constructions += 1
+            self.reprise.wait(5)
+            return svc.Snapshot(_documents(note_fra="A"))
+
+        self._construire = svc.construire_snapshot
+        svc.construire_snapshot = construire
+        return svc.ServiceRating(svc.Snapshot(_documents()))
+
+    def tearDown(self):
+        svc.construire_snapshot = self._construire
+        super().tearDown()
+
+    def _json(self, chemin):
+        reponse = self.fetch(chemin)
+        self.assertEqual(reponse.code, 200)
+        return json.loads(reponse.body)
+
+    def test_un_pays(self):
+        doc = self._json("/ratings/fra")
+        self.assertEqual(doc["Rating_modele"], "AA")
+
+    def test_pays_inconnu(self):
+        reponse = self.fetch("/ratings/XXX")
+        self.assertEqual(reponse.code, 404)
+        self.assertIn("XXX", json.loads(reponse.body)["erreur"])
+
+    def test_lot_ignore_les_codes_inconnus(self):
+        doc = self._json("/ratings?pays=deu,XXX,FRA")
+        self.assertEqual(list(doc), ["DEU", "FRA"])
+        self.assertEqual(doc["DEU"]["Rating_modele"], "AAA")
+        self.assertEqual(list(self._json("/ratings")), ["DEU", "FRA"])
+
+    def test_etag(self):
+        reponse = self.fetch("/ratings/FRA")
+        etag = reponse.headers["Etag"]
+        self.assertEqual(reponse.code, 200)
+
+        reponse = self.fetch("/ratings/FRA", headers={"If-None-Match": etag})
+        self.assertEqual(reponse.code, 304)
+        self.assertEqual(reponse.body, b"")
+
+        autre = self.fetch("/ratings/DEU", headers={"If-None-Match": etag})
+        self.assertEqual(autre.code, 200)
+
+    def test_refresh_bascule_le_snapshot(self):
+        etag = self.fetch("/ratings/FRA").headers["Etag"]
+        reponse = self.fetch("/refresh", method="POST", body="")
+        self.assertEqual(reponse.code, 200)
+        self.assertEqual(json.loads(reponse.body)["version"], self._app.snapshot.version)
+
+        self.assertEqual(self._json("/ratings/FRA")["Rating_modele"], "A")
+        # nouveau contenu : l'ancien ETag ne vaut plus
+        self.assertEqual(self.fetch("/ratings/FRA", headers={"If-None-Match": etag}).code, 200)
+        self.assertEqual(self.constructions, 1)
+
+    @gen_test
+    async def test_refresh_concurrents_une_reconstruction(self):
+        self.reprise.clear()
+        requetes = [self.http_client.fetch(self.get_url("/refresh"), method="POST", body="")
+                    for _ in range(2)]
+        asyncio.get_running_loop().call_later(0.2, self.reprise.set)
+        reponses = await asyncio.gather(*requetes)
+
+        self.assertEqual([r.code for r in reponses], [200, 200])
+        self.assertEqual(self.constructions, 1)
+        self.assertEqual({json.loads(r.body)["version"] for r in reponses}, {self._app.snapshot.version})
+        self.assertIsNone(self._app._refresh_en_cours)
+        self.assertEqual(json.loads(self._app.snapshot.pays["FRA"][0])["Rating_modele"], "A")
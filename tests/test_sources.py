@@ -0,0 +1,87 @@
+"""
+Sources surveillées : une étape construite sous l'empreinte publiée lit la
+copie figée de cette version, même si le fichier a changé depuis.
+"""
+import os
+
+import pytest
+from watchdog.events import (FileClosedEvent, FileClosedNoWriteEvent, FileModifiedEvent,
+                             FileMovedEvent, FileOpenedEvent)
+
+import script_rating as sr
+
+
+def _ecrire(chemin, note_usa):
+    chemin.write_text(
+        "Pays,Agence,Note,Date\n"
+        f"USA,Moody,{note_usa},2024-12-31\n"
+        "USA,Fitch,AA+,2024-12-31\n"
+        "FRA,S&P,AA-,2024-12-31\n"
+    )
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.setattr(sr, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(sr, "_cache_memoire", sr.OrderedDict())
+    monkeypatch.setattr(sr, "_empreintes_publiees", {})
+    chemin = tmp_path / "notes_agences.csv"
+    _ecrire(chemin, "Aa1")
+    monkeypatch.setattr(sr, "_etapes_sources",
+                        lambda: {str(chemin): (lambda: sr.notes_agences(str(chemin)), False)})
+    sr._empreintes_publiees[str(chemin)] = sr._figer_source(str(chemin))
+    return chemin
+
+
+def _note(chemin):
+    return sr.notes_agences(str(chemin)).loc["USA", "Moody"]
+
+
+def _oublier_snapshots():
+    sr._cache_memoire.clear()
+    for f in os.listdir(sr.cache_dir):
+        if f.endswith((".arrow", ".pkl")):
+            os.remove(os.path.join(sr.cache_dir, f))
+
+
+def test_version_publiee_lue_depuis_la_copie_figee(source):
+    assert _note(source) == "Aa1"
+    publiee = sr._empreintes_publiees[str(source)]
+
+    # fichier remplacé, reconstruction pas encore faite, snapshot absent
+    _ecrire(source, "Aa2")
+    _oublier_snapshots()
+    assert _note(source) == "Aa1"
+    assert sr.source_figee(str(source)) == (publiee, sr._chemin_fige(str(source), publiee))
+
+    nouvelle = sr.rafraichir_source(str(source))
+    assert nouvelle != publiee
+    assert _note(source) == "Aa2"
+
+
+def test_copies_figees_retirees(source):
+    empreintes = [sr._empreintes_publiees[str(source)]]
+    for note in ["Aa2", "Aa3"]:
+        _ecrire(source, note)
+        empreintes.append(sr.rafraichir_source(str(source)))
+    assert sr.rafraichir_source(str(source)) is None      # contenu inchangé
+
+    # seules la version publiée et la précédente sont conservées
+    presentes = [os.path.exists(sr._chemin_fige(str(source), e)) for e in empreintes]
+    assert presentes == [False, True, True]
+
+
+def test_lecture_sans_reconstruction(tmp_path, monkeypatch):
+    chemin = str(tmp_path / "data.csv")
+    gestionnaire = sr._GestionnaireSources({chemin: None})
+    planifies = []
+    monkeypatch.setattr(gestionnaire, "_planifier", planifies.append)
+
+    for evenement in [FileOpenedEvent(chemin), FileClosedNoWriteEvent(chemin)]:
+        gestionnaire.dispatch(evenement)
+    assert planifies == []
+
+    gestionnaire.dispatch(FileModifiedEvent(chemin))
+    gestionnaire.dispatch(FileMovedEvent(chemin + ".tmp", chemin))
+    gestionnaire.dispatch(FileClosedEvent(chemin))
+    assert planifies == [chemin, chemin]
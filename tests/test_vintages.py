@@ -0,0 +1,138 @@
+"""
+Vintages des données notées : reconstruction des deltas et cellules
+signalées comme modifiées après une révision d'une seule donnée source.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import script_rating as sr
+
+
+@pytest.fixture
+def vintages(tmp_path, monkeypatch):
+    """
+    Vintages écrits dans tmp_path ; `publier(df)` enregistre df comme
+    résultat de historique_notes_modele et renvoie l'id du vintage courant.
+    """
+    monkeypatch.setattr(sr, "vintages_dir", str(tmp_path))
+    monkeypatch.setattr(sr, "vintage_complet_tous", 3)
+    sr.charger_vintage.cache_clear()
+    courant = {}
+    monkeypatch.setattr(sr, "historique_notes_modele", lambda: courant["df"])
+
+    def publier(df):
+        courant["df"] = df
+        return sr.enregistrer_vintage()
+
+    yield publier
+    sr.charger_vintage.cache_clear()
+
+
+def _notes(n, rng):
+    return rng.choice(np.array(sr.echelle_notes, dtype=object), n)
+
+
+@pytest.fixture
+def donnees():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame([(f"P{i:02d}", a) for i in range(12) for a in range(2015, 2025)],
+                      columns=["Pays", "Annee"])
+    df["Dette_publique_PIB"] = rng.uniform(10, 150, len(df))
+    df["Inflation"] = rng.normal(4, 3, len(df))
+    df.loc[rng.random(len(df)) < 0.1, "Inflation"] = np.nan
+    df["Score_solvabilite"] = rng.normal(0, 1, len(df))
+    df["Rating_modele"] = _notes(len(df), rng)
+    return df
+
+
+def test_aller_retour_des_deltas(vintages, donnees):
+    rng = np.random.default_rng(1)
+    versions = [donnees]
+
+    d = donnees.copy()
+    d.loc[5, "Dette_publique_PIB"] += 1.0                       # une cellule
+    versions.append(d)
+
+    d = d.copy()
+    d.loc[d["Inflation"].isna().idxmax(), "Inflation"] = 2.5    # NaN → valeur
+    d.loc[8, "Inflation"] = np.nan                              # valeur → NaN
+    d.loc[12, "Rating_modele"] = "AAA"
+    versions.append(d)
+
+    d = d[d["Pays"] != "P03"].copy()                            # lignes supprimées
+    d = pd.concat([d, d[d["Pays"] == "P00"].assign(Pays="P99")], ignore_index=True)
+    versions.append(d)
+
+    d = d.assign(Solde_budgetaire_PIB=rng.normal(-3, 2, len(d)))  # nouvelle colonne
+    versions.append(d)
+
+    d = d.assign(Score_solvabilite=d["Score_solvabilite"] * 1.01)
+    versions.append(d)
+
+    ids = [vintages(v) for v in versions]
+    assert len(set(ids)) == len(versions)
+    assert vintages(versions[-1]) == ids[-1]        # données inchangées : pas de vintage
+
+    liste = sr.lister_vintages()
+    assert list(liste["id"]) == ids
+    assert list(liste["type"]) == ["complet", "delta", "delta", "complet", "delta", "delta"]
+
+    sr.charger_vintage.cache_clear()
+    for vid, v in zip(ids, versions):
+        attendu = sr._table_vintage(v)
+        obtenu = sr.charger_vintage(vid)
+        pd.testing.assert_frame_equal(obtenu[attendu.columns], attendu, check_index_type=False)
+        assert sorted(obtenu.columns) == sorted(attendu.columns)
+
+    diff = sr.diff_vintages(ids[0], ids[1])
+    assert diff[["Pays", "Annee", "Variable"]].values.tolist() == [["P00", 2020, "Dette_publique_PIB"]]
+    assert diff["Ecart"].iloc[0] == pytest.approx(1.0)
+
+
+def test_bruit_d_arrondi_ignore(vintages, donnees):
+    avant = vintages(donnees)
+    bruite = donnees.assign(Score_solvabilite=donnees["Score_solvabilite"] * (1 + 1e-13))
+    apres = vintages(bruite)
+    assert apres != avant                           # l'empreinte exacte a changé
+    assert sr.diff_vintages(avant, apres).empty
+    assert sr.lister_vintages()["cellules"].iloc[-1] == 0
+
+
+def _panel_brut():
+    rng = np.random.default_rng(2)
+    df = pd.DataFrame([(f"P{i:02d}", a) for i in range(8) for a in range(2000, 2025)],
+                      columns=["Pays", "Annee"])
+    n = len(df)
+    echelle = np.repeat(10.0 ** rng.integers(0, 4, 8), 25)
+    df["Inflation"] = rng.normal(4, 3, n)
+    df["Croissance_PIB"] = rng.normal(2, 2, n)
+    df["Dette_publique_PIB"] = echelle * rng.uniform(0.3, 1.2, n)
+    df["PIB_par_habitant"] = echelle * rng.uniform(5, 50, n)
+    df["Reserves_change_$"] = echelle * rng.uniform(1, 10, n)
+    df["Importations_$"] = echelle * rng.uniform(1, 10, n)
+    # trous ailleurs que dans la série révisée (l'interpolation ne bouge pas)
+    df.loc[(rng.random(n) < 0.1) & (df["Pays"] != "P02"), "Croissance_PIB"] = np.nan
+    return df
+
+
+def test_revision_d_une_cellule_source(vintages):
+    brut = _panel_brut()
+    notes = {"Rating_modele": "BBB"}
+    avant = vintages(sr.build_features(brut).assign(**notes))
+
+    revise = brut.copy()
+    revise.loc[(revise["Pays"] == "P02") & (revise["Annee"] == 2015), "Inflation"] += 3.0
+    apres = vintages(sr.build_features(revise).assign(**notes))
+
+    diff = sr.diff_vintages(avant, apres)
+    obtenu = set(map(tuple, diff[["Pays", "Annee", "Variable"]].values.tolist()))
+    fenetre = sr.derived_features["Volatilite_Inflation"]["fenetre"]
+    attendu = (
+        {("P02", 2015, "Inflation")}
+        # écart-type glissant : fenêtres qui contiennent 2015
+        | {("P02", a, "Volatilite_Inflation") for a in range(2015, 2015 + fenetre)}
+        # moyenne exponentielle : toutes les années suivantes
+        | {("P02", a, "Inflation_EWMA") for a in range(2015, 2025)}
+    )
+    assert obtenu == attendu